@@ -0,0 +1,142 @@
+"""Асинхронное чтение горячих маршрутов под ASGI (настройка ASYNC_VIEWS).
+
+Синхронную вьюху сервер ASGI выполняет в потоке, и поток занят все время
+запроса. Здесь GET list/retrieve рецептов и справочников обслуживаются
+в цикле событий: токен, отметки, кэш и запросы к БД идут через
+асинхронные API Django, а ответ строят те же сериализаторы и пагинация
+DRF по уже загруженным объектам, без обращений к БД.
+
+Если асинхронный обработчик возвращает None (запись, неподдерживаемые
+параметры, ошибки, которые должен сформулировать DRF, браузерный API),
+запрос выполняет обычный вьюсет DRF в потоке.
+
+Потоковые ответы действий streaming_actions строят синхронные вьюхи, а
+отдаются они асинхронным итератором (async_streaming).
+"""
+
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+renderer = JSONRenderer()
+
+
+def wants_json(request):
+    """Браузерный API и ?format= остаются синхронному DRF."""
+    return "format" not in request.GET and "text/html" not in request.headers.get(
+        "Accept", ""
+    )
+
+
+def json_response(data):
+    return HttpResponse(renderer.render(data), content_type=renderer.media_type)
+
+
+async def authenticate(request):
+    """Пользователь по токену (как TokenAuthentication) или None.
+
+    None - заголовок не разобрать или токен неверен: ошибку 401 вернет DRF.
+    """
+    header = request.headers.get("Authorization", "").split()
+    if not header:
+        return AnonymousUser()
+    if len(header) != 2 or header[0].lower() != "token":
+        return None
+    token = await Token.objects.select_related("user").filter(key=header[1]).afirst()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+async def drf_request(request):
+    """Request DRF с уже определенным пользователем или None."""
+    user = await authenticate(request)
+    if user is None:
+        return None
+    request.user = user
+    drf = Request(request)
+    drf.user = user
+    return drf
+
+
+class PreloadedPage:
+    """Загруженная страница вместо queryset для пагинатора Django.
+
+    Длина - число всех строк, а срез - уже загруженные объекты страницы.
+    """
+
+    def __init__(self, objects, count):
+        self.objects = objects
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.objects
+
+
+def async_streaming(response):
+    """Синхронный поток ответа отдаем асинхронным итератором.
+
+    Синхронный поток обработчик ASGI Django сначала собирает в память
+    целиком. Здесь фрагменты берутся по одному в потоке вьюхи
+    (thread_sensitive), где открыт курсор БД.
+    """
+    if not response.streaming or response.is_async:
+        return response
+    chunks = iter(response.streaming_content)
+    next_chunk = sync_to_async(next)
+
+    async def content():
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+
+    response.streaming_content = content()
+    return response
+
+
+def async_read_view(view, handlers):
+    """Вьюха с асинхронными обработчиками методов и запасным синхронным."""
+    sync_view = sync_to_async(view)
+
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        handler = handlers.get(request.method.lower())
+        if handler is not None and wants_json(request):
+            response = await handler(request, *args, **kwargs)
+            if response is not None:
+                return response
+        return async_streaming(await sync_view(request, *args, **kwargs))
+
+    return async_view
+
+
+class AsyncReadMixin:
+    """Асинхронные обработчики вьюсета: classmethod async_<действие>.
+
+    Действия streaming_actions обработчиков не имеют: асинхронным у них
+    становится только поток ответа. Подключаются только при ASYNC_VIEWS,
+    иначе вьюсет не меняется.
+    """
+
+    streaming_actions = ()
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        handlers = {
+            method: getattr(cls, f"async_{action}")
+            for method, action in actions.items()
+            if hasattr(cls, f"async_{action}")
+        }
+        streaming = not set(actions.values()).isdisjoint(cls.streaming_actions)
+        if not settings.ASYNC_VIEWS or not (handlers or streaming):
+            return view
+        return async_read_view(view, handlers)
@@ -0,0 +1,83 @@
+import hashlib
+
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.async_views import authenticate, json_response
+from constants import CATALOG_CACHE_TIMEOUT
+from recipes.catalog import aget_catalog_version, cache_is_shared, get_catalog_version
+
+
+def catalog_etag(model, version, path):
+    digest = hashlib.blake2b(path.encode(), digest_size=8).hexdigest()
+    return f'"{model._meta.model_name}-{version}-{digest}"'
+
+
+class CatalogCacheMixin:
+    """Условный GET (ETag) и кэш ответов для справочников.
+
+    ETag и ключ кэша строятся из версии справочника и адреса запроса,
+    поэтому при изменении справочника они меняются сами собой. Версия
+    общая для воркеров только в общем кэше: с кэшем процесса ответы не
+    кэшируются.
+    """
+
+    def get_etag(self, request):
+        model = self.get_queryset().model
+        return catalog_etag(model, get_catalog_version(model), request.get_full_path())
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not cache_is_shared():
+            return handler(request, *args, **kwargs)
+        etag = self.get_etag(request)
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = f"catalog_response:{etag}"
+            data = cache.get(key)
+            if data is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(key, response.data, CATALOG_CACHE_TIMEOUT)
+            else:
+                response = Response(data)
+        response["ETag"] = etag
+        # Клиент и прокси хранят ответ, но сверяют ETag при каждом запросе.
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    @classmethod
+    async def async_cached_response(cls, request, *args, **kwargs):
+        """Асинхронно: 304 или ответ из кэша, промах кэша - синхронно."""
+        if not cache_is_shared():
+            return None
+        # Неверный токен отклоняет DRF (401), как и для синхронного пути.
+        if await authenticate(request) is None:
+            return None
+        model = cls.queryset.model
+        etag = catalog_etag(
+            model, await aget_catalog_version(model), request.get_full_path()
+        )
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            data = await cache.aget(f"catalog_response:{etag}")
+            if data is None:
+                return None
+            response = json_response(data)
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+    async_list = async_retrieve = async_cached_response
@@ -0,0 +1,117 @@
+"""Поля сериализаторов для картинок."""
+
+import base64
+import binascii
+import uuid
+import warnings
+from tempfile import SpooledTemporaryFile
+
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+from constants import (
+    BASE64_CHUNK_SIZE,
+    IMAGE_SPOOL_MAX_MEMORY,
+    IMAGE_UPLOAD_MAX_BYTES,
+    IMAGE_UPLOAD_MAX_PIXELS,
+)
+from recipes.images import absolute_url
+
+
+class ImageSizesField(serializers.ReadOnlyField):
+    """Ссылки на превью картинки: {размер: {формат: url}}.
+
+    Пока превью не построены, отдается пустой объект, и клиент
+    показывает оригинал.
+    """
+
+    def to_representation(self, derivatives):
+        return {
+            size: {
+                fmt: absolute_url(self.context, path) for fmt, path in formats.items()
+            }
+            for size, formats in derivatives.items()
+        }
+
+
+class StreamingImageField(serializers.ImageField):
+    """Картинка строкой base64 (data URI) или файлом multipart/form-data.
+
+    base64 декодируется порциями во временный файл: в памяти он держится
+    до IMAGE_SPOOL_MAX_MEMORY, дальше уходит на диск. Переносы строк и
+    пробелы в base64 допускаются. Размер проверяется по ходу
+    декодирования, формат и число пикселей - по заголовку, без
+    распаковки всей картинки (защита от «декомпрессионных бомб»).
+    """
+
+    # Формат Pillow -> расширение сохраняемого файла.
+    FORMATS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}
+
+    default_error_messages = {
+        "invalid_base64": "Картинка должна быть строкой base64 или файлом.",
+        "invalid_image": "Загрузите корректную картинку (JPEG, PNG, GIF, WebP).",
+        "too_large": "Картинка больше {max_bytes} байт.",
+        "too_many_pixels": "Картинка больше {max_pixels} пикселей.",
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = self.decode(data)
+        elif not isinstance(data, UploadedFile):
+            self.fail("invalid_base64")
+        if data.size > IMAGE_UPLOAD_MAX_BYTES:
+            self.fail("too_large", max_bytes=IMAGE_UPLOAD_MAX_BYTES)
+        data.name = f"{uuid.uuid4()}.{self.check_header(data)}"
+        # Проверку ImageField (полная распаковка Pillow) пропускаем.
+        return serializers.FileField.to_internal_value(self, data)
+
+    def decode(self, data):
+        # Срезы по порциям, чтобы не копировать всю строку целиком.
+        start = data.find(";base64,")
+        start = 0 if start == -1 else start + len(";base64,")
+        file = SpooledTemporaryFile(max_size=IMAGE_SPOOL_MAX_MEMORY)
+        # Без пробелов порция может не делиться на 4 символа: остаток
+        # декодируем вместе со следующей.
+        rest = ""
+        try:
+            for position in range(start, len(data), BASE64_CHUNK_SIZE):
+                chunk = rest + "".join(
+                    data[position : position + BASE64_CHUNK_SIZE].split()
+                )
+                end = len(chunk) - len(chunk) % 4
+                file.write(base64.b64decode(chunk[:end], validate=True))
+                rest = chunk[end:]
+                if file.tell() > IMAGE_UPLOAD_MAX_BYTES:
+                    file.close()
+                    self.fail("too_large", max_bytes=IMAGE_UPLOAD_MAX_BYTES)
+            file.write(base64.b64decode(rest, validate=True))
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail("invalid_base64")
+        size = file.tell()
+        file.seek(0)
+        return UploadedFile(file, name="image", size=size)
+
+    def check_header(self, file):
+        """Формат и размер в пикселях по заголовку, расширение файла."""
+        file.seek(0)
+        try:
+            # Предупреждение Pillow о числе пикселей заменяем своей проверкой.
+            with (
+                warnings.catch_warnings(
+                    action="ignore", category=Image.DecompressionBombWarning
+                ),
+                Image.open(file) as image,
+            ):
+                extension = self.FORMATS.get(image.format)
+                pixels = image.width * image.height
+        except (OSError, Image.DecompressionBombError):
+            self.fail("invalid_image")
+        finally:
+            file.seek(0)
+        if extension is None:
+            self.fail("invalid_image")
+        if pixels > IMAGE_UPLOAD_MAX_PIXELS:
+            self.fail("too_many_pixels", max_pixels=IMAGE_UPLOAD_MAX_PIXELS)
+        return extension
@@ -1,11 +1,26 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import (
     BooleanFilter,
     CharFilter,
     FilterSet,
     ModelMultipleChoiceFilter,
+    OrderingFilter,
 )
 
-from recipes.models import Ingredient, Recipe, Tag
+from api.marks import amarked_ids, marked_ids
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag, User
+from recipes.search import search_recipes
+
+
+def with_tags(recipes, tags):
+    """Рецепты хотя бы с одним из тегов.
+
+    EXISTS вместо JOIN по тегам: строки не размножаются, и DISTINCT
+    по всем полям рецепта (с сортировкой для COUNT) не нужен.
+    """
+    return recipes.filter(
+        Exists(Recipe.tags.through.objects.filter(recipe=OuterRef("pk"), tag__in=tags))
+    )
 
 
 class IngredientFilter(FilterSet):
@@ -15,9 +30,7 @@ class IngredientFilter(FilterSet):
 
     class Meta:
         model = Ingredient
-        fields = [
-            "name",
-        ]
+        fields = ["name"]
 
 
 class RecipeFilter(FilterSet):
@@ -27,6 +40,7 @@ class RecipeFilter(FilterSet):
         field_name="tags__slug",
         to_field_name="slug",
         queryset=Tag.objects.all(),
+        method="filter_tags",
     )
     is_favorited = BooleanFilter(
         field_name="favorites__user", method="filter_is_favorited"
@@ -34,17 +48,64 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = BooleanFilter(
         field_name="shoppingcarts__user", method="filter_is_in_shopping_cart"
     )
+    # ?search=... - полнотекстовый поиск, по умолчанию по релевантности.
+    search = CharFilter(method="filter_search")
+    # ?ordering=-popularity - сначала популярные (по счетчику избранного).
+    ordering = OrderingFilter(
+        fields=(("favorites_count", "popularity"), ("pub_date", "pub_date"))
+    )
 
-    def filter_is_favorited(self, recipes, name, value):
+    def filter_mark(self, recipes, value, model):
         if value and self.request.user.is_authenticated:
-            return recipes.filter(favorites__user=self.request.user)
+            return recipes.filter(id__in=marked_ids(self.request, model))
         return recipes
 
+    def filter_tags(self, recipes, name, tags):
+        # Без ?tags поле отдает пустой queryset, а не пустое значение.
+        return with_tags(recipes, tags) if tags else recipes
+
+    def filter_search(self, recipes, name, value):
+        return search_recipes(recipes, value) if value.strip() else recipes
+
+    def filter_is_favorited(self, recipes, name, value):
+        return self.filter_mark(recipes, value, Favorite)
+
     def filter_is_in_shopping_cart(self, recipes, name, value):
-        if value and self.request.user.is_authenticated:
-            return recipes.filter(shoppingcarts__user=self.request.user)
-        return recipes
+        return self.filter_mark(recipes, value, ShoppingCart)
 
     class Meta:
         model = Recipe
-        fields = ["author", "tags", "is_favorited", "is_in_shopping_cart"]
+        fields = ["author", "tags", "is_favorited", "is_in_shopping_cart", "search"]
+
+
+# Параметры списка рецептов, которые умеет afilter_recipes: с другими
+# (поиск, сортировка, курсор) список строит синхронный RecipeViewSet.
+ASYNC_RECIPE_PARAMS = frozenset(
+    ("page", "limit", "tags", "author", "is_favorited", "is_in_shopping_cart")
+)
+MARK_FILTERS = (("is_favorited", Favorite), ("is_in_shopping_cart", ShoppingCart))
+
+
+async def afilter_recipes(request, recipes):
+    """Асинхронный RecipeFilter для параметров из ASYNC_RECIPE_PARAMS.
+
+    None - значения, которые отклонит с ошибкой RecipeFilter.
+    """
+    params = request.query_params
+    if slugs := params.getlist("tags"):
+        tags = Tag.objects.filter(slug__in=slugs).values_list("pk", flat=True)
+        tags = [pk async for pk in tags]
+        if len(tags) != len(set(slugs)):
+            return None
+        recipes = with_tags(recipes, tags)
+    if author := params.get("author"):
+        if not author.isdigit() or not await User.objects.filter(pk=author).aexists():
+            return None
+        recipes = recipes.filter(author_id=author)
+    for name, model in MARK_FILTERS:
+        # Значение разбираем полем фильтра, как RecipeFilter.
+        field = RecipeFilter.base_filters[name].field
+        value = field.clean(field.widget.value_from_datadict(params, None, name))
+        if value and request.user.is_authenticated:
+            recipes = recipes.filter(id__in=await amarked_ids(request, model))
+    return recipes
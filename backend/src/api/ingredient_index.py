@@ -0,0 +1,120 @@
+"""Индекс продуктов в памяти процесса для автодополнения."""
+
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from constants import MATCH_LOCAL_TIMEOUT
+from recipes.catalog import cache_is_shared, get_catalog_version, normalize
+from recipes.models import Ingredient
+
+# Опечатки ищем только для запросов не короче этой длины.
+FUZZY_MIN_LENGTH = 3
+
+
+def within_one_edit(first, second):
+    """Расстояние Левенштейна между строками не больше 1."""
+    if first == second:
+        return True
+    if abs(len(first) - len(second)) > 1:
+        return False
+    if len(first) > len(second):
+        first, second = second, first
+    for index, (left, right) in enumerate(zip(first, second, strict=False)):
+        if left != right:
+            if len(first) == len(second):
+                # Замена символа.
+                return first[index + 1 :] == second[index + 1 :]
+            # Вставка символа.
+            return first[index:] == second[index + 1 :]
+    return True
+
+
+class IngredientIndex:
+    """Отсортированный массив ключей продуктов.
+
+    Поиск по префиксу - бинарный поиск по отсортированным ключам
+    (то же, что обход префиксного дерева, но компактнее в памяти).
+    Выдача ранжируется: совпадения по началу названия, затем по подстроке,
+    затем (если по началу ничего нет) названия с одной опечаткой в запросе.
+    Индекс перестраивается, когда меняется версия справочника продуктов,
+    а без общего кэша (версия своя у каждого процесса) - еще и не реже
+    чем раз в MATCH_LOCAL_TIMEOUT секунд. Версия, ключи, продукты и время
+    загрузки публикуются одним кортежем (state), поэтому поток не увидит
+    ключи одной версии с продуктами другой.
+    """
+
+    def __init__(self):
+        self.state = (None, (), (), 0.0)
+        self.lock = threading.Lock()
+
+    def load(self, version):
+        ingredients = sorted(
+            (
+                (normalize(name), {"id": pk, "name": name, "measurement_unit": unit})
+                for pk, name, unit in Ingredient.objects.values_list(
+                    "id", "name", "measurement_unit"
+                )
+            ),
+            key=lambda entry: (entry[0], entry[1]["id"]),
+        )
+        self.state = (
+            version,
+            tuple(key for key, _ in ingredients),
+            tuple(item for _, item in ingredients),
+            time.monotonic(),
+        )
+
+    def outdated(self, version):
+        """Справочник изменился или (без общего кэша) индекс устарел."""
+        loaded, _, _, built = self.state
+        return version != loaded or (
+            not cache_is_shared() and time.monotonic() - built > MATCH_LOCAL_TIMEOUT
+        )
+
+    def refresh(self):
+        """Загружаем индекс, если справочник изменился; возвращаем state."""
+        version = get_catalog_version(Ingredient)
+        if self.outdated(version):
+            with self.lock:
+                if self.outdated(version):
+                    self.load(version)
+        return self.state
+
+    def search(self, query, limit=None):
+        # Снимок на случай перестройки индекса в другом потоке.
+        _, keys, items, _ = self.refresh()
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        query = normalize(query)
+        if not query:
+            return list(items[:limit])
+        found = []
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        found.extend(range(start, min(end, start + limit)))
+        if len(found) < limit:
+            found.extend(
+                position
+                for position, key in enumerate(keys)
+                if query in key and not start <= position < end
+            )
+        # Опечатку предполагаем, только если ничего не нашлось по началу.
+        if start == end and len(found) < limit and len(query) >= FUZZY_MIN_LENGTH:
+            seen = set(found)
+            found.extend(
+                position
+                for position, key in enumerate(keys)
+                if position not in seen
+                and any(
+                    within_one_edit(query, key[:length])
+                    for length in (len(query) - 1, len(query), len(query) + 1)
+                )
+            )
+        return [items[position] for position in found[:limit]]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,344 @@
+"""Замеры запросов: запросы к БД, их время, сериализация и N+1.
+
+Включается долей выборки INSTRUMENTATION_SAMPLE_RATE (0 - выключено:
+middleware сразу передает запрос дальше). Для попавших в выборку запросов:
+
+- заголовок Server-Timing (db, serialize, total); время сериализации
+  засекают сериализаторы с TimedSerializerMixin;
+- счетчики по view в общем кэше, их отдает /metrics в формате Prometheus
+  (с кэшем в памяти процесса каждый воркер отдает только свои счетчики);
+- предупреждение в лог о медленных запросах, запросах с большим числом
+  обращений к БД и с повторами одного запроса (N+1), со стеками мест
+  в коде проекта, откуда выполнялись повторы и медленные запросы.
+
+Кроме того, /metrics отдает состояние пула соединений с БД (DB_POOL).
+Без METRICS_TOKEN в настройках /metrics не отдается (404).
+
+Запросы к БД во время отдачи потокового ответа (StreamingHttpResponse)
+выполняются после middleware и не учитываются.
+"""
+
+import logging
+import os
+import random
+import re
+import secrets
+import time
+import traceback
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+from constants import (
+    DUPLICATE_QUERY_THRESHOLD,
+    METRICS_PREFIX,
+    SLOW_QUERY_MS,
+    STACK_SAMPLE_DEPTH,
+)
+
+logger = logging.getLogger(__name__)
+
+current_recorder = ContextVar("current_recorder", default=None)
+
+METRICS_KEY = "metrics"
+# Счетчики времени храним в микросекундах: incr в кэше только целый.
+MICROSECONDS = 1_000_000
+IN_LIST = re.compile(r"\((?:%s, )*%s\)")
+# Текущие значения из статистики пула psycopg, остальное - счетчики.
+POOL_GAUGES = frozenset(
+    ("pool_min", "pool_max", "pool_size", "pool_available", "requests_waiting")
+)
+
+
+def fingerprint(sql):
+    """Отпечаток запроса: списки IN разной длины считаем одним запросом."""
+    return IN_LIST.sub("(...)", sql)
+
+
+def stack_sample():
+    """Последние кадры стека из кода проекта (без Django и библиотек)."""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        f"{frame.filename.removeprefix(base_dir)}:{frame.lineno} in {frame.name}"
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir) and frame.filename != __file__
+    ]
+    return frames[-STACK_SAMPLE_DEPTH:]
+
+
+class QueryRecorder:
+    """execute_wrapper: считает запросы, их время и повторы по отпечатку."""
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+        self.fingerprints = Counter()
+        # Отпечаток -> стек, снимаем только для повторов и медленных.
+        self.stacks = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.db_time += duration
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            if key not in self.stacks and (
+                self.fingerprints[key] == DUPLICATE_QUERY_THRESHOLD
+                or duration * 1000 >= SLOW_QUERY_MS
+            ):
+                self.stacks[key] = stack_sample()
+
+    @property
+    def duplicates(self):
+        return {
+            key: count
+            for key, count in self.fingerprints.items()
+            if count >= DUPLICATE_QUERY_THRESHOLD
+        }
+
+
+class TimedSerializerMixin:
+    """Время to_representation идет в замер запроса (serialize).
+
+    Вложенные сериализаторы считаются в составе внешнего, элементы
+    списка (many=True) - каждый отдельно.
+    """
+
+    def to_representation(self, instance):
+        recorder = current_recorder.get()
+        if recorder is None or recorder.serializing:
+            return super().to_representation(instance)
+        recorder.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            recorder.serialize_time += time.perf_counter() - started
+            recorder.serializing = False
+
+
+class MetricsStore:
+    """Счетчики Prometheus в общем кэше, чтобы их видели все процессы.
+
+    Серии регистрируются журналом, как в recipes.catalog: номер из
+    cache.incr и имя серии под этим номером. Значения - целые счетчики.
+    """
+
+    def __init__(self):
+        self.numbers = {}
+
+    def key(self, *parts):
+        return ":".join((METRICS_KEY, *map(str, parts)))
+
+    def incr(self, key, delta=1):
+        try:
+            return cache.incr(key, delta)
+        except ValueError:
+            cache.add(key, 0, None)
+            return cache.incr(key, delta)
+
+    def load(self):
+        count = cache.get(self.key("count"), 0)
+        names = cache.get_many([self.key("series", n) for n in range(1, count + 1)])
+        return {int(key.rsplit(":", 1)[1]): name for key, name in names.items()}
+
+    def number(self, series):
+        if series not in self.numbers:
+            known = {name: number for number, name in self.load().items()}
+            if series not in known:
+                known[series] = self.incr(self.key("count"))
+                cache.set(self.key("series", known[series]), series, None)
+            self.numbers[series] = known[series]
+        return self.numbers[series]
+
+    def add(self, name, labels, delta=1):
+        series = "{}_{}{{{}}}".format(
+            METRICS_PREFIX,
+            name,
+            ",".join(f'{label}="{value}"' for label, value in labels.items()),
+        )
+        self.incr(self.key("value", self.number(series)), int(delta))
+
+    def render(self):
+        """Текст для Prometheus; одноименные серии (гонка регистрации) суммируем."""
+        series = self.load()
+        values = cache.get_many([self.key("value", number) for number in series])
+        totals = Counter()
+        for number, name in series.items():
+            totals[name] += values.get(self.key("value", number), 0)
+        lines, previous = [], None
+        for name in sorted(totals):
+            metric = name.split("{", 1)[0]
+            value = totals[name]
+            if metric.endswith("_seconds_total"):
+                value /= MICROSECONDS
+            if metric != previous:
+                lines.append(f"# TYPE {metric} counter")
+                previous = metric
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsStore()
+
+
+def record_metrics(view, method, status, total, recorder):
+    labels = {"view": view}
+    metrics.add("requests_total", {**labels, "method": method, "status": status})
+    metrics.add("request_seconds_total", labels, total * MICROSECONDS)
+    metrics.add("db_queries_total", labels, recorder.count)
+    metrics.add("db_seconds_total", labels, recorder.db_time * MICROSECONDS)
+    metrics.add(
+        "serialize_seconds_total", labels, recorder.serialize_time * MICROSECONDS
+    )
+    duplicates = recorder.duplicates
+    if duplicates:
+        metrics.add("duplicate_queries_total", labels, sum(duplicates.values()))
+
+
+def report_slow(request, view, total, recorder):
+    """Пишем в лог запрос, превысивший пороги, со стеками повторов."""
+    duplicates = recorder.duplicates
+    if (
+        total * 1000 < settings.SLOW_REQUEST_MS
+        and recorder.count < settings.SLOW_REQUEST_QUERIES
+        and not duplicates
+    ):
+        return
+    metrics.add("slow_requests_total", {"view": view})
+    samples = "".join(
+        f"\n  {count}x {key[:200]}\n    " + "\n    ".join(recorder.stacks.get(key, []))
+        for key, count in (duplicates or {key: 1 for key in recorder.stacks}).items()
+    )
+    logger.warning(
+        "Медленный запрос %s %s (%s): %.0f мс, запросов к БД %d (%.0f мс)%s",
+        request.method,
+        request.path,
+        view,
+        total * 1000,
+        recorder.count,
+        recorder.db_time * 1000,
+        samples,
+    )
+
+
+class InstrumentationMiddleware:
+    """Замеры выборки запросов (см. модуль).
+
+    Работает и под ASGI без перехода в поток: иначе Django выполнял бы
+    в потоке каждый запрос, и асинхронные вьюхи теряли бы смысл.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.INSTRUMENTATION_SAMPLE_RATE
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        # S311: выборка для замеров, не криптография.
+        return self.sample_rate and random.random() < self.sample_rate  # noqa: S311
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        token = current_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.report(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        recorder = QueryRecorder()
+        token = current_recorder.set(recorder)
+        started = time.perf_counter()
+        # Асинхронный ORM ходит в БД из потока запроса (thread_sensitive),
+        # обертку ставим на соединение этого потока.
+        await sync_to_async(lambda: connection.execute_wrappers.append(recorder))()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(lambda: connection.execute_wrappers.remove(recorder))()
+            current_recorder.reset(token)
+        return self.report(request, response, recorder, started)
+
+    def report(self, request, response, recorder, started):
+        total = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        response["Server-Timing"] = (
+            f'db;dur={recorder.db_time * 1000:.1f};desc="{recorder.count} queries", '
+            f"serialize;dur={recorder.serialize_time * 1000:.1f}, "
+            f"total;dur={total * 1000:.1f}"
+        )
+        record_metrics(view, request.method, response.status_code, total, recorder)
+        report_slow(request, view, total, recorder)
+        return response
+
+
+def render_pool_stats():
+    """Показатели пулов соединений psycopg этого процесса.
+
+    Пул у каждого воркера свой, поэтому серии помечены pid: /metrics
+    показывает пул воркера, который ответил на запрос.
+    """
+    lines = []
+    for alias in connections:
+        pool = getattr(connections[alias], "pool", None)
+        if pool is None:
+            continue
+        for stat, value in sorted(pool.get_stats().items()):
+            name = stat if stat.startswith("pool_") else f"pool_{stat}"
+            name = name.removesuffix("_num")
+            if stat.endswith("_ms"):
+                name, value = name.removesuffix("_ms") + "_seconds", value / 1000
+            kind = "gauge" if stat in POOL_GAUGES else "counter"
+            metric = f"{METRICS_PREFIX}_db_{name}"
+            if kind == "counter":
+                metric += "_total"
+            lines += [
+                f"# TYPE {metric} {kind}",
+                f'{metric}{{alias="{alias}",pid="{os.getpid()}"}} {value}',
+            ]
+    return "".join(f"{line}\n" for line in lines)
+
+
+def metrics_view(request):
+    """Счетчики в текстовом формате Prometheus и состояние пула соединений.
+
+    Требуется заголовок Authorization: Bearer <METRICS_TOKEN>; без токена
+    в настройках адрес закрыт.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise Http404
+    if not secrets.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.render() + render_pool_stats(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
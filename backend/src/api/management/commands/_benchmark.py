@@ -0,0 +1,43 @@
+"""Общее для бенчмарков: синтетические данные и их пользователи."""
+
+import numpy as np
+
+# Пользователи, теги и продукты, созданные generate_benchmark_data.
+USERNAME_PREFIX = "bench_"
+EMAIL_DOMAIN = "bench.example.com"
+PASSWORD = "bench-Pa55word"  # noqa: S105 - пароль синтетических пользователей.
+TAG_SLUG_PREFIX = "bench-"
+INGREDIENT_PREFIX = "бенчмарк продукт"
+
+
+def synthetic_pairs(count, users, items, seed, distinct=False):
+    """Пары (пользователь, объект) без повторов, номера с 1.
+
+    Активность пользователей и популярность объектов убывают по степенному
+    закону, как в реальном избранном и подписках: немногие рецепты
+    и авторы собирают большую часть отметок. distinct - без пар с равными
+    номерами (подписка на себя).
+    """
+    rng = np.random.default_rng(seed)
+    user_weights = 1 / np.arange(1, users + 1) ** 0.5
+    item_weights = 1 / np.arange(1, items + 1) ** 0.8
+    user_numbers = rng.permutation(users)
+    item_numbers = rng.permutation(items)
+    pairs = np.empty((0, 2), dtype=np.int64)
+    while len(pairs) < count:
+        size = count - len(pairs)
+        # Номера перемешиваем, чтобы популярные объекты не шли подряд.
+        batch = np.column_stack(
+            (
+                user_numbers[
+                    rng.choice(users, size, p=user_weights / user_weights.sum())
+                ],
+                item_numbers[
+                    rng.choice(items, size, p=item_weights / item_weights.sum())
+                ],
+            )
+        )
+        if distinct:
+            batch = batch[batch[:, 0] != batch[:, 1]]
+        pairs = np.unique(np.concatenate((pairs, batch)), axis=0)
+    return pairs + 1
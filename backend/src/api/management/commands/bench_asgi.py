@@ -0,0 +1,208 @@
+"""Пропускная способность WSGI и ASGI при одинаковом числе воркеров."""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from api.management.commands._benchmark import INGREDIENT_PREFIX, USERNAME_PREFIX
+from recipes.links import short_code
+from recipes.models import Recipe, Tag, User
+
+# Режимы: как запустить gunicorn и значение ASYNC_VIEWS.
+MODES = {
+    "wsgi": (["foodgram.wsgi:application"], "False"),
+    "asgi": (
+        ["--worker-class", "uvicorn_worker.UvicornWorker", "foodgram.asgi:application"],
+        "True",
+    ),
+}
+# Задержка сети до БД: SQLite локальна, а PostgreSQL отвечает не мгновенно.
+LATENCY_CONFIG = """
+import time
+
+from django.db.backends.signals import connection_created
+
+
+def slow(execute, *args):
+    time.sleep({latency})
+    return execute(*args)
+
+
+def add_latency(connection, **kwargs):
+    # Сигнал приходит на каждое подключение, а обертки живут дольше.
+    if slow not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow)
+
+
+def post_worker_init(worker):
+    connection_created.connect(add_latency, weak=False)
+"""
+STARTUP_TIMEOUT = 60
+
+
+class Command(BaseCommand):
+    help = (
+        "Запускает gunicorn с синхронными воркерами (WSGI) и с UvicornWorker "
+        "(ASGI, ASYNC_VIEWS) и нагружает горячие GET: список и рецепт, "
+        "теги, поиск продуктов, короткие ссылки. Нужны данные "
+        "generate_benchmark_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--duration", type=float, default=10, help="секунд")
+        parser.add_argument(
+            "--db-latency", type=float, default=0, help="мс на запрос к БД"
+        )
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+
+    def urls(self):
+        """Адреса нагрузки и заголовки пользователя бенчмарка."""
+        user = User.objects.filter(username__startswith=USERNAME_PREFIX).first()
+        recipe = Recipe.objects.order_by("-favorites_count").first()
+        if user is None or recipe is None:
+            raise CommandError("Нет данных: выполните generate_benchmark_data.")
+        token, _ = Token.objects.get_or_create(user=user)
+        tag = Tag.objects.first()
+        urls = [
+            "/api/recipes/",
+            "/api/recipes/?page=2",
+            f"/api/recipes/?tags={tag.slug}",
+            f"/api/recipes/{recipe.pk}/",
+            "/api/tags/",
+            f"/api/ingredients/?name={INGREDIENT_PREFIX[:4]}",
+            reverse("recipes:short_link", args=[short_code(recipe.pk)]),
+        ]
+        return urls, {"Authorization": f"Token {token.key}"}
+
+    def start(self, mode, config):
+        arguments, async_views = MODES[mode]
+        command = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--chdir",
+            str(settings.BASE_DIR),
+            "--bind",
+            f"127.0.0.1:{self.options['port']}",
+            "--workers",
+            str(self.options["workers"]),
+            *(["--config", config] if config else []),
+            *arguments,
+        ]
+        environ = {
+            **os.environ,
+            "ASYNC_VIEWS": async_views,
+            "DJANGO_SETTINGS_MODULE": os.environ.get(
+                "DJANGO_SETTINGS_MODULE", "foodgram.settings"
+            ),
+        }
+        log = tempfile.TemporaryFile()
+        server = subprocess.Popen(  # noqa: S603 - команда собрана из констант.
+            command, env=environ, stdout=log, stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline and server.poll() is None:
+            try:
+                requests.get(f"{self.base}/api/tags/", timeout=STARTUP_TIMEOUT)
+            except requests.ConnectionError:
+                time.sleep(0.2)
+            else:
+                return server
+        server.kill()
+        server.wait()
+        log.seek(0)
+        raise CommandError(
+            f"gunicorn ({mode}) не запустился:\n{log.read().decode()[-2000:]}"
+        )
+
+    def warmup(self, urls, headers):
+        """Прогрев: кэши справочников, отметок и ссылок в каждом воркере."""
+        for url in urls:
+            for _ in range(self.options["workers"]):
+                requests.get(
+                    self.base + url, headers=headers, allow_redirects=False, timeout=30
+                )
+
+    def load(self, urls, headers):
+        """Нагрузка на время duration: задержки (мс) и число ошибок."""
+        timings, errors = [], []
+        lock = threading.Lock()
+        deadline = time.monotonic() + self.options["duration"]
+
+        def client(number):
+            session = requests.Session()
+            session.headers.update(headers)
+            local_timings, local_errors = [], 0
+            index = number
+            while time.monotonic() < deadline:
+                url = urls[index % len(urls)]
+                index += 1
+                started = time.perf_counter()
+                try:
+                    response = session.get(
+                        self.base + url, allow_redirects=False, timeout=30
+                    )
+                    failed = response.status_code >= 400
+                except requests.RequestException:
+                    failed = True
+                local_timings.append((time.perf_counter() - started) * 1000)
+                local_errors += failed
+            with lock:
+                timings.extend(local_timings)
+                errors.append(local_errors)
+
+        with ThreadPoolExecutor(self.options["concurrency"]) as pool:
+            list(pool.map(client, range(self.options["concurrency"])))
+        return timings, sum(errors)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.base = f"http://127.0.0.1:{options['port']}"
+        urls, headers = self.urls()
+        self.stdout.write(
+            f"Воркеров {options['workers']}, клиентов {options['concurrency']}, "
+            f"{options['duration']:g} с на режим, задержка БД "
+            f"{options['db_latency']:g} мс."
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            config = None
+            if options["db_latency"]:
+                config = Path(directory) / "gunicorn_latency.py"
+                config.write_text(
+                    LATENCY_CONFIG.format(latency=options["db_latency"] / 1000)
+                )
+            for mode in options["modes"]:
+                server = self.start(mode, config)
+                try:
+                    self.warmup(urls, headers)
+                    timings, errors = self.load(urls, headers)
+                finally:
+                    server.terminate()
+                    server.wait()
+                self.report(mode, timings, errors)
+
+    def report(self, mode, timings, errors):
+        if not timings:
+            self.stdout.write(f"{mode}: нет ответов")
+            return
+        percentiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(
+            f"{mode}: {len(timings) / self.options['duration']:.0f} запр/с, "
+            f"p50 {percentiles[49]:.1f} мс, p95 {percentiles[94]:.1f} мс, "
+            f"ошибок {errors} из {len(timings)}"
+        )
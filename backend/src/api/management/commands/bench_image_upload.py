@@ -0,0 +1,78 @@
+"""Память и время на одну загрузку картинки: base64 целиком против потока."""
+
+import base64
+import io
+import os
+import time
+import tracemalloc
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management.base import BaseCommand
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+
+from api.fields import StreamingImageField
+
+
+def noise_png(megabytes):
+    """PNG из шума: почти не сжимается, размер близок к заданному."""
+    side = int((megabytes * 1024 * 1024 / 3) ** 0.5)
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (side, side), os.urandom(side * side * 3)).save(
+        buffer, "PNG", compress_level=1
+    )
+    return buffer.getvalue()
+
+
+def measure(validate, data, repeat):
+    """Пиковая память (МиБ) и медиана времени (мс) одной проверки."""
+    peaks, timings = [], []
+    for _ in range(repeat):
+        value = data()
+        tracemalloc.start()
+        started = time.perf_counter()
+        validate(value)
+        timings.append((time.perf_counter() - started) * 1000)
+        peaks.append(tracemalloc.get_traced_memory()[1] / 2**20)
+        tracemalloc.stop()
+    return max(peaks), sorted(timings)[len(timings) // 2]
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк загрузки картинки: пиковая память и время проверки поля "
+        "drf-extra-fields Base64ImageField и StreamingImageField."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--megabytes", type=float, default=7)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        content = noise_png(options["megabytes"])
+        payload = "data:image/png;base64," + base64.b64encode(content).decode()
+
+        def upload():
+            file = TemporaryUploadedFile("image.png", "image/png", len(content), None)
+            file.write(content)
+            file.seek(0)
+            return file
+
+        self.stdout.write(
+            f"Картинка {len(content) / 2**20:.1f} МиБ, "
+            f"base64 {len(payload) / 2**20:.1f} МиБ."
+        )
+        cases = {
+            "Base64ImageField": (Base64ImageField().to_internal_value, lambda: payload),
+            "StreamingImageField, base64": (
+                StreamingImageField().to_internal_value,
+                lambda: payload,
+            ),
+            "StreamingImageField, multipart": (
+                StreamingImageField().to_internal_value,
+                upload,
+            ),
+        }
+        for name, (validate, data) in cases.items():
+            peak, median = measure(validate, data, options["repeat"])
+            self.stdout.write(f"{name:>32}: пик {peak:.2f} МиБ, {median:.1f} мс")
@@ -0,0 +1,62 @@
+"""Сравнение автодополнения продуктов: индекс в памяти против фильтра БД."""
+
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.filters import IngredientFilter
+from api.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+
+def measure(search, queries, repeat):
+    """Время одного поиска в миллисекундах по всем запросам."""
+    timings = []
+    for _ in range(repeat):
+        for query in queries:
+            started = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк поиска продуктов по названию: индекс в памяти и ILIKE в БД."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list("name", flat=True))
+        if not names:
+            raise CommandError("Справочник продуктов пуст, сначала load_ingredients.")
+        rng = random.Random(options["seed"])  # noqa: S311 - не криптография.
+        # Запросы как при наборе с клавиатуры: префиксы длиной 1-5 символов.
+        queries = [
+            name[: rng.randint(1, 5)]
+            for name in rng.choices(names, k=options["queries"])
+        ]
+        ingredient_index.refresh()
+        results = {
+            "index": measure(ingredient_index.search, queries, options["repeat"]),
+            "db": measure(
+                lambda query: list(
+                    IngredientFilter(
+                        {"name": query}, queryset=Ingredient.objects.all()
+                    ).qs
+                ),
+                queries,
+                options["repeat"],
+            ),
+        }
+        for method, timings in results.items():
+            self.stdout.write(
+                f"{method:>5}: p50 {statistics.median(timings):.3f} мс, "
+                f"p95 {statistics.quantiles(timings, n=20)[-1]:.3f} мс"
+            )
+        speedup = statistics.median(results["db"]) / statistics.median(results["index"])
+        self.stdout.write(self.style.SUCCESS(f"Ускорение по медиане: {speedup:.1f}x"))
@@ -0,0 +1,87 @@
+"""Сравнение подбора рецептов по продуктам: индекс numpy против ORM."""
+
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast
+
+from api.recipe_matcher import RecipeMatcher
+from constants import MATCH_LIMIT_DEFAULT
+from recipes.models import Ingredient, Recipe
+
+
+def orm_match(ingredients, limit):
+    """Тот же подбор одним запросом с JOIN и GROUP BY по IngredientInRecipe."""
+    return list(
+        Recipe.objects.annotate(
+            matched=Count(
+                "ingredients_in_recipe",
+                filter=Q(ingredients_in_recipe__ingredient__in=ingredients),
+            ),
+            total=Count("ingredients_in_recipe"),
+        )
+        .filter(matched__gt=0)
+        .annotate(coverage=Cast(F("matched"), FloatField()) / F("total"))
+        .order_by("-coverage", "-matched", "-id")
+        .values_list("id", "coverage")[:limit]
+    )
+
+
+def measure(match, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        match(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк /api/recipes/match/: индекс в памяти против запроса к БД."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=20)
+        parser.add_argument("--ingredients", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Продукты берем из реальных составов, иначе совпадений почти нет.
+        used = list(
+            Ingredient.objects.filter(ingredients_in_recipe__isnull=False)
+            .distinct()
+            .values_list("id", flat=True)
+        )
+        if not used:
+            raise CommandError("Рецептов с продуктами нет, сначала create_recipes.")
+        rng = random.Random(options["seed"])  # noqa: S311 - не криптография.
+        queries = [
+            rng.sample(used, min(options["ingredients"], len(used)))
+            for _ in range(options["queries"])
+        ]
+        matcher = RecipeMatcher()
+        started = time.perf_counter()
+        matcher.refresh()
+        self.stdout.write(
+            f"Индекс: {len(matcher.state.base.recipe_ids)} рецептов за "
+            f"{time.perf_counter() - started:.2f} с."
+        )
+        results = {
+            "index": measure(
+                lambda query: matcher.match(query, MATCH_LIMIT_DEFAULT), queries
+            ),
+            "orm": measure(
+                lambda query: orm_match(query, MATCH_LIMIT_DEFAULT), queries
+            ),
+        }
+        for method, timings in results.items():
+            self.stdout.write(
+                f"{method:>5}: p50 {statistics.median(timings):.1f} мс, "
+                f"p95 {statistics.quantiles(timings, n=20)[-1]:.1f} мс"
+            )
+        speedup = statistics.median(results["orm"]) / statistics.median(
+            results["index"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Ускорение по медиане: {speedup:.1f}x"))
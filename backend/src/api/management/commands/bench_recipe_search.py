@@ -0,0 +1,80 @@
+"""Сравнение поиска рецептов: полнотекстовый индекс против ILIKE."""
+
+import random
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from constants import SEARCH_MAX_RESULTS
+from recipes.models import Recipe
+from recipes.search import search_recipes
+
+
+def measure(search, queries, page_size):
+    """Время первой страницы с подсчетом total в миллисекундах."""
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        recipes = search(query)
+        recipes.count()
+        list(recipes[:page_size])
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def naive(query):
+    return Recipe.objects.filter(
+        Q(name__icontains=query) | Q(text__icontains=query)
+    ).order_by("-pub_date", "-id")
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк поиска рецептов (?search=): FTS-индекс против "
+        "name/text__icontains. Запускать на базе от 100 тыс. рецептов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--page-size", type=int, default=6)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        total = Recipe.objects.count()
+        if not total:
+            raise CommandError("Рецептов нет, сначала create_recipes.")
+        rng = random.Random(options["seed"])  # noqa: S311 - не криптография.
+        # Запросы - слова из названий случайных рецептов.
+        sample = Recipe.objects.order_by("?").values_list("name", flat=True)
+        words = [
+            word
+            for name in sample[: options["queries"] * 4]
+            for word in re.findall(r"\w{4,}", name)
+        ]
+        if not words:
+            raise CommandError("Не из чего составить запросы.")
+        queries = [rng.choice(words) for _ in range(options["queries"])]
+        self.stdout.write(
+            f"Рецептов: {total}, запросов: {len(queries)}, "
+            f"предел кандидатов FTS5: {SEARCH_MAX_RESULTS}."
+        )
+        results = {
+            "fts": measure(
+                lambda query: search_recipes(Recipe.objects.all(), query),
+                queries,
+                options["page_size"],
+            ),
+            "ilike": measure(naive, queries, options["page_size"]),
+        }
+        for method, timings in results.items():
+            self.stdout.write(
+                f"{method:>5}: p50 {statistics.median(timings):.1f} мс, "
+                f"p95 {statistics.quantiles(timings, n=20)[-1]:.1f} мс"
+            )
+        speedup = statistics.median(results["ilike"]) / statistics.median(
+            results["fts"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Ускорение по медиане: {speedup:.1f}x"))
@@ -0,0 +1,52 @@
+"""Бенчмарк расчета похожих рецептов на синтетическом избранном."""
+
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from api.management.commands._benchmark import synthetic_pairs
+from recipes.similarity import FavoritesMatrix
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк build_similarity без БД: матрица избранного и расчет "
+        "соседей на синтетических данных (по умолчанию 1 млн отметок)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--favorites", type=int, default=1_000_000)
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--recipes", type=int, default=100_000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        pairs = synthetic_pairs(
+            options["favorites"], options["users"], options["recipes"], options["seed"]
+        )
+        self.stdout.write(
+            f"Отметок: {len(pairs)}, пользователей: {len(np.unique(pairs[:, 0]))}, "
+            f"рецептов: {len(np.unique(pairs[:, 1]))}."
+        )
+        tracemalloc.start()
+        started = time.perf_counter()
+        favorites = FavoritesMatrix(pairs)
+        built = time.perf_counter()
+        neighbors = 0
+        for recipe_ids, _, _ in favorites.all_neighbors():
+            neighbors += len(recipe_ids)
+        finished = time.perf_counter()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.stdout.write(
+            f"Матрица: {built - started:.2f} с, соседи: {finished - built:.2f} с, "
+            f"пиковая память: {peak / 2**20:.0f} МиБ."
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Пар соседей: {neighbors} "
+                f"({neighbors / max(len(favorites.recipe_ids), 1):.1f} на рецепт)."
+            )
+        )
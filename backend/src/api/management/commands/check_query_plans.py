@@ -0,0 +1,154 @@
+"""Проверка планов запросов API: горячие запросы не читают таблицы целиком."""
+
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from api.management.commands.run_benchmarks import (
+    Fixtures,
+    api_clients,
+    scenarios,
+    send,
+)
+
+# Запросы, план которых смотрим: остальное (INSERT, SAVEPOINT) таблиц не читает.
+PLANNED = ("SELECT", "UPDATE", "DELETE")
+# Узлы, которым по смыслу нужны все строки входа (COUNT(*) всей таблицы).
+WHOLE_TABLE_PARENTS = ("Aggregate",)
+
+
+def seq_scans(plan, parent=None):
+    """Узлы Seq Scan плана EXPLAIN (FORMAT JSON) с родительским узлом."""
+    if plan["Node Type"] == "Seq Scan":
+        yield plan, parent
+    for child in plan.get("Plans", ()):
+        yield from seq_scans(child, plan)
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет сценарии run_benchmarks на данных generate_benchmark_data "
+        "(PostgreSQL), снимает EXPLAIN каждого запроса к БД и завершается "
+        "с ошибкой, если запрос читает большую таблицу последовательным "
+        "сканированием. Полный проход таблицы допустим только для агрегата "
+        "без условий (COUNT(*) всех строк)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-rows",
+            type=int,
+            default=5000,
+            help="Таблицы меньше этого размера можно читать целиком.",
+        )
+        parser.add_argument(
+            "--max-selectivity",
+            type=float,
+            default=0.2,
+            help="Доля строк, начиная с которой условие можно проверять "
+            "полным проходом.",
+        )
+        parser.add_argument(
+            "--only", default="", help="Только сценарии, содержащие подстроку."
+        )
+        parser.add_argument(
+            "--verbose-plans", action="store_true", help="Печатать планы запросов."
+        )
+
+    def table_rows(self):
+        """Оценка числа строк таблиц после ANALYZE."""
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            cursor.execute(
+                "SELECT relname, reltuples FROM pg_class "
+                "WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace"
+            )
+            return dict(cursor.fetchall())
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+            plan = cursor.fetchone()[0]
+        # psycopg возвращает json уже разобранным, другие драйверы - строкой.
+        return (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+    def problems(self, plan):
+        for node, parent in seq_scans(plan):
+            table = node["Relation Name"]
+            rows = self.rows.get(table, 0)
+            if rows < self.options["min_rows"]:
+                continue
+            if "Filter" in node:
+                # Условию подходит большая часть строк: полный проход
+                # дешевле индекса, это выбор планировщика, а не нехватка.
+                if node["Plan Rows"] >= rows * self.options["max_selectivity"]:
+                    continue
+            elif parent is not None and parent["Node Type"] in WHOLE_TABLE_PARENTS:
+                continue
+            condition = node.get("Filter", "без условия")
+            yield f"Seq Scan {table} ({rows:.0f} строк): {condition}"
+
+    def scenario_problems(self, clients, scenario):
+        """Проблемы запросов сценария (запрос выполняется и откатывается)."""
+        found = []
+        with transaction.atomic(), CaptureQueriesContext(connection) as captured:
+            response = send(clients, scenario)
+            if response.status_code != scenario.status:
+                # План ответа с ошибкой ничего не говорит о рабочем пути.
+                found.append(
+                    ("", f"статус {response.status_code}, ожидался {scenario.status}")
+                )
+            statements = [
+                query["sql"]
+                for query in captured.captured_queries
+                if query["sql"].lstrip().upper().startswith(PLANNED)
+            ]
+            # План снимаем до отката: запрос мог опираться на записанное.
+            for sql in dict.fromkeys(statements):
+                plan = self.explain(sql)
+                if self.options["verbose_plans"]:
+                    self.stdout.write(f"  {sql[:300]}\n{json.dumps(plan, indent=1)}")
+                found += [(sql, problem) for problem in self.problems(plan)]
+            transaction.set_rollback(True)
+        return found
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Планы запросов проверяются только на PostgreSQL.")
+        self.options = options
+        fixtures = Fixtures()
+        self.rows = self.table_rows()
+        setup_test_environment()
+        clients = api_clients(fixtures)
+        failures = []
+        try:
+            # Загруженные картинки - во временный каталог.
+            with (
+                tempfile.TemporaryDirectory() as media,
+                override_settings(MEDIA_ROOT=media),
+            ):
+                for scenario in scenarios(fixtures):
+                    if options["only"] not in scenario.name:
+                        continue
+                    found = self.scenario_problems(clients, scenario)
+                    status = self.style.ERROR("seq scan") if found else "ok"
+                    self.stdout.write(f"{scenario.name:<48} {status}")
+                    for sql, problem in found:
+                        self.stdout.write(f"  {problem}\n    {sql[:300]}")
+                    failures += [f"{scenario.name}: {problem}" for _, problem in found]
+        finally:
+            teardown_test_environment()
+        if failures:
+            raise CommandError(
+                f"Последовательное сканирование ({len(failures)}):\n"
+                + "\n".join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS("Планы запросов без Seq Scan."))
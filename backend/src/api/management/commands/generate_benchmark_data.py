@@ -0,0 +1,229 @@
+"""Команда создания синтетических данных для бенчмарков."""
+
+import datetime as dt
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import transaction
+
+from api.management.commands._benchmark import (
+    EMAIL_DOMAIN,
+    INGREDIENT_PREFIX,
+    PASSWORD,
+    TAG_SLUG_PREFIX,
+    USERNAME_PREFIX,
+    synthetic_pairs,
+)
+from recipes.catalog import bump_catalog_version, invalidate_recipe_changes
+from recipes.management.commands._import import ImportCommand, Progress, batched
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCart,
+    Subscribe,
+    Tag,
+    User,
+)
+
+# Слова для названий и описаний: по ним работают поиск и автодополнение.
+WORDS = (
+    "суп салат пирог каша омлет рагу плов паста соус запеканка котлеты "
+    "блины оладьи борщ щи уха жаркое гуляш шашлык пицца торт кекс печенье "
+    "курица говядина свинина рыба грибы сыр картофель капуста морковь лук "
+    "томаты перец рис гречка фасоль яблоки ягоды творог сметана зелень"
+).split()
+# Даты публикации детерминированы: рецепт n опубликован через n минут.
+PUB_DATE_START = dt.datetime(2025, 1, 1, tzinfo=dt.UTC)
+
+
+class Command(ImportCommand):
+    help = (
+        "Создает детерминированные синтетические данные для run_benchmarks: "
+        "пользователей, рецепты, избранное, корзины и подписки. Прежние "
+        "данные бенчмарка (пользователи bench_*) удаляются."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--recipes", type=int, default=10000)
+        parser.add_argument("--ingredients", type=int, default=2000)
+        parser.add_argument("--ingredients-per-recipe", type=int, default=8)
+        parser.add_argument("--tags", type=int, default=10)
+        parser.add_argument("--favorites", type=int, default=50000)
+        parser.add_argument("--shopping-cart", type=int, default=10000)
+        parser.add_argument("--subscriptions", type=int, default=10000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def text(self, rng, words):
+        return " ".join(rng.choice(WORDS, words))
+
+    def create(self, model, objects):
+        """bulk_create пачками с прогрессом, возвращаем pk по порядку."""
+        progress = Progress(self.stdout, model._meta.verbose_name_plural)
+        pks = []
+        for batch in batched(objects, self.options["batch_size"]):
+            with transaction.atomic():
+                pks += [obj.pk for obj in model.objects.bulk_create(batch)]
+            progress.advance(len(batch))
+        progress.report()
+        return pks
+
+    def recipe(self, rng, number, author, image):
+        image, image_sizes = self.copy_image(image)
+        return Recipe(
+            author_id=author,
+            name=f"{self.text(rng, 3).capitalize()} {number}",
+            text=self.text(rng, 30),
+            cooking_time=int(rng.integers(1, 180)),
+            image=image,
+            image_sizes=image_sizes,
+        )
+
+    def create_pairs(self, model, fields, count, users, items, distinct=False):
+        self.seed += 1
+        pairs = synthetic_pairs(
+            min(count, len(users) * len(items)),
+            len(users),
+            len(items),
+            self.seed,
+            distinct=distinct,
+        )
+        users, items = np.asarray(users), np.asarray(items)
+        self.create(
+            model,
+            (
+                model(**dict(zip(fields, pair, strict=True)))
+                for pair in zip(
+                    users[pairs[:, 0] - 1].tolist(),
+                    items[pairs[:, 1] - 1].tolist(),
+                    strict=True,
+                )
+            ),
+        )
+
+    def delete_previous(self):
+        with transaction.atomic():
+            deleted, _ = User.objects.filter(
+                username__startswith=USERNAME_PREFIX
+            ).delete()
+            deleted += Tag.objects.filter(slug__startswith=TAG_SLUG_PREFIX).delete()[0]
+            deleted += Ingredient.objects.filter(
+                name__startswith=INGREDIENT_PREFIX
+            ).delete()[0]
+        if deleted:
+            self.stdout.write(f"Удалено прежних объектов бенчмарка: {deleted}.")
+
+    def load(self):
+        options = self.options
+        rng = np.random.default_rng(options["seed"])
+        self.seed = options["seed"]
+        self.delete_previous()
+
+        password = make_password(PASSWORD)
+        users = self.create(
+            User,
+            (
+                User(
+                    username=f"{USERNAME_PREFIX}{n}",
+                    email=f"{USERNAME_PREFIX}{n}@{EMAIL_DOMAIN}",
+                    first_name=f"Имя {n}",
+                    last_name=f"Фамилия {n}",
+                    password=password,
+                )
+                for n in range(1, options["users"] + 1)
+            ),
+        )
+        tags = self.create(
+            Tag,
+            (
+                Tag(name=f"Бенчмарк {n}", slug=f"{TAG_SLUG_PREFIX}{n}")
+                for n in range(1, options["tags"] + 1)
+            ),
+        )
+        ingredients = self.create(
+            Ingredient,
+            (
+                Ingredient(
+                    name=f"{INGREDIENT_PREFIX} {self.text(rng, 1)} {n}",
+                    measurement_unit="г",
+                )
+                for n in range(1, options["ingredients"] + 1)
+            ),
+        )
+
+        dishes = settings.DATA_DIR / "dishes"
+        source = str(min(dishes.iterdir()))
+        # Свой каталог для копий картинки у рецептов бенчмарка.
+        image = self.prepare_images(Recipe, [source], "recipe_images/benchmark")
+        # Авторы, как и отметки, распределены неравномерно.
+        weights = 1 / np.arange(1, len(users) + 1) ** 0.8
+        authors = rng.choice(users, options["recipes"], p=weights / weights.sum())
+        recipes = self.create(
+            Recipe,
+            (
+                self.recipe(rng, n, author, image[source])
+                for n, author in enumerate(authors.tolist(), 1)
+            ),
+        )
+        with transaction.atomic():
+            for batch in batched(enumerate(recipes), options["batch_size"]):
+                Recipe.objects.bulk_update(
+                    [
+                        Recipe(pk=pk, pub_date=PUB_DATE_START + dt.timedelta(minutes=n))
+                        for n, pk in batch
+                    ],
+                    ["pub_date"],
+                )
+        per_recipe = min(options["ingredients_per_recipe"], len(ingredients))
+        self.create(
+            IngredientInRecipe,
+            (
+                IngredientInRecipe(
+                    recipe_id=recipe,
+                    ingredient_id=ingredients[index],
+                    amount=int(rng.integers(1, 1000)),
+                )
+                for recipe in recipes
+                for index in rng.choice(len(ingredients), per_recipe, replace=False)
+            ),
+        )
+        self.create(
+            Recipe.tags.through,
+            (
+                Recipe.tags.through(recipe_id=recipe, tag_id=tags[index])
+                for recipe in recipes
+                for index in rng.choice(len(tags), min(2, len(tags)), replace=False)
+            ),
+        )
+        self.create_pairs(
+            Favorite, ("user_id", "recipe_id"), options["favorites"], users, recipes
+        )
+        self.create_pairs(
+            ShoppingCart,
+            ("user_id", "recipe_id"),
+            options["shopping_cart"],
+            users,
+            recipes,
+        )
+        self.create_pairs(
+            Subscribe,
+            ("user_id", "subscribed_id"),
+            options["subscriptions"],
+            users,
+            users,
+            distinct=True,
+        )
+
+        bump_catalog_version(Tag)
+        bump_catalog_version(Ingredient)
+        # bulk_create не шлет сигналы: пересчитываем счетчики и индексы.
+        call_command("rebuild_counters", stdout=self.stdout)
+        call_command("rebuild_search_index", stdout=self.stdout)
+        call_command("rebuild_feeds", stdout=self.stdout)
+        call_command("build_similarity", stdout=self.stdout)
+        invalidate_recipe_changes()
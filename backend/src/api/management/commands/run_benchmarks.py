@@ -0,0 +1,627 @@
+"""Бенчмарк всех маршрутов API с бюджетами запросов, времени и памяти."""
+
+import base64
+import gc
+import io
+import json
+import statistics
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.urls import URLResolver, reverse
+from djoser.utils import encode_uid
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import urls
+from api.management.commands._benchmark import (
+    EMAIL_DOMAIN,
+    INGREDIENT_PREFIX,
+    PASSWORD,
+    USERNAME_PREFIX,
+)
+from recipes.catalog import cache_is_shared
+from recipes.models import (
+    Favorite,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCart,
+    Subscribe,
+    User,
+)
+
+BASELINE = Path(__file__).resolve().parents[2] / "benchmark_baseline.json"
+METHODS = ("get", "post", "put", "patch", "delete")
+# Маршруты без сценария и причина.
+SKIPPED = {
+    ("user-activation", "post"): "активация по почте выключена",
+    ("user-resend-activation", "post"): "активация по почте выключена",
+    ("user-reset-password", "post"): "письма сброса не настроены",
+    ("user-reset-username", "post"): "письма сброса не настроены",
+}
+# Служебные запросы вложенных транзакций: в бою их заменяет BEGIN/COMMIT
+# запроса, а в бенчмарке каждый запрос идет внутри откатываемой транзакции.
+TRANSACTION_QUERIES = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+# Хеширование пароля намеренно медленное: таким сценариям хватит
+# нескольких повторов.
+SLOW_ITERATIONS = 3
+# Потолок запросов к БД на сценарий независимо от базовой линии: число
+# запросов, растущее со строками (N+1, построчные сигналы каскада), не
+# должно попасть в базовую линию как норма.
+MAX_QUERIES = 30
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """Запрос к маршруту route от имени user (reader, author или аноним)."""
+
+    method: str
+    route: str
+    variant: str = ""
+    user: str | None = "reader"
+    kwargs: dict = field(default_factory=dict)
+    query: dict = field(default_factory=dict)
+    data: dict | None = None
+    status: int = 200
+    slow: bool = False
+
+    @property
+    def name(self):
+        return " ".join(filter(None, (self.method.upper(), self.route, self.variant)))
+
+
+def png_base64():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "orange").save(buffer, "PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+class Fixtures:
+    """Пользователи и объекты данных бенчмарка, на которые идут запросы.
+
+    Выбираются детерминированно: на одних данных сценарии одинаковы.
+    """
+
+    def __init__(self):
+        users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        # Читатель с самой длинной лентой, автор с наибольшим числом рецептов.
+        self.reader = users.order_by("-subscriptions_count", "pk").first()
+        self.author = users.order_by("-recipes_count", "pk").first()
+        if self.reader is None or not self.author.recipes_count:
+            raise CommandError("Нет данных бенчмарка, сначала generate_benchmark_data.")
+        recipes = Recipe.objects.filter(author__in=users).order_by(
+            "-favorites_count", "pk"
+        )
+        self.recipe = recipes.first()
+        self.own_recipe = recipes.filter(author=self.author).first()
+        self.favorite = self.marked(Favorite).first()
+        self.not_favorite = recipes.exclude(favorites__user=self.reader).first()
+        self.in_cart = self.marked(ShoppingCart).first()
+        self.not_in_cart = recipes.exclude(shoppingcarts__user=self.reader).first()
+        self.subscribed = (
+            Subscribe.objects.filter(user=self.reader)
+            .order_by("subscribed_id")
+            .values_list("subscribed_id", flat=True)
+            .first()
+        )
+        self.not_subscribed = (
+            users.exclude(pk=self.reader.pk)
+            .exclude(authors__user=self.reader)
+            .order_by("-recipes_count", "pk")
+            .values_list("pk", flat=True)
+            .first()
+        )
+        self.ingredients = list(
+            IngredientInRecipe.objects.filter(recipe=self.recipe)
+            .order_by("ingredient_id")
+            .values_list("ingredient_id", flat=True)
+        )
+        self.tags = list(self.recipe.tags.order_by("pk"))
+        self.word = self.recipe.name.split()[0].lower()
+        self.tokens = {
+            name: Token.objects.get_or_create(user=user)[0].key
+            for name, user in (("reader", self.reader), ("author", self.author))
+        }
+        self.uid = encode_uid(self.reader.pk)
+        self.token = default_token_generator.make_token(self.reader)
+
+    def marked(self, model):
+        return (
+            model.objects.filter(user=self.reader)
+            .order_by("recipe_id")
+            .values_list("recipe_id", flat=True)
+        )
+
+    def recipe_data(self):
+        return {
+            "name": "Рецепт бенчмарка",
+            "text": "Описание рецепта бенчмарка.",
+            "cooking_time": 30,
+            "image": png_base64(),
+            "tags": [tag.pk for tag in self.tags],
+            "ingredients": [
+                {"id": pk, "amount": 100 + number}
+                for number, pk in enumerate(self.ingredients)
+            ],
+        }
+
+
+def scenarios(f):
+    recipe = {"pk": f.recipe.pk}
+    own = {"pk": f.own_recipe.pk}
+    reader = {"id": f.reader.pk}
+    slugs = [tag.slug for tag in f.tags]
+    return [
+        Scenario(
+            "post",
+            "login",
+            user=None,
+            data={"email": f.reader.email, "password": PASSWORD},
+            slow=True,
+        ),
+        Scenario("post", "logout", status=204),
+        Scenario("get", "tag-list", user=None),
+        Scenario("get", "tag-detail", user=None, kwargs={"pk": f.tags[0].pk}),
+        Scenario("get", "ingredient-list", user=None),
+        Scenario(
+            "get",
+            "ingredient-list",
+            "?name",
+            user=None,
+            query={"name": INGREDIENT_PREFIX[:4]},
+        ),
+        Scenario(
+            "get", "ingredient-detail", user=None, kwargs={"pk": f.ingredients[0]}
+        ),
+        Scenario("get", "recipes-list", "anonymous", user=None),
+        Scenario("get", "recipes-list"),
+        Scenario("get", "recipes-list", "?tags", query={"tags": slugs}),
+        Scenario("get", "recipes-list", "?author", query={"author": f.author.pk}),
+        Scenario("get", "recipes-list", "?is_favorited", query={"is_favorited": 1}),
+        Scenario(
+            "get",
+            "recipes-list",
+            "?is_in_shopping_cart",
+            query={"is_in_shopping_cart": 1},
+        ),
+        Scenario("get", "recipes-list", "?search", query={"search": f.word}),
+        Scenario("get", "recipes-list", "?ordering", query={"ordering": "-popularity"}),
+        Scenario("get", "recipes-list", "?cursor", query={"cursor": ""}),
+        Scenario(
+            "post", "recipes-list", user="author", data=f.recipe_data(), status=201
+        ),
+        Scenario("get", "recipes-detail", kwargs=recipe),
+        Scenario("get", "recipes-detail", "anonymous", user=None, kwargs=recipe),
+        Scenario(
+            "put", "recipes-detail", user="author", kwargs=own, data=f.recipe_data()
+        ),
+        Scenario(
+            "patch",
+            "recipes-detail",
+            user="author",
+            kwargs=own,
+            data={
+                key: value for key, value in f.recipe_data().items() if key != "image"
+            },
+        ),
+        Scenario("delete", "recipes-detail", user="author", kwargs=own, status=204),
+        Scenario(
+            "post", "recipes-favorite", kwargs={"pk": f.not_favorite.pk}, status=201
+        ),
+        Scenario("delete", "recipes-favorite", kwargs={"pk": f.favorite}, status=204),
+        Scenario(
+            "post", "recipes-shopping-cart", kwargs={"pk": f.not_in_cart.pk}, status=201
+        ),
+        Scenario(
+            "delete", "recipes-shopping-cart", kwargs={"pk": f.in_cart}, status=204
+        ),
+        Scenario(
+            "post",
+            "recipes-favorite-bulk",
+            data={"recipes": list(f.marked(Favorite)[:50])},
+        ),
+        Scenario(
+            "delete",
+            "recipes-favorite-bulk",
+            data={"recipes": list(f.marked(Favorite)[:50])},
+        ),
+        Scenario(
+            "post",
+            "recipes-shopping-cart-bulk",
+            data={"recipes": list(f.marked(ShoppingCart)[:50])},
+        ),
+        Scenario(
+            "delete",
+            "recipes-shopping-cart-bulk",
+            data={"recipes": list(f.marked(ShoppingCart)[:50])},
+        ),
+        Scenario("get", "recipes-download-shopping-cart"),
+        Scenario(
+            "get",
+            "recipes-download-shopping-cart",
+            "?format=csv",
+            query={"format": "csv"},
+        ),
+        Scenario("get", "recipes-feed"),
+        Scenario(
+            "get",
+            "recipes-match",
+            user=None,
+            query={"ingredients": ",".join(map(str, f.ingredients))},
+        ),
+        Scenario("get", "recipes-recommended"),
+        Scenario("get", "recipes-similar", user=None, kwargs=recipe),
+        Scenario("get", "recipes-get-link", user=None, kwargs=recipe),
+        Scenario("get", "user-list", user=None),
+        Scenario(
+            "post",
+            "user-list",
+            user=None,
+            data={
+                "email": f"new@{EMAIL_DOMAIN}",
+                "username": f"{USERNAME_PREFIX}new",
+                "first_name": "Имя",
+                "last_name": "Фамилия",
+                "password": PASSWORD,
+            },
+            status=201,
+            slow=True,
+        ),
+        Scenario("get", "user-detail", kwargs={"id": f.author.pk}),
+        Scenario(
+            "put",
+            "user-detail",
+            kwargs=reader,
+            data={
+                "email": f.reader.email,
+                "username": f.reader.username,
+                "first_name": "Имя",
+                "last_name": "Фамилия",
+            },
+        ),
+        Scenario("patch", "user-detail", kwargs=reader, data={"first_name": "Имя"}),
+        Scenario(
+            "delete",
+            "user-detail",
+            kwargs=reader,
+            data={"current_password": PASSWORD},
+            status=204,
+            slow=True,
+        ),
+        Scenario("get", "user-me"),
+        Scenario(
+            "put",
+            "user-me",
+            data={
+                "email": f.reader.email,
+                "username": f.reader.username,
+                "first_name": "Имя",
+                "last_name": "Фамилия",
+            },
+        ),
+        Scenario("patch", "user-me", data={"last_name": "Фамилия"}),
+        Scenario(
+            "delete",
+            "user-me",
+            data={"current_password": PASSWORD},
+            status=204,
+            slow=True,
+        ),
+        Scenario("put", "user-avatar", data={"avatar": png_base64()}),
+        Scenario("delete", "user-avatar", status=204),
+        Scenario("get", "user-subscriptions"),
+        Scenario("post", "user-subscribe", kwargs={"id": f.not_subscribed}, status=201),
+        Scenario("delete", "user-subscribe", kwargs={"id": f.subscribed}, status=204),
+        Scenario(
+            "post",
+            "user-set-password",
+            data={"current_password": PASSWORD, "new_password": f"{PASSWORD}-new"},
+            status=204,
+            slow=True,
+        ),
+        Scenario(
+            "post",
+            "user-set-username",
+            data={"current_password": PASSWORD, "new_email": f"changed@{EMAIL_DOMAIN}"},
+            status=204,
+            slow=True,
+        ),
+        Scenario(
+            "post",
+            "user-reset-password-confirm",
+            user=None,
+            data={"uid": f.uid, "token": f.token, "new_password": f"{PASSWORD}-new"},
+            status=204,
+            slow=True,
+        ),
+        Scenario(
+            "post",
+            "user-reset-username-confirm",
+            user=None,
+            data={
+                "uid": f.uid,
+                "token": f.token,
+                "new_email": f"changed@{EMAIL_DOMAIN}",
+            },
+            status=204,
+        ),
+    ]
+
+
+def api_routes(patterns=urls.urlpatterns):
+    """Пары (имя маршрута, метод) всех маршрутов api/urls.py."""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from api_routes(pattern.url_patterns)
+            continue
+        actions = getattr(pattern.callback, "actions", None)
+        if actions is None:
+            view = pattern.callback.view_class
+            actions = [method for method in METHODS if hasattr(view, method)]
+        for method in actions:
+            yield pattern.name, method
+
+
+def api_clients(fixtures):
+    """Клиенты анонима и пользователей фикстур по токенам."""
+    # Ошибка сервера - несовпадение статуса, а не остановка прогона.
+    clients = {None: APIClient(raise_request_exception=False)}
+    for name, key in fixtures.tokens.items():
+        clients[name] = APIClient(raise_request_exception=False)
+        clients[name].credentials(HTTP_AUTHORIZATION=f"Token {key}")
+    return clients
+
+
+def send(clients, scenario):
+    """Запрос сценария; потоковый ответ читается до конца."""
+    client = clients[scenario.user]
+    url = reverse(scenario.route, kwargs=scenario.kwargs)
+    if scenario.method == "get":
+        response = client.get(url, scenario.query)
+    else:
+        response = getattr(client, scenario.method)(url, scenario.data, format="json")
+    if response.streaming:
+        b"".join(response.streaming_content)
+    return response
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет сценарии по всем маршрутам API через тестовый клиент на "
+        "данных generate_benchmark_data и сравнивает p50/p95, число запросов "
+        "к БД и пиковую память с базовой линией. Завершается с ошибкой при "
+        "превышении бюджетов. Каждый запрос выполняется в откатываемой "
+        "транзакции, данные не меняются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--baseline", type=Path, default=BASELINE)
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Записать результаты как новую базовую линию.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.5,
+            help="Допустимый рост p50 и памяти (доля), число запросов - без допуска.",
+        )
+        parser.add_argument(
+            "--only", default="", help="Только сценарии, содержащие подстроку."
+        )
+        parser.add_argument("--output", type=Path, help="Результаты в JSON.")
+
+    def check_coverage(self, scenarios):
+        covered = {(scenario.route, scenario.method) for scenario in scenarios}
+        missing = sorted(set(api_routes()) - covered - SKIPPED.keys())
+        if missing:
+            raise CommandError(
+                "Нет сценариев для маршрутов: "
+                + ", ".join(f"{method.upper()} {route}" for route, method in missing)
+            )
+
+    def run(self, clients, scenario):
+        """Повторы сценария в откатываемых транзакциях."""
+        iterations = (
+            min(self.options["iterations"], SLOW_ITERATIONS)
+            if scenario.slow
+            else self.options["iterations"]
+        )
+        timings, queries, statuses = [], 0, set()
+        for number in range(self.options["warmup"] + iterations + 1):
+            # Последний повтор - под tracemalloc, он замедляет код.
+            traced = number == self.options["warmup"] + iterations
+            # Журнал запросов ограничен, CaptureQueriesContext считает
+            # по его длине.
+            reset_queries()
+            # Сборку мусора от прошлых повторов не засчитываем этому.
+            gc.collect()
+            with transaction.atomic(), CaptureQueriesContext(connection) as captured:
+                if traced:
+                    tracemalloc.start()
+                started = time.perf_counter()
+                response = send(clients, scenario)
+                elapsed = time.perf_counter() - started
+                if traced:
+                    memory = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                transaction.set_rollback(True)
+            if number < self.options["warmup"] or traced:
+                continue
+            timings.append(elapsed * 1000)
+            statuses.add(response.status_code)
+            queries = max(
+                queries,
+                sum(
+                    not query["sql"].startswith(TRANSACTION_QUERIES)
+                    for query in captured.captured_queries
+                ),
+            )
+        return {
+            "p50_ms": round(statistics.median(timings), 2),
+            "p95_ms": round(percentile(timings, 0.95), 2),
+            "queries": queries,
+            "memory_kb": round(memory / 1024),
+            "status": sorted(statuses),
+        }
+
+    def shared_caches(self, directory):
+        if cache_is_shared():
+            return settings.CACHES
+        self.stdout.write(
+            self.style.WARNING("Кэш процесса заменен файловым (общим) кэшем.")
+        )
+        return {
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": str(Path(directory) / "cache"),
+            }
+        }
+
+    def dataset(self):
+        users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        return {
+            "database": connection.vendor,
+            "users": users.count(),
+            "recipes": Recipe.objects.filter(author__in=users).count(),
+            "favorites": Favorite.objects.filter(user__in=users).count(),
+            "shopping_cart": ShoppingCart.objects.filter(user__in=users).count(),
+            "subscriptions": Subscribe.objects.filter(user__in=users).count(),
+        }
+
+    def regressions(self, result, budget):
+        """Описания превышений бюджета сценарием."""
+        tolerance = 1 + self.options["tolerance"]
+        if result["queries"] > budget["queries"]:
+            yield f"запросов к БД {result['queries']} > {budget['queries']}"
+        # Время сравниваем по медиане: p95 из пары десятков повторов
+        # почти максимум и зависит от случайных пауз. Небольшие абсолютные
+        # колебания не считаем регрессией.
+        if result["p50_ms"] > max(budget["p50_ms"] * tolerance, budget["p50_ms"] + 5):
+            yield f"p50 {result['p50_ms']} мс > {budget['p50_ms']} мс"
+        if result["memory_kb"] > max(
+            budget["memory_kb"] * tolerance, budget["memory_kb"] + 64
+        ):
+            yield f"память {result['memory_kb']} КиБ > {budget['memory_kb']} КиБ"
+
+    def handle(self, *args, **options):
+        self.options = options
+        fixtures = Fixtures()
+        all_scenarios = scenarios(fixtures)
+        self.check_coverage(all_scenarios)
+        selected = [
+            scenario for scenario in all_scenarios if options["only"] in scenario.name
+        ]
+        baseline = (
+            json.loads(options["baseline"].read_text(encoding="utf-8"))
+            if options["baseline"].exists()
+            else {"dataset": {}, "scenarios": {}}
+        )
+        if not options["baseline"].exists() and not options["update_baseline"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Нет базовой линии {options['baseline']}, бюджеты не проверяются."
+                )
+            )
+        dataset = self.dataset()
+        if baseline["dataset"] and baseline["dataset"] != dataset:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Данные отличаются от базовой линии: {dataset} вместо "
+                    f"{baseline['dataset']}, бюджеты могут не подходить."
+                )
+            )
+
+        setup_test_environment()
+        clients = api_clients(fixtures)
+        results, failures = {}, []
+        try:
+            # Загруженные картинки - во временный каталог. Кэш процесса
+            # заменяем общим файловым: кэширующие пути работают, как в бою.
+            with (
+                tempfile.TemporaryDirectory() as media,
+                override_settings(MEDIA_ROOT=media),
+                override_settings(CACHES=self.shared_caches(media)),
+            ):
+                for scenario in selected:
+                    result = results[scenario.name] = self.run(clients, scenario)
+                    problems = []
+                    if result["status"] != [scenario.status]:
+                        problems.append(
+                            f"статус {result['status']} вместо {scenario.status}"
+                        )
+                    if result["queries"] > MAX_QUERIES:
+                        problems.append(
+                            f"запросов к БД {result['queries']} > потолка {MAX_QUERIES}"
+                        )
+                    budget = baseline["scenarios"].get(scenario.name)
+                    if budget and not options["update_baseline"]:
+                        problems += self.regressions(result, budget)
+                    self.report(scenario.name, result, budget, problems)
+                    failures += [f"{scenario.name}: {problem}" for problem in problems]
+        finally:
+            teardown_test_environment()
+
+        if options["output"]:
+            options["output"].write_text(
+                json.dumps(
+                    {"dataset": dataset, "scenarios": results},
+                    ensure_ascii=False,
+                    indent=2,
+                ),
+                encoding="utf-8",
+            )
+        # Прогон с ошибками базовой линией не становится.
+        if options["update_baseline"] and not failures:
+            baseline["dataset"] = dataset
+            for name, result in results.items():
+                baseline["scenarios"][name] = {
+                    key: result[key]
+                    for key in ("p50_ms", "p95_ms", "queries", "memory_kb")
+                }
+            options["baseline"].write_text(
+                json.dumps(baseline, ensure_ascii=False, indent=2, sort_keys=True)
+                + "\n",
+                encoding="utf-8",
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f"Базовая линия обновлена: {options['baseline']}.")
+            )
+        if failures:
+            raise CommandError(f"Регрессии ({len(failures)}):\n" + "\n".join(failures))
+        self.stdout.write(
+            self.style.SUCCESS(f"Сценариев: {len(results)}, бюджеты соблюдены.")
+        )
+
+    def report(self, name, result, budget, problems):
+        budget = budget or {}
+        line = (
+            f"{name:<48} "
+            f"p50 {result['p50_ms']:>8.2f} мс ({budget.get('p50_ms', '-')})  "
+            f"p95 {result['p95_ms']:>8.2f} мс  "
+            f"запросов {result['queries']:>3} ({budget.get('queries', '-')})  "
+            f"память {result['memory_kb']:>6} КиБ"
+        )
+        self.stdout.write(self.style.ERROR(line) if problems else line)
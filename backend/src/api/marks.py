@@ -0,0 +1,101 @@
+from django.db.models import F
+
+from recipes.models import Favorite, Recipe
+
+# Статусы рецептов в ответе пакетных операций с отметками.
+ADDED = "added"
+EXISTS = "exists"
+REMOVED = "removed"
+NOT_MARKED = "not_marked"
+NOT_FOUND = "not_found"
+
+
+def request_marks(request):
+    # DRF Request оборачивает HttpRequest, храним множества на исходном.
+    return getattr(request, "_request", request).__dict__.setdefault(
+        "_recipe_marks", {}
+    )
+
+
+def marked_ids(request, model):
+    """Множество id рецептов, отмеченных пользователем запроса.
+
+    Загружается одним запросом за запрос API: по нему за O(1) проверяют
+    отметку и сериализаторы, и фильтры RecipeFilter. Между запросами не
+    кэшируется: кэш процесса (LocMem) не увидел бы отметок из других
+    воркеров.
+    """
+    marks = request_marks(request)
+    if model not in marks:
+        marks[model] = (
+            frozenset(
+                model.objects.filter(user=request.user).values_list(
+                    "recipe_id", flat=True
+                )
+            )
+            if request.user.is_authenticated
+            else frozenset()
+        )
+    return marks[model]
+
+
+async def amarked_ids(request, model):
+    """Асинхронный вариант marked_ids (для api.async_views)."""
+    marks = request_marks(request)
+    if model not in marks:
+        marks[model] = frozenset(
+            [
+                pk
+                async for pk in model.objects.filter(user=request.user).values_list(
+                    "recipe_id", flat=True
+                )
+            ]
+            if request.user.is_authenticated
+            else ()
+        )
+    return marks[model]
+
+
+def forget_marks(request, model):
+    """Сбрасываем множество отметок запроса после их изменения."""
+    request_marks(request).pop(model, None)
+
+
+def update_marked_recipes(model, recipe_ids):
+    """То же, что сигнал добавления в избранное, одним UPDATE на всю пачку.
+
+    bulk_create сигналов не шлет. При гонке двух запросов счетчик может
+    разойтись на единицу - его правит rebuild_counters.
+    """
+    if model is Favorite and recipe_ids:
+        Recipe.objects.filter(id__in=recipe_ids).update(
+            favorites_count=F("favorites_count") + 1, similarity_outdated=True
+        )
+
+
+def bulk_marks(user, model, recipe_ids, add):
+    """Ставим (add) или снимаем отметку у списка рецептов.
+
+    Возвращаем статус каждого id и найденные рецепты для ответа. Рецепты
+    проверяются и загружаются одним запросом, отметки меняются одним.
+    """
+    recipes = Recipe.objects.only(
+        "id", "name", "image", "image_sizes", "cooking_time"
+    ).in_bulk(recipe_ids)
+    marks = model.objects.filter(user=user, recipe_id__in=list(recipes))
+    marked = set(marks.values_list("recipe_id", flat=True))
+    if add:
+        changed = [recipe_id for recipe_id in recipes if recipe_id not in marked]
+        model.objects.bulk_create(
+            [model(user=user, recipe_id=recipe_id) for recipe_id in changed],
+            ignore_conflicts=True,
+        )
+        update_marked_recipes(model, changed)
+        statuses = dict.fromkeys(changed, ADDED) | dict.fromkeys(marked, EXISTS)
+    else:
+        # Счетчики queryset.delete() обновляет в сигналах одним запросом.
+        marks.delete()
+        statuses = dict.fromkeys(recipes, NOT_MARKED) | dict.fromkeys(marked, REMOVED)
+    return {
+        recipe_id: statuses.get(recipe_id, NOT_FOUND) for recipe_id in recipe_ids
+    }, recipes
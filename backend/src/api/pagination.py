@@ -1,6 +1,115 @@
-from rest_framework.pagination import PageNumberPagination
+from datetime import datetime
+
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination
+
+from api.async_views import PreloadedPage
+from recipes.feed import timeline
+
+
+class KeysetPagination(CursorPagination):
+    """Курсорная пагинация по (pub_date, id) без COUNT(*) и OFFSET."""
+
+    page_size = 6
+    page_size_query_param = "limit"
+    ordering = ("-pub_date", "-id")
 
 
 class Pagination(PageNumberPagination):
+    """Постраничная пагинация.
+
+    С параметром ?cursor= (можно пустым для первой страницы) переключается
+    на курсорную: глубокие страницы стоят столько же, сколько первая.
+    Порядок для курсора вьюсет задает атрибутом cursor_ordering, а
+    параметры со своим порядком (поиск по релевантности, сортировка),
+    с которыми курсор несовместим, - атрибутом cursor_exclusive_params.
+    """
+
     page_size = 6
     page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    keyset_pagination = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        for param in getattr(view, "cursor_exclusive_params", ()):
+            if param in request.query_params:
+                raise ValidationError(
+                    {
+                        self.cursor_query_param: (
+                            f"Курсор нельзя сочетать с параметром {param}: "
+                            "используйте постраничную пагинацию (?page=)."
+                        )
+                    }
+                )
+        self.keyset_pagination = KeysetPagination()
+        self.keyset_pagination.ordering = getattr(
+            view, "cursor_ordering", KeysetPagination.ordering
+        )
+        return self.keyset_pagination.paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request):
+        """Асинхронно загружаем страницу, ответ строит paginate_queryset.
+
+        None - курсор или номер страницы, который разберет синхронный путь.
+        """
+        number = request.query_params.get(self.page_query_param, "1")
+        if self.cursor_query_param in request.query_params or not number.isdigit():
+            return None
+        page_size = self.get_page_size(request)
+        offset = (int(number) - 1) * page_size
+        count = await queryset.acount()
+        if offset < 0 or offset >= max(count, 1):
+            return None
+        objects = [obj async for obj in queryset[offset : offset + page_size]]
+        return self.paginate_queryset(PreloadedPage(objects, count), request)
+
+    def get_paginated_response(self, data):
+        if self.keyset_pagination:
+            return self.keyset_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FeedPagination(CursorPagination):
+    """Курсорная пагинация ленты подписок (только вперед).
+
+    Страница собирается recipes.feed.timeline, курсор - ключ
+    «pub_date|id» последнего рецепта страницы.
+    """
+
+    page_size = 6
+    page_size_query_param = "limit"
+    max_page_size = 100
+    next_position = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        keys = timeline(request.user, self.page_size + 1, self.decode_position())
+        if len(keys) > self.page_size:
+            keys = keys[: self.page_size]
+            self.next_position = "{}|{}".format(keys[-1][0].isoformat(), keys[-1][1])
+        recipes = queryset.in_bulk([pk for _, pk in keys])
+        return [recipes[pk] for _, pk in keys if pk in recipes]
+
+    def decode_position(self):
+        cursor = self.decode_cursor(self.request)
+        if cursor is None:
+            return None
+        try:
+            pub_date, pk = cursor.position.split("|")
+            return datetime.fromisoformat(pub_date), int(pk)
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message) from None
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.next_position)
+        )
+
+    def get_previous_link(self):
+        return None
@@ -1,8 +1,13 @@
 from rest_framework import permissions
 
+from recipes.models import User
+
 
 class IsAuthorOrReadOnly(permissions.IsAuthenticatedOrReadOnly):
-    """Изменение автором."""
+    """Изменение автором (для пользователя - им самим)."""
 
     def has_object_permission(self, request, view, obj):
-        return request.method in permissions.SAFE_METHODS or obj.author == request.user
+        author_id = obj.pk if isinstance(obj, User) else obj.author_id
+        return (
+            request.method in permissions.SAFE_METHODS or author_id == request.user.pk
+        )
@@ -0,0 +1,212 @@
+"""Индекс в памяти для подбора рецептов по имеющимся продуктам."""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from itertools import chain
+
+import numpy as np
+
+from constants import MATCH_LOCAL_TIMEOUT, MATCH_MAX_CHANGES, MATCH_OVERLAY_LIMIT
+from recipes.catalog import (
+    cache_is_shared,
+    get_recipe_changes,
+    get_recipe_changes_sequence,
+)
+from recipes.models import IngredientInRecipe
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+
+def load_rows(recipe_ids=None):
+    """Пары (рецепт, продукт) одним массивом n x 2, по порядку рецептов."""
+    rows = IngredientInRecipe.objects.order_by("recipe_id", "ingredient_id")
+    if recipe_ids is not None:
+        rows = rows.filter(recipe_id__in=recipe_ids)
+    return np.fromiter(
+        chain.from_iterable(
+            rows.values_list("recipe_id", "ingredient_id").iterator(chunk_size=10000)
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+
+@dataclass(frozen=True)
+class MatchIndex:
+    """Составы рецептов в двух CSR-массивах.
+
+    Прямой: позиция рецепта -> его продукты (recipe_offsets,
+    recipe_ingredients). Обратный: продукт -> позиции рецептов
+    (ingredient_ids, offsets, postings), списки отсортированы.
+    """
+
+    recipe_ids: np.ndarray
+    sizes: np.ndarray
+    recipe_offsets: np.ndarray
+    recipe_ingredients: np.ndarray
+    ingredient_ids: np.ndarray
+    offsets: np.ndarray
+    postings: np.ndarray
+
+    @classmethod
+    def build(cls, rows):
+        recipe_ids, positions = np.unique(rows[:, 0], return_inverse=True)
+        sizes = np.bincount(positions, minlength=len(recipe_ids))
+        order = np.argsort(rows[:, 1], kind="stable")
+        ingredient_ids, counts = np.unique(rows[order, 1], return_counts=True)
+        return cls(
+            recipe_ids=recipe_ids,
+            sizes=sizes,
+            recipe_offsets=np.concatenate(([0], np.cumsum(sizes))),
+            recipe_ingredients=rows[:, 1].copy(),
+            ingredient_ids=ingredient_ids,
+            offsets=np.concatenate(([0], np.cumsum(counts))),
+            postings=positions[order].astype(np.int32),
+        )
+
+    def matched_counts(self, query):
+        """Сколько продуктов из query есть в каждом рецепте (bincount)."""
+        found = np.searchsorted(self.ingredient_ids, query)
+        found = found[found < len(self.ingredient_ids)]
+        found = found[np.isin(self.ingredient_ids[found], query)]
+        positions = [
+            self.postings[self.offsets[index] : self.offsets[index + 1]]
+            for index in found
+        ]
+        return np.bincount(
+            np.concatenate(positions) if positions else EMPTY,
+            minlength=len(self.recipe_ids),
+        )
+
+    def ingredients(self, position):
+        return self.recipe_ingredients[
+            self.recipe_offsets[position] : self.recipe_offsets[position + 1]
+        ]
+
+
+@dataclass(frozen=True)
+class MatcherState:
+    """Снимок индекса: основной индекс и поверх него измененные рецепты."""
+
+    base: MatchIndex
+    sequence: int
+    # Рецепт -> его продукты после изменения (пустой массив - удален).
+    overlay: dict = field(default_factory=dict)
+    # Когда построен основной индекс (time.monotonic).
+    built: float = field(default_factory=time.monotonic)
+
+    def expired(self):
+        """Изменения из других процессов без общего кэша не видны."""
+        return (
+            not cache_is_shared()
+            and time.monotonic() - self.built > MATCH_LOCAL_TIMEOUT
+        )
+
+
+class RecipeMatcher:
+    """Подбор рецептов по продуктам с ранжированием по покрытию.
+
+    Покрытие - доля продуктов рецепта, которые есть у пользователя.
+    Основной индекс строится целиком из IngredientInRecipe, изменения
+    рецептов догоняются по журналу recipes.catalog и держатся поверх него,
+    пока их не станет больше MATCH_OVERLAY_LIMIT.
+    """
+
+    def __init__(self):
+        self.state = None
+        self.lock = threading.Lock()
+
+    def rebuild(self):
+        # Номер журнала берем до чтения базы: изменения, попавшие между
+        # ними, будут применены повторно, что безопасно.
+        sequence = get_recipe_changes_sequence()
+        self.state = MatcherState(MatchIndex.build(load_rows()), sequence)
+
+    def apply_changes(self, state, sequence):
+        changed = get_recipe_changes(state.sequence, sequence)
+        if changed is None or len(state.overlay) + len(changed) > MATCH_OVERLAY_LIMIT:
+            return self.rebuild()
+        rows = load_rows(changed)
+        overlay = dict(state.overlay)
+        for recipe_id in changed:
+            overlay[recipe_id] = rows[rows[:, 0] == recipe_id, 1]
+        self.state = MatcherState(state.base, sequence, overlay, state.built)
+
+    def refresh(self):
+        """Догоняем журнал изменений рецептов или перестраиваем индекс."""
+        sequence = get_recipe_changes_sequence()
+        state = self.state
+        if state is not None and state.sequence == sequence and not state.expired():
+            return state
+        with self.lock:
+            state = self.state
+            if (
+                state is None
+                or state.expired()
+                or not (0 <= sequence - state.sequence <= MATCH_MAX_CHANGES)
+            ):
+                self.rebuild()
+            elif state.sequence != sequence:
+                self.apply_changes(state, sequence)
+            return self.state
+
+    def match(self, ingredients, limit, min_coverage=0.0):
+        """Лучшие по покрытию рецепты: [(id, покрытие, есть, всего, нет)].
+
+        При равном покрытии выше рецепт, где совпало больше продуктов,
+        затем более новый (больший id).
+        """
+        state = self.refresh()
+        base = state.base
+        query = np.unique(np.asarray(ingredients, dtype=np.int64))
+        matched = base.matched_counts(query)
+        # Измененные рецепты из основного индекса исключаем.
+        if state.overlay:
+            stale = np.searchsorted(base.recipe_ids, list(state.overlay))
+            stale = stale[stale < len(base.recipe_ids)]
+            matched[stale[np.isin(base.recipe_ids[stale], list(state.overlay))]] = 0
+        coverage = matched / np.maximum(base.sizes, 1)
+        positions = np.flatnonzero((matched > 0) & (coverage >= min_coverage))
+        candidates = [
+            (base.recipe_ids[positions], matched[positions], base.sizes[positions])
+        ]
+        overlay_ingredients = {}
+        for recipe_id, ingredients in state.overlay.items():
+            have = np.isin(ingredients, query).sum()
+            if have and have / len(ingredients) >= min_coverage:
+                overlay_ingredients[recipe_id] = ingredients
+                candidates.append(([recipe_id], [have], [len(ingredients)]))
+        recipe_ids, have, total = (
+            np.concatenate([np.asarray(column, dtype=np.int64) for column in columns])
+            for columns in zip(*candidates, strict=True)
+        )
+        ratio = have / total
+        # Полностью сортируем только рецепты с покрытием не ниже limit-го
+        # по величине (np.partition за линейное время), вместе с равными ему.
+        top = np.arange(len(ratio))
+        if len(ratio) > limit:
+            threshold = np.partition(ratio, len(ratio) - limit)[len(ratio) - limit]
+            top = np.flatnonzero(ratio >= threshold)
+        top = top[np.lexsort((-recipe_ids[top], -have[top], -ratio[top]))][:limit]
+        result = []
+        for index in top:
+            recipe_id = int(recipe_ids[index])
+            if recipe_id in overlay_ingredients:
+                ingredients = overlay_ingredients[recipe_id]
+            else:
+                ingredients = base.ingredients(
+                    np.searchsorted(base.recipe_ids, recipe_id)
+                )
+            result.append(
+                (
+                    recipe_id,
+                    float(ratio[index]),
+                    int(have[index]),
+                    int(total[index]),
+                    np.setdiff1d(ingredients, query).tolist(),
+                )
+            )
+        return result
+
+
+recipe_matcher = RecipeMatcher()
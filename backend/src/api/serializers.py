@@ -1,11 +1,25 @@
 from collections import Counter
 
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
-from constants import MIN_COOKING_MINUTES, MIN_INGREDIENT_AMOUNT
+from api.fields import ImageSizesField, StreamingImageField
+from api.instrumentation import TimedSerializerMixin
+from api.marks import marked_ids
+from constants import (
+    MARKS_BULK_MAX,
+    MATCH_LIMIT_DEFAULT,
+    MATCH_LIMIT_MAX,
+    MATCH_MAX_INGREDIENTS,
+    MIN_COOKING_MINUTES,
+    MIN_INGREDIENT_AMOUNT,
+    PREVIEW_IMAGE_SIZE,
+    RECOMMENDED_LIMIT_DEFAULT,
+    RECOMMENDED_LIMIT_MAX,
+)
+from recipes.images import preview_url
 from recipes.models import (
     Favorite,
     Ingredient,
@@ -15,22 +29,32 @@ from recipes.models import (
     Subscribe,
     Tag,
 )
+from recipes.search import highlights
 
 User = get_user_model()
 
 
-class ExtendedUserSerializer(UserSerializer):
+class ExtendedUserSerializer(TimedSerializerMixin, UserSerializer):
     """Доработанный сериализатор djoser для пользователей."""
 
     is_subscribed = serializers.SerializerMethodField()
-    avatar = Base64ImageField(required=False, allow_null=True)
+    avatar = StreamingImageField(required=False, allow_null=True)
+    avatar_sizes = ImageSizesField()
 
     class Meta:
         model = User
-        fields = (*UserSerializer.Meta.fields, "is_subscribed", "avatar")
+        fields = (
+            *UserSerializer.Meta.fields,
+            "is_subscribed",
+            "avatar",
+            "avatar_sizes",
+        )
         read_only_fields = fields
 
     def get_is_subscribed(self, author):
+        # Для списков флаг заранее аннотирован во вьюсете.
+        if hasattr(author, "is_subscribed"):
+            return author.is_subscribed
         return (
             self.context
             and self.context.get("request").user.is_authenticated
@@ -44,7 +68,7 @@ class SubscribeUserSerializer(ExtendedUserSerializer):
     """Сериализатор для подписки."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(source="recipes.count")
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -52,16 +76,14 @@ class SubscribeUserSerializer(ExtendedUserSerializer):
         read_only_fields = fields
 
     def get_recipes(self, author):
-        return ShortRecipeSerializer(
-            author.recipes.all()[
-                : int(self.context.get("request").GET.get("recipes_limit", 10**10))
-            ],
-            many=True,
-            context=self.context,
-        ).data
+        # Для списка подписок рецепты заранее выбраны во вьюсете.
+        recipes = getattr(author, "short_recipes", None)
+        if recipes is None:
+            recipes = author.recipes.all()[: self.context["recipes_limit"]]
+        return ShortRecipeSerializer(recipes, many=True, context=self.context).data
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для тегов."""
 
     class Meta:
@@ -69,7 +91,7 @@ class TagSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для продуктов."""
 
     class Meta:
@@ -80,7 +102,8 @@ class IngredientSerializer(serializers.ModelSerializer):
 class WriteIngredientInRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор записи для модели связи рецептов и продуктов."""
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    # Продукты проверяет WriteRecipeSerializer одним запросом на весь рецепт.
+    id = serializers.IntegerField(min_value=1)
     amount = serializers.IntegerField(min_value=MIN_INGREDIENT_AMOUNT)
 
     class Meta:
@@ -112,9 +135,12 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class ShortRecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для сокращенного отображения рецептов."""
 
+    # В карточках отдаем превью вместо оригинала, если оно уже построено.
+    image = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = (
@@ -125,8 +151,74 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
         )
         read_only_fields = fields
 
+    def get_image(self, recipe):
+        return preview_url(
+            self.context, recipe.image, recipe.image_sizes, PREVIEW_IMAGE_SIZE
+        )
+
+
+class RecipeMatchQuerySerializer(serializers.Serializer):
+    """Параметры подбора рецептов по продуктам (?ingredients=1,2&limit=)."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=MATCH_MAX_INGREDIENTS,
+        error_messages={"min_length": "Укажите хотя бы один продукт."},
+    )
+    limit = serializers.IntegerField(
+        min_value=1, max_value=MATCH_LIMIT_MAX, default=MATCH_LIMIT_DEFAULT
+    )
+    min_coverage = serializers.FloatField(min_value=0, max_value=1, default=0)
+
+
+class RecipeMatchSerializer(TimedSerializerMixin, serializers.Serializer):
+    """Рецепт в подборе по продуктам: покрытие и недостающие продукты."""
+
+    recipe = ShortRecipeSerializer()
+    coverage = serializers.FloatField()
+    matched = serializers.IntegerField()
+    total = serializers.IntegerField()
+    missing = IngredientSerializer(many=True)
+
+
+class BulkMarkSerializer(serializers.Serializer):
+    """Список рецептов для пакетного добавления/удаления отметки."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=MARKS_BULK_MAX,
+        error_messages={"min_length": "Укажите хотя бы один рецепт."},
+    )
+
+
+class MarkStatusSerializer(TimedSerializerMixin, serializers.Serializer):
+    """Результат пакетной операции с отметкой для одного рецепта."""
+
+    id = serializers.IntegerField()
+    status = serializers.CharField()
+    # None - рецепта нет.
+    recipe = ShortRecipeSerializer(allow_null=True)
 
-class BaseRecipeSerializer(serializers.ModelSerializer):
+
+class RecommendationQuerySerializer(serializers.Serializer):
+    """Параметры похожих и рекомендованных рецептов (?limit=)."""
+
+    limit = serializers.IntegerField(
+        min_value=1, max_value=RECOMMENDED_LIMIT_MAX, default=RECOMMENDED_LIMIT_DEFAULT
+    )
+
+
+class ScoredRecipeSerializer(TimedSerializerMixin, serializers.Serializer):
+    """Похожий или рекомендованный рецепт с оценкой сходства."""
+
+    recipe = ShortRecipeSerializer()
+    # None - рецепт добавлен из популярных, а не по сходству.
+    score = serializers.FloatField(allow_null=True)
+
+
+class BaseRecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Базовый сериализатор рецептов."""
 
     author = ExtendedUserSerializer(read_only=True)
@@ -153,23 +245,31 @@ class GetRecipeSerializer(BaseRecipeSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_sizes = ImageSizesField()
 
     class Meta(BaseRecipeSerializer.Meta):
         fields = [
             *BaseRecipeSerializer.Meta.fields,
+            "image_sizes",
             "ingredients",
             "is_favorited",
             "is_in_shopping_cart",
         ]
         read_only_fields = fields
 
+    def to_representation(self, recipe):
+        data = super().to_representation(recipe)
+        # При поиске добавляем релевантность и подсветку совпадений.
+        if hasattr(recipe, "search_rank"):
+            data["search"] = {
+                "rank": recipe.search_rank,
+                **highlights(recipe, self.context["request"].query_params["search"]),
+            }
+        return data
+
     def get_mark(self, recipe, model):
         request = self.context.get("request")
-        return (
-            request
-            and request.user.is_authenticated
-            and model.objects.filter(user=request.user, recipe=recipe).exists()
-        )
+        return bool(request) and recipe.id in marked_ids(request, model)
 
     def get_is_favorited(self, recipe):
         return self.get_mark(recipe, Favorite)
@@ -178,13 +278,27 @@ class GetRecipeSerializer(BaseRecipeSerializer):
         return self.get_mark(recipe, ShoppingCart)
 
 
+def cache_related(instance, name, objects):
+    """Кладем связанные объекты в кэш prefetch_related, как это делает Django.
+
+    Сериализатор чтения возьмет их оттуда, не обращаясь к БД.
+    """
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    instance.__dict__.setdefault("_prefetched_objects_cache", {})[name] = queryset
+
+
 class WriteRecipeSerializer(BaseRecipeSerializer):
     """Модификация сериализатора для сохранения рецептов."""
 
+    # Теги и продукты проверяются одним запросом на список (in_bulk), а не
+    # запросом на каждый id, как в PrimaryKeyRelatedField.
+    tags = serializers.ListField(child=serializers.IntegerField(min_value=1))
     ingredients = WriteIngredientInRecipeSerializer(
         many=True, source="ingredients_in_recipe"
     )
-    image = Base64ImageField()
+    image = StreamingImageField()
     cooking_time = serializers.IntegerField(min_value=MIN_COOKING_MINUTES)
 
     class Meta(BaseRecipeSerializer.Meta):
@@ -200,15 +314,28 @@ class WriteRecipeSerializer(BaseRecipeSerializer):
             )
         return data
 
+    def load_objects(self, model, ids, name):
+        """Объекты по списку id одним запросом, в порядке ids."""
+        objects = model.objects.in_bulk(ids)
+        missing = [pk for pk in ids if pk not in objects]
+        if missing:
+            raise serializers.ValidationError(f"Не найдены {name}: {missing}.")
+        return [objects[pk] for pk in ids]
+
     def validate_ingredients(self, ingredients):
-        self.check_data([el["id"] for el in ingredients], "продукты")
+        ids = self.check_data([el["id"] for el in ingredients], "продукты")
+        for item, ingredient in zip(
+            ingredients, self.load_objects(Ingredient, ids, "продукты"), strict=True
+        ):
+            item["id"] = ingredient
         return ingredients
 
     def validate_tags(self, tags):
-        return self.check_data(tags, "теги")
+        return self.load_objects(Tag, self.check_data(tags, "теги"), "теги")
 
     def validate(self, data):
-        if data["image"] is None:
+        # При PATCH картинку можно не передавать.
+        if "image" in data and data["image"] is None:
             raise serializers.ValidationError("В рецепте должна быть картинка.")
         if "tags" not in data or data["tags"] is None:
             raise serializers.ValidationError("В рецепте должны быть теги.")
@@ -216,23 +343,64 @@ class WriteRecipeSerializer(BaseRecipeSerializer):
 
     def fill_ingredients(self, recipe, ingredients):
         """Заполняем ингредиенты в рецепт."""
-        IngredientInRecipe.objects.bulk_create(
+        return IngredientInRecipe.objects.bulk_create(
             IngredientInRecipe(
                 recipe=recipe, ingredient=ingredient["id"], amount=ingredient["amount"]
             )
             for ingredient in ingredients
         )
 
+    def update_ingredients(self, recipe, ingredients):
+        """Меняем состав по разнице со старым.
+
+        Новые продукты добавляем, у оставшихся правим меру, если она
+        изменилась, лишние удаляем - не больше трех запросов.
+        """
+        rows = {
+            row.ingredient_id: row
+            for row in IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+        items = {item["id"].id: item for item in ingredients}
+        removed = rows.keys() - items.keys()
+        if removed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, item in items.items():
+            row = rows.get(ingredient_id)
+            if row is not None and row.amount != item["amount"]:
+                row.amount = item["amount"]
+                changed.append(row)
+        IngredientInRecipe.objects.bulk_update(changed, ["amount"])
+        added = self.fill_ingredients(
+            recipe, [item for pk, item in items.items() if pk not in rows]
+        )
+        kept = [row for pk, row in rows.items() if pk in items]
+        for row in kept:
+            row.ingredient = items[row.ingredient_id]["id"]
+        return kept + added
+
+    def remember_related(self, tags, rows):
+        """Запоминаем записанные теги и продукты для ответа."""
+        self.written_related = (
+            sorted(tags, key=lambda tag: tag.name),
+            sorted(rows, key=lambda row: row.ingredient.name),
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
         # Создаем рецепт.
         ingredients = validated_data.pop("ingredients_in_recipe")
         tags = validated_data.pop("tags")
         recipe = super().create(validated_data)
-        self.fill_ingredients(recipe, ingredients)
+        rows = self.fill_ingredients(recipe, ingredients)
         # Устанавливаем связи с тегами.
         recipe.tags.set(tags)
+        self.remember_related(tags, rows)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         # После удаления проверки 'ingredients_in_recipe' в def validate
         # запрос patch на обновление рецепта без ингредиентов дает ошибку 500.
@@ -241,11 +409,21 @@ class WriteRecipeSerializer(BaseRecipeSerializer):
             raise serializers.ValidationError("В рецепте должны быть ингредиенты.")
         ingredients = validated_data.pop("ingredients_in_recipe")
         tags = validated_data.pop("tags")
-        # Устанавливаем новые теги и перезаписываем продукты.
+        # Теги и продукты меняем по разнице со старыми.
         instance.tags.set(tags)
-        instance.ingredients_in_recipe.all().delete()
-        self.fill_ingredients(recipe=instance, ingredients=ingredients)
+        rows = self.update_ingredients(instance, ingredients)
+        self.remember_related(tags, rows)
         return super().update(instance=instance, validated_data=validated_data)
 
     def to_representation(self, instance):
-        return GetRecipeSerializer(instance).to_representation(instance)
+        # Ответ собираем из уже загруженных объектов. Кэш prefetch кладем
+        # здесь: UpdateModelMixin сбрасывает его после сохранения.
+        written = getattr(self, "written_related", None)
+        if written is not None:
+            cache_related(instance, "tags", written[0])
+            cache_related(instance, "ingredients_in_recipe", written[1])
+            # Писать рецепт может только автор, а на себя подписаться нельзя.
+            instance.author.is_subscribed = False
+        return GetRecipeSerializer(instance, context=self.context).to_representation(
+            instance
+        )
@@ -1,39 +1,85 @@
-import locale
-from datetime import datetime
+import csv
+import json
 
-from constants import header_layout, products_layout, recipes_layout
+from django.utils import timezone
 
+from constants import MONTHS, header_layout, products_layout, recipes_layout
 
-def shopping_list_render(recipes, products):
-    """Получает сеты рецептов и продуктов и возвращает список покупок."""
 
-    original_locale = locale.getlocale(locale.LC_ALL)
+def format_date(date):
+    """Дата по-русски без process-global setlocale (потокобезопасно)."""
+    return f"{date:%d} {MONTHS[date.month - 1]} {date.year}"
 
-    try:
-        locale.setlocale(locale.LC_ALL, "ru_RU.utf8")
 
-        shopping_list = "\n".join(
+def render_txt(recipes, products):
+    """Построчно отдает список покупок в виде текста."""
+    yield header_layout.format(format_date(timezone.localdate())) + "\n"
+    yield "ПРОДУКТЫ:\n"
+    for number, position in enumerate(products, start=1):
+        yield (
+            products_layout.format(
+                number,
+                position["product"].capitalize(),
+                position["unit"],
+                position["amount"],
+            )
+            + "\n"
+        )
+    yield "ДЛЯ РЕЦЕПТОВ:\n"
+    for name, author in recipes:
+        yield recipes_layout.format(name, author) + "\n"
+
+
+class Echo:
+    """Псевдобуфер: csv.writer сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(recipes, products):
+    """Построчно отдает список покупок в формате CSV."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(["№", "Продукт", "Единица измерения", "Количество"])
+    for number, position in enumerate(products, start=1):
+        yield writer.writerow(
             [
-                header_layout.format(datetime.now().date().strftime("%d %B %Y")),
-                "ПРОДУКТЫ:",
-                *[
-                    products_layout.format(
-                        number,
-                        position["product"].capitalize(),
-                        position["unit"],
-                        position["amount"],
-                    )
-                    for number, position in enumerate(products, start=1)
-                ],
-                "ДЛЯ РЕЦЕПТОВ:",
-                *[
-                    recipes_layout.format(recipe.name, recipe.author.username)
-                    for recipe in recipes
-                ],
+                number,
+                position["product"].capitalize(),
+                position["unit"],
+                position["amount"],
             ]
         )
-        return shopping_list
+    yield writer.writerow([])
+    yield writer.writerow(["Рецепт", "Автор"])
+    for name, author in recipes:
+        yield writer.writerow([name, author])
+
+
+def render_json(recipes, products):
+    """Отдает список покупок JSON-документом по одному элементу."""
+    dumps = json.dumps
+    yield '{"date": %s, "products": [' % dumps(timezone.localdate().isoformat())
+    for number, position in enumerate(products):
+        yield ("," if number else "") + dumps(
+            {
+                "name": position["product"],
+                "measurement_unit": position["unit"],
+                "amount": position["amount"],
+            },
+            ensure_ascii=False,
+        )
+    yield '], "recipes": ['
+    for number, (name, author) in enumerate(recipes):
+        yield ("," if number else "") + dumps(
+            {"name": name, "author": author}, ensure_ascii=False
+        )
+    yield "]}"
+
 
-    finally:
-        # 3. Восстанавливаем исходные настройки локали.
-        locale.setlocale(locale.LC_ALL, original_locale)
+# Формат выгрузки -> (генератор, content type).
+SHOPPING_LIST_RENDERERS = {
+    "txt": (render_txt, "text/plain; charset=utf-8"),
+    "csv": (render_csv, "text/csv; charset=utf-8"),
+    "json": (render_json, "application/json"),
+}
@@ -0,0 +1,484 @@
+import base64
+import io
+import tempfile
+import textwrap
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import path, reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase
+
+from api.fields import StreamingImageField
+from api.recipe_matcher import recipe_matcher
+from api.views import RecipeViewSet
+from constants import MATCH_LOCAL_TIMEOUT
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    ShoppingCart,
+    Subscribe,
+    Tag,
+    User,
+)
+from recipes.search import reindex_recipes
+
+RECIPES = 8
+FILE_CACHE = "django.core.cache.backends.filebased.FileBasedCache"
+
+# Маршруты, собранные как под ASGI (ASYNC_VIEWS).
+with override_settings(ASYNC_VIEWS=True):
+    urlpatterns = [
+        path(
+            "download/",
+            RecipeViewSet.as_view(
+                {"get": "download_shopping_cart"},
+                **RecipeViewSet.download_shopping_cart.kwargs,
+            ),
+        ),
+        path("recipes/", RecipeViewSet.as_view({"get": "list"})),
+        path("recipes/<pk>/", RecipeViewSet.as_view({"get": "retrieve"})),
+    ]
+
+
+def create_user(name):
+    return User.objects.create_user(
+        username=name, email=f"{name}@example.com", first_name=name, last_name=name
+    )
+
+
+def create_recipes(authors, count=RECIPES):
+    """Рецепты с тегами и продуктами у авторов по очереди."""
+    tags = [
+        Tag.objects.get_or_create(name=f"Тег {i}", slug=f"tag-{i}")[0] for i in range(2)
+    ]
+    ingredients = [
+        Ingredient.objects.get_or_create(name=f"Продукт {i}", measurement_unit="г")[0]
+        for i in range(3)
+    ]
+    recipes = []
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            author=authors[number % len(authors)],
+            name=f"Рецепт {number}",
+            image="recipe_images/test.jpg",
+            text="Описание",
+            cooking_time=10,
+        )
+        recipe.tags.set(tags)
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=5)
+            for ingredient in ingredients
+        )
+        recipes.append(recipe)
+    return recipes
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user("reader")
+        authors = [create_user("author_1"), create_user("author_2")]
+        recipes = create_recipes(authors)
+        Subscribe.objects.create(user=cls.reader, subscribed=authors[0])
+        Favorite.objects.create(user=cls.reader, recipe=recipes[0])
+        ShoppingCart.objects.create(user=cls.reader, recipe=recipes[1])
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_list_queries(self, expected):
+        for limit in (2, RECIPES):
+            with self.subTest(limit=limit), self.assertNumQueries(expected):
+                response = self.client.get(reverse("recipes-list"), {"limit": limit})
+            self.assertEqual(len(response.data["results"]), limit)
+
+    def test_anonymous(self):
+        # COUNT, рецепты, авторы, теги, продукты.
+        self.assert_list_queries(5)
+
+    def test_authenticated(self):
+        # Плюс токен и множества отметок (избранное, корзина); подписки -
+        # в запросе авторов.
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.assert_list_queries(8)
+
+    def test_mark_filter(self):
+        # Фильтр и флаги отметок берут одно множество из запроса.
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        with self.assertNumQueries(8):
+            response = self.client.get(reverse("recipes-list"), {"is_favorited": 1})
+        recipes = response.data["results"]
+        self.assertEqual(len(recipes), 1)
+        self.assertTrue(recipes[0]["is_favorited"])
+        self.assertFalse(recipes[0]["is_in_shopping_cart"])
+
+
+class BulkFavoriteTest(APITestCase):
+    """Пакетные отметки меняют счетчики избранного."""
+
+    def setUp(self):
+        self.reader = create_user("reader")
+        self.recipes = create_recipes([create_user("author")], count=3)
+        self.client.force_authenticate(self.reader)
+
+    def assert_favorites_count(self, expected):
+        self.assertEqual(
+            list(
+                Recipe.objects.order_by("id").values_list("favorites_count", flat=True)
+            ),
+            expected,
+        )
+
+    def test_add_and_remove(self):
+        url = reverse("recipes-favorite-bulk")
+        ids = [recipe.id for recipe in self.recipes[:2]]
+        self.client.post(url, {"recipes": ids}, format="json")
+        self.assert_favorites_count([1, 1, 0])
+        response = self.client.delete(url, {"recipes": ids}, format="json")
+        self.assertEqual(
+            [item["status"] for item in response.data], ["removed", "removed"]
+        )
+        self.assert_favorites_count([0, 0, 0])
+        self.assertFalse(Favorite.objects.exists())
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncDownloadTest(APITestCase):
+    """Под ASGI список покупок отдается потоком, а не собирается в память."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user("reader")
+        recipes = create_recipes([create_user("author")], count=2)
+        for recipe in recipes:
+            ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+        cls.token = Token.objects.create(user=cls.reader)
+
+    async def test_streaming(self):
+        response = await self.async_client.get(
+            "/download/",
+            {"format": "csv"},
+            headers={"Authorization": f"Token {self.token.key}"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertIn("Продукт 0".encode(), content)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncMarksTest(APITestCase):
+    """Под ASGI отметки берутся из множеств, загруженных асинхронно."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user("reader")
+        cls.recipes = create_recipes([create_user("author")], count=2)
+        Favorite.objects.create(user=cls.reader, recipe=cls.recipes[0])
+        cls.token = Token.objects.create(user=cls.reader)
+
+    async def get(self, url, params=None):
+        response = await self.async_client.get(
+            url, params, headers={"Authorization": f"Token {self.token.key}"}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    async def test_list(self):
+        data = await self.get("/recipes/", {"is_favorited": 1})
+        self.assertEqual(
+            [(recipe["id"], recipe["is_favorited"]) for recipe in data["results"]],
+            [(self.recipes[0].id, True)],
+        )
+
+    async def test_retrieve(self):
+        data = await self.get(f"/recipes/{self.recipes[0].id}/")
+        self.assertTrue(data["is_favorited"])
+        self.assertFalse(data["is_in_shopping_cart"])
+
+
+class CatalogCacheTest(APITestCase):
+    """Ответы справочников кэшируются только в общем для воркеров кэше."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name="Тег", slug="tag")
+
+    def assert_repeat_queries(self, expected):
+        self.client.get(reverse("tag-list"))
+        with self.assertNumQueries(expected):
+            self.client.get(reverse("tag-list"))
+
+    def test_process_cache(self):
+        self.assert_repeat_queries(1)
+
+    def test_shared_cache(self):
+        with (
+            tempfile.TemporaryDirectory() as location,
+            override_settings(
+                CACHES={"default": {"BACKEND": FILE_CACHE, "LOCATION": location}}
+            ),
+        ):
+            self.assert_repeat_queries(0)
+
+
+class MetricsTest(APITestCase):
+    """/metrics закрыт без токена и отдает замеры с ним."""
+
+    def test_without_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+
+    @override_settings(METRICS_TOKEN="secret")  # noqa: S106
+    def test_wrong_token(self):
+        response = self.client.get(
+            reverse("metrics"), headers={"Authorization": "Bearer wrong"}
+        )
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN="secret", INSTRUMENTATION_SAMPLE_RATE=1)  # noqa: S106
+    def test_serializer_timing(self):
+        Tag.objects.create(name="Тег", slug="tag")
+        timing = self.client.get(reverse("tag-list"))["Server-Timing"]
+        self.assertIn("serialize;dur=", timing)
+        response = self.client.get(
+            reverse("metrics"), headers={"Authorization": "Bearer secret"}
+        )
+        self.assertEqual(response.status_code, 200)
+        # Время сериализации списка тегов засчитано.
+        values = dict(
+            line.rsplit(" ", 1)
+            for line in response.content.decode().splitlines()
+            if not line.startswith("#")
+        )
+        self.assertGreater(
+            float(values['foodgram_serialize_seconds_total{view="tag-list"}']), 0
+        )
+
+
+class IngredientSearchTest(APITestCase):
+    """Автодополнение продуктов по индексу в памяти."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ("ванильный сахар", "сахарная пудра", "соль", "сахар"):
+            Ingredient.objects.create(name=name, measurement_unit="г")
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, name):
+        response = self.client.get(reverse("ingredient-list"), {"name": name})
+        return [item["name"] for item in response.data]
+
+    def test_prefix_before_substring(self):
+        self.assertEqual(
+            self.search("Сахар"), ["сахар", "сахарная пудра", "ванильный сахар"]
+        )
+
+    def test_typo(self):
+        self.assertEqual(self.search("сохар"), ["сахар", "сахарная пудра"])
+        # Совпадения по началу отменяют поиск опечаток.
+        self.assertEqual(self.search("со"), ["соль"])
+
+    def test_catalog_change(self):
+        self.assertEqual(self.search("перец"), [])
+        Ingredient.objects.create(name="перец", measurement_unit="г")
+        self.assertEqual(self.search("перец"), ["перец"])
+
+    def test_other_process_change(self):
+        self.search("соль")
+        # Изменение в другом процессе: версия в его кэше, а не в нашем.
+        Ingredient.objects.bulk_create([Ingredient(name="солод", measurement_unit="г")])
+        self.assertEqual(self.search("сол"), ["соль"])
+        later = time.monotonic() + MATCH_LOCAL_TIMEOUT + 1
+        with mock.patch("api.ingredient_index.time.monotonic", return_value=later):
+            self.assertEqual(self.search("сол"), ["солод", "соль"])
+
+
+def image_bytes(size=(2, 2), mode="RGB"):
+    buffer = io.BytesIO()
+    Image.new(mode, size).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class StreamingImageFieldTest(SimpleTestCase):
+    """Картинка base64: переносы строк, пределы размера и числа пикселей."""
+
+    def decode(self, content, width=None):
+        encoded = base64.b64encode(content).decode()
+        if width:
+            encoded = "\n".join(textwrap.wrap(encoded, width))
+        return StreamingImageField().to_internal_value(
+            f"data:image/png;base64,{encoded}"
+        )
+
+    def assert_rejected(self, content, code):
+        with self.assertRaises(ValidationError) as context:
+            self.decode(content)
+        self.assertEqual(context.exception.get_codes(), [code])
+
+    # Порции не кратны строкам: остаток переходит в следующую порцию.
+    @mock.patch("api.fields.BASE64_CHUNK_SIZE", 1001)
+    def test_wrapped_lines(self):
+        content = image_bytes((40, 40), "L") + b"\0" * 1000
+        for width in (None, 76, 75):
+            with self.subTest(width=width):
+                file = self.decode(content, width)
+                self.assertEqual(file.read(), content)
+                self.assertTrue(file.name.endswith(".png"))
+
+    def test_invalid_base64(self):
+        with self.assertRaises(ValidationError) as context:
+            StreamingImageField().to_internal_value("data:image/png;base64,@@@@")
+        self.assertEqual(context.exception.get_codes(), ["invalid_base64"])
+
+    def test_too_large(self):
+        content = image_bytes() + b"\0" * 2000
+        with mock.patch("api.fields.IMAGE_UPLOAD_MAX_BYTES", 1000):
+            self.assert_rejected(content, "too_large")
+
+    def test_too_many_pixels(self):
+        # Несколько КиБ PNG, которые распаковываются в 56 млн пикселей.
+        self.assert_rejected(image_bytes((8000, 7000), "1"), "too_many_pixels")
+
+
+class RecipeSearchTest(APITestCase):
+    """?search=: рецепты по релевантности, курсор с поиском не сочетается."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user("author")
+        texts = [
+            ("Салат", "Огурцы и помидоры."),
+            ("Борщ", "Свекла, капуста и картофель."),
+            ("Суп", "Как борщ, но без свеклы."),
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author,
+                name=name,
+                text=text,
+                image="recipe_images/test.jpg",
+                cooking_time=10,
+            )
+            for name, text in texts
+        ]
+        reindex_recipes([recipe.id for recipe in cls.recipes])
+
+    def test_ranked(self):
+        response = self.client.get(reverse("recipes-list"), {"search": "борщ"})
+        results = response.data["results"]
+        # Совпадение в названии весит больше, чем в описании.
+        self.assertEqual([recipe["name"] for recipe in results], ["Борщ", "Суп"])
+        self.assertGreater(results[0]["search"]["rank"], results[1]["search"]["rank"])
+
+    def test_cursor(self):
+        url = reverse("recipes-list")
+        for params in ({"search": "борщ"}, {"ordering": "-popularity"}):
+            with self.subTest(params=params):
+                response = self.client.get(url, {**params, "cursor": ""})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("cursor", response.data)
+        response = self.client.get(url, {"cursor": ""})
+        self.assertEqual(
+            [recipe["name"] for recipe in response.data["results"]],
+            ["Суп", "Борщ", "Салат"],
+        )
+
+
+class RecipeMatchTest(APITestCase):
+    """Подбор рецептов по продуктам: порядок, недостающие, изменения."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user("author")
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("яйца", "молоко", "мука", "сахар")
+        ]
+        eggs, milk, flour, sugar = cls.ingredients
+        cls.omelette = cls.create_recipe("Омлет", [eggs, milk])
+        cls.pie = cls.create_recipe("Пирог", [eggs, milk, flour, sugar])
+        cls.cookies = cls.create_recipe("Печенье", [flour])
+
+    @classmethod
+    def create_recipe(cls, name, ingredients):
+        recipe = Recipe.objects.create(
+            author=cls.author,
+            name=name,
+            text="Описание",
+            image="recipe_images/test.jpg",
+            cooking_time=10,
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        return recipe
+
+    def setUp(self):
+        cache.clear()
+        # Индекс общий для процесса: строим заново по данным теста.
+        recipe_matcher.state = None
+
+    def match(self, *ingredients):
+        response = self.client.get(
+            reverse("recipes-match"),
+            {"ingredients": ",".join(str(item.id) for item in ingredients)},
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (
+                item["recipe"]["name"],
+                item["coverage"],
+                [missing["name"] for missing in item["missing"]],
+            )
+            for item in response.data
+        ]
+
+    def test_coverage_order(self):
+        eggs, milk, flour, _ = self.ingredients
+        self.assertEqual(
+            self.match(eggs, milk),
+            [("Омлет", 1.0, []), ("Пирог", 0.5, ["мука", "сахар"])],
+        )
+        # При равном покрытии выше рецепт с большим числом совпадений.
+        self.assertEqual(
+            [name for name, *_ in self.match(eggs, flour)],
+            ["Печенье", "Пирог", "Омлет"],
+        )
+        self.assertEqual(
+            [name for name, *_ in self.match(eggs, milk, flour)],
+            ["Омлет", "Печенье", "Пирог"],
+        )
+
+    def test_recipe_edit(self):
+        eggs, milk, flour, sugar = self.ingredients
+        self.assertEqual(
+            self.match(sugar), [("Пирог", 0.25, ["яйца", "молоко", "мука"])]
+        )
+        # Превью картинок (фоновый поток) этому тесту не нужны.
+        with (
+            mock.patch("recipes.signals.schedule_derivatives"),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            IngredientInRecipe.objects.create(
+                recipe=self.cookies, ingredient=sugar, amount=1
+            )
+            self.cookies.save()
+            self.omelette.delete()
+        self.assertEqual(
+            self.match(sugar),
+            [("Печенье", 0.5, ["мука"]), ("Пирог", 0.25, ["яйца", "молоко", "мука"])],
+        )
+        self.assertEqual([name for name, *_ in self.match(eggs, milk)], ["Пирог"])
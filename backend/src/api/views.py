@@ -1,5 +1,6 @@
-from django.db.models import F, Sum
-from django.http import FileResponse, HttpResponseBadRequest
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Sum, Value
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
@@ -7,23 +8,48 @@ from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
+from rest_framework.fields import IntegerField
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from api.filters import IngredientFilter, RecipeFilter
+from api.async_views import AsyncReadMixin, drf_request, json_response
+from api.caching import CatalogCacheMixin
+from api.filters import (
+    ASYNC_RECIPE_PARAMS,
+    IngredientFilter,
+    RecipeFilter,
+    afilter_recipes,
+)
+from api.ingredient_index import ingredient_index
+from api.marks import amarked_ids, bulk_marks, forget_marks
+from api.negotiation import IgnoreFormatContentNegotiation
+from api.pagination import FeedPagination
 from api.permissions import IsAuthorOrReadOnly
+from api.recipe_matcher import recipe_matcher
 from api.serializers import (
+    BulkMarkSerializer,
     ExtendedUserSerializer,
     GetRecipeSerializer,
     IngredientSerializer,
+    MarkStatusSerializer,
+    RecipeMatchQuerySerializer,
+    RecipeMatchSerializer,
+    RecommendationQuerySerializer,
+    ScoredRecipeSerializer,
     ShortRecipeSerializer,
     SubscribeUserSerializer,
     TagSerializer,
     WriteRecipeSerializer,
 )
-from api.service import shopping_list_render
-from constants import SHOPPING_CART_FILENAME
+from api.service import SHOPPING_LIST_RENDERERS
+from constants import (
+    RECIPES_LIMIT_DEFAULT,
+    RECIPES_LIMIT_MAX,
+    SHOPPING_CART_CHUNK_SIZE,
+    SHOPPING_CART_FILENAME,
+)
+from recipes.links import short_code
 from recipes.models import (
     Favorite,
     Ingredient,
@@ -34,12 +60,41 @@ from recipes.models import (
     Tag,
     User,
 )
+from recipes.similarity import recommended_recipes, similar_recipes
+
+
+def get_recipes_limit(request):
+    """Строгий разбор ?recipes_limit= для списка рецептов автора."""
+    value = request.query_params.get("recipes_limit")
+    if value is None:
+        return RECIPES_LIMIT_DEFAULT
+    try:
+        return IntegerField(min_value=0, max_value=RECIPES_LIMIT_MAX).run_validation(
+            value
+        )
+    except ValidationError as error:
+        raise ValidationError({"recipes_limit": error.detail}) from None
 
 
 class ExtendedUserViewSet(UserViewSet):
     """Расширение вьюсета пользователя djoser для работы с подпиской."""
 
     permission_classes = [IsAuthorOrReadOnly]
+    # Порядок для курсорной пагинации (?cursor=).
+    cursor_ordering = ("username",)
+
+    def get_queryset(self):
+        users = super().get_queryset()
+        if self.request.user.is_authenticated:
+            # Флаг подписки одним подзапросом вместо запроса на каждую строку.
+            users = users.annotate(
+                is_subscribed=Exists(
+                    Subscribe.objects.filter(
+                        user=self.request.user, subscribed=OuterRef("pk")
+                    )
+                )
+            )
+        return users
 
     @action(
         ["get", "put", "patch", "delete"],
@@ -50,38 +105,67 @@ class ExtendedUserViewSet(UserViewSet):
         return super().me(request)
 
     @action(["post", "delete"], detail=True)
-    def subscribe(self, request, pk=None):
+    @transaction.atomic
+    def subscribe(self, request, id=None):
         """Подписка и отписка от пользователя."""
         user = self.request.user
 
         if request.method == "DELETE":
             # Отписываемся от пользователя.
-            subscription = get_object_or_404(Subscribe, user=user, subscribed_id=pk)
+            subscription = get_object_or_404(Subscribe, user=user, subscribed_id=id)
             subscription.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         # Далее логика для POST
-        author = get_object_or_404(User, id=pk)
+        author = get_object_or_404(User, id=id)
 
         if author == user:
             raise ValidationError({"detail": "Запрещена подписка на себя."})
 
+        recipes_limit = get_recipes_limit(request)
         _, created = Subscribe.objects.get_or_create(user=user, subscribed=author)
         if not created:
             raise ValidationError({"detail": f"Подписка на {author} уже есть."})
+        author.is_subscribed = True
 
         return Response(
-            SubscribeUserSerializer(author, context={"request": request}).data,
+            SubscribeUserSerializer(
+                author, context={"request": request, "recipes_limit": recipes_limit}
+            ).data,
             status=status.HTTP_201_CREATED,
         )
 
-    @action(["get"], detail=False)
+    @action(["get"], detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request, *args, **kwargs):
         """Список юзеров, на которых подписан автор запроса, (с рецептами)."""
-        queryset = User.objects.filter(authors__user=self.request.user)
+        recipes_limit = get_recipes_limit(request)
+        # Рецепты всех авторов страницы - одним запросом с ROW_NUMBER()
+        # по автору (срез в Prefetch), не больше recipes_limit на автора.
+        queryset = (
+            User.objects.filter(authors__user=self.request.user)
+            .annotate(is_subscribed=Value(True))
+            .prefetch_related(
+                Prefetch(
+                    "recipes",
+                    queryset=Recipe.objects.only(
+                        "id",
+                        "author_id",
+                        "name",
+                        "image",
+                        "image_sizes",
+                        "cooking_time",
+                    ).order_by("-pub_date", "-id")[:recipes_limit],
+                    to_attr="short_recipes",
+                )
+            )
+        )
         page = self.paginate_queryset(queryset)
         return self.get_paginated_response(
-            SubscribeUserSerializer(page, many=True, context={"request": request}).data
+            SubscribeUserSerializer(
+                page,
+                many=True,
+                context={"request": request, "recipes_limit": recipes_limit},
+            ).data
         )
 
     @action(["put", "delete"], detail=False, url_path=r"me/avatar")
@@ -108,7 +192,7 @@ class ExtendedUserViewSet(UserViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(AsyncReadMixin, CatalogCacheMixin, ReadOnlyModelViewSet):
     """Вьюсет для получения тегов."""
 
     queryset = Tag.objects.all()
@@ -117,7 +201,7 @@ class TagViewSet(ReadOnlyModelViewSet):
     pagination_class = None
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(AsyncReadMixin, CatalogCacheMixin, ReadOnlyModelViewSet):
     """Вьюсет для получения продуктов."""
 
     queryset = Ingredient.objects.all()
@@ -127,30 +211,92 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        if "name" not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(self.search, request)
+
+    def search(self, request):
+        # Автодополнение по названию обслуживает индекс в памяти, без БД.
+        return Response(ingredient_index.search(request.query_params["name"]))
 
-class RecipeViewSet(ModelViewSet):
+
+class RecipeViewSet(AsyncReadMixin, ModelViewSet):
     """Вьюсет рецептов."""
 
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    # Курсор упорядочивает по дате и отменил бы порядок этих параметров.
+    cursor_exclusive_params = ("search", "ordering")
+    streaming_actions = ("download_shopping_cart",)
+
+    @classmethod
+    async def arecipes_response(cls, request, recipes, many):
+        """Сериализуем рецепты, загруженные асинхронно (api.async_views)."""
+        # Сериализатор читает отметки синхронно: загружаем их заранее.
+        for model in (Favorite, ShoppingCart):
+            await amarked_ids(request, model)
+        context = {"request": request}
+        if not many:
+            return json_response(GetRecipeSerializer(recipes, context=context).data)
+        paginator = cls.pagination_class()
+        page = await paginator.apaginate_queryset(recipes, request)
+        if page is None:
+            return None
+        data = GetRecipeSerializer(page, many=True, context=context).data
+        return json_response(paginator.get_paginated_response(data).data)
+
+    @classmethod
+    async def async_list(cls, request, *args, **kwargs):
+        if not ASYNC_RECIPE_PARAMS.issuperset(request.GET):
+            return None
+        request = await drf_request(request)
+        if request is None:
+            return None
+        recipes = await afilter_recipes(request, cls.queryset.all())
+        if recipes is None:
+            return None
+        return await cls.arecipes_response(
+            request, recipes.with_related(request.user), many=True
+        )
+
+    @classmethod
+    async def async_retrieve(cls, request, pk, *args, **kwargs):
+        request = await drf_request(request) if pk.isdigit() else None
+        if request is None or request.query_params:
+            return None
+        recipe = await cls.queryset.with_related(request.user).filter(pk=pk).afirst()
+        if recipe is None:
+            return None
+        return await cls.arecipes_response(request, recipe, many=False)
+
+    def get_queryset(self):
+        recipes = super().get_queryset()
+        if self.action in ["list", "retrieve", "feed"]:
+            return recipes.with_related(self.request.user)
+        if self.action in ["update", "partial_update"]:
+            # Автор нужен для ответа, остальное сериализатор уже загрузил.
+            return recipes.select_related("author")
+        return recipes
 
     def get_serializer_class(self, *args, **kwargs):
         # Для показа рецептов используем отдельный сериализатор.
-        if self.action in ["list", "retrieve"]:
+        if self.action in ["list", "retrieve", "feed"]:
             return GetRecipeSerializer
         return WriteRecipeSerializer
 
     def perform_create(self, serializer):
         return serializer.save(author=self.request.user)
 
+    @transaction.atomic
     def add_recipe_mark(self, recipe_id, model):
         """Добавляем к рецепту отметку избранное/корзина."""
 
-        _, created = model.objects.get_or_create(
-            user=self.request.user, recipe_id=recipe_id
-        )
+        recipe = get_object_or_404(Recipe, id=recipe_id)
+        _, created = model.objects.get_or_create(user=self.request.user, recipe=recipe)
+        forget_marks(self.request, model)
 
         if not created:
             raise ValidationError(
@@ -162,14 +308,15 @@ class RecipeViewSet(ModelViewSet):
                 }
             )
 
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-
         return Response(
-            ShortRecipeSerializer(recipe).data, status=status.HTTP_201_CREATED
+            ShortRecipeSerializer(recipe, context={"request": self.request}).data,
+            status=status.HTTP_201_CREATED,
         )
 
+    @transaction.atomic
     def delete_recipe_mark(self, recipe_id, model):
         get_object_or_404(model, user=self.request.user, recipe_id=recipe_id).delete()
+        forget_marks(self.request, model)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(methods=["post", "delete"], detail=True)
@@ -185,6 +332,139 @@ class RecipeViewSet(ModelViewSet):
             return self.add_recipe_mark(recipe_id=pk, model=ShoppingCart)
         return self.delete_recipe_mark(recipe_id=pk, model=ShoppingCart)
 
+    @transaction.atomic
+    def bulk_recipe_marks(self, request, model):
+        """Ставим или снимаем отметку сразу у списка рецептов."""
+        serializer = BulkMarkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data["recipes"]))
+        statuses, recipes = bulk_marks(
+            request.user, model, recipe_ids, add=request.method == "POST"
+        )
+        forget_marks(request, model)
+        return Response(
+            MarkStatusSerializer(
+                [
+                    {
+                        "id": recipe_id,
+                        "status": statuses[recipe_id],
+                        "recipe": recipes.get(recipe_id),
+                    }
+                    for recipe_id in recipe_ids
+                ],
+                many=True,
+                context={"request": request},
+            ).data
+        )
+
+    @action(
+        methods=["post", "delete"],
+        detail=False,
+        url_path="favorite",
+        url_name="favorite-bulk",
+        permission_classes=[IsAuthenticated],
+    )
+    def bulk_favorite(self, request):
+        """Пакетное добавление в избранное и удаление из него."""
+        return self.bulk_recipe_marks(request, Favorite)
+
+    @action(
+        methods=["post", "delete"],
+        detail=False,
+        url_path="shopping_cart",
+        url_name="shopping-cart-bulk",
+        permission_classes=[IsAuthenticated],
+    )
+    def bulk_shopping_cart(self, request):
+        """Пакетное добавление в корзину покупок и удаление из нее."""
+        return self.bulk_recipe_marks(request, ShoppingCart)
+
+    @action(
+        methods=["get"],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь."""
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(methods=["get"], detail=False, permission_classes=[AllowAny])
+    def match(self, request):
+        """Рецепты, которые можно приготовить из имеющихся продуктов."""
+        params = RecipeMatchQuerySerializer(
+            data={
+                **request.query_params.dict(),
+                # Принимаем и ?ingredients=1,2, и ?ingredients=1&ingredients=2.
+                "ingredients": [
+                    part
+                    for value in request.query_params.getlist("ingredients")
+                    for part in value.split(",")
+                    if part
+                ],
+            }
+        )
+        params.is_valid(raise_exception=True)
+        matches = recipe_matcher.match(**params.validated_data)
+        recipes = Recipe.objects.in_bulk([recipe_id for recipe_id, *_ in matches])
+        ingredients = Ingredient.objects.in_bulk(
+            {ingredient for *_, missing in matches for ingredient in missing}
+        )
+        return Response(
+            RecipeMatchSerializer(
+                [
+                    {
+                        "recipe": recipes[recipe_id],
+                        "coverage": coverage,
+                        "matched": matched,
+                        "total": total,
+                        "missing": [
+                            ingredients[pk] for pk in missing if pk in ingredients
+                        ],
+                    }
+                    for recipe_id, coverage, matched, total, missing in matches
+                    # Рецепт могли удалить после снимка индекса.
+                    if recipe_id in recipes
+                ],
+                many=True,
+                context={"request": request},
+            ).data
+        )
+
+    def scored_response(self, request, scored):
+        recipes = Recipe.objects.in_bulk([recipe_id for recipe_id, _ in scored])
+        return Response(
+            ScoredRecipeSerializer(
+                [
+                    {"recipe": recipes[recipe_id], "score": score}
+                    for recipe_id, score in scored
+                    if recipe_id in recipes
+                ],
+                many=True,
+                context={"request": request},
+            ).data
+        )
+
+    @action(methods=["get"], detail=True, permission_classes=[AllowAny])
+    def similar(self, request, pk):
+        """Похожие рецепты: их добавляют в избранное вместе с этим."""
+        get_object_or_404(Recipe, id=pk)
+        params = RecommendationQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return self.scored_response(
+            request, similar_recipes(pk, params.validated_data["limit"])
+        )
+
+    @action(methods=["get"], detail=False, permission_classes=[IsAuthenticated])
+    def recommended(self, request):
+        """Рекомендации по избранному пользователя."""
+        params = RecommendationQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return self.scored_response(
+            request, recommended_recipes(request.user, params.validated_data["limit"])
+        )
+
     @action(
         methods=["get"], detail=True, url_path="get-link", permission_classes=[AllowAny]
     )
@@ -196,28 +476,50 @@ class RecipeViewSet(ModelViewSet):
         return Response(
             {
                 "short-link": request.build_absolute_uri(
-                    reverse("recipes:short_link", args=[pk])
+                    reverse("recipes:short_link", args=[short_code(int(pk))])
                 )
             },
             status=status.HTTP_200_OK,
         )
 
-    @action(methods=["get"], detail=False)
+    @action(
+        methods=["get"],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        # ?format= выбирает формат файла, а не рендерер DRF.
+        content_negotiation_class=IgnoreFormatContentNegotiation,
+    )
     def download_shopping_cart(self, request):
-        """Выгрузка корзины покупок файлом."""
+        """Потоковая выгрузка корзины покупок файлом (txt, csv, json)."""
+        file_format = request.query_params.get("format", "txt")
+        if file_format not in SHOPPING_LIST_RENDERERS:
+            raise ValidationError(
+                {
+                    "format": (
+                        f"Допустимые форматы: {', '.join(SHOPPING_LIST_RENDERERS)}."
+                    )
+                }
+            )
+        render, content_type = SHOPPING_LIST_RENDERERS[file_format]
         user = self.request.user
-        recipe_qs = Recipe.objects.filter(shoppingcarts__user=user)
-        product_qs = (
+        recipes = (
+            Recipe.objects.filter(shoppingcarts__user=user)
+            .values_list("name", "author__username")
+            .iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE)
+        )
+        products = (
             IngredientInRecipe.objects.filter(recipe__shoppingcarts__user=user)
             .values(
                 product=F("ingredient__name"), unit=F("ingredient__measurement_unit")
             )
             .annotate(amount=Sum("amount"))
             .order_by("ingredient__name")
+            .iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE)
+        )
+        response = StreamingHttpResponse(
+            render(recipes=recipes, products=products), content_type=content_type
         )
-        return FileResponse(
-            shopping_list_render(recipes=recipe_qs, products=product_qs),
-            content_type="text/plain",
-            as_attachment=True,
-            filename=SHOPPING_CART_FILENAME,
+        response["Content-Disposition"] = (
+            f'attachment; filename="{SHOPPING_CART_FILENAME.format(file_format)}"'
         )
+        return response
@@ -9,6 +9,8 @@ LONG_MAX_LENGTH = 254
 
 # Размеры картинки для админки.
 ADMIN_PIC_DOTS = 50
+# С какого числа строк админка показывает оценку вместо COUNT(*).
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
 
 # Допустимые паттерны.
 USERNAME_PATTERN = r"^[\w.@+-]+\Z"
@@ -16,12 +18,127 @@ USERNAME_PATTERN = r"^[\w.@+-]+\Z"
 DEFAULT_USER_AVATAR = f"{AVATARS_URL}/default_user_avatar.jpg"
 # Минимальное время готовки.
 MIN_COOKING_MINUTES = 1
+# Максимальное время готовки (предел SmallIntegerField).
+MAX_COOKING_MINUTES = 32767
 # Минимальное количество ингредиента.
 MIN_INGREDIENT_AMOUNT = 1
 
-# Имя файла для выгрузки списка покупок продуктов.
-SHOPPING_CART_FILENAME = "shopping_cart.txt"
+# Рецептов автора в списке подписок: по умолчанию и максимум (?recipes_limit=).
+RECIPES_LIMIT_DEFAULT = 3
+RECIPES_LIMIT_MAX = 100
+
+# Имя файла для выгрузки списка покупок продуктов (расширение по формату).
+SHOPPING_CART_FILENAME = "shopping_cart.{}"
+# Размер пачки строк при потоковой выгрузке списка покупок.
+SHOPPING_CART_CHUNK_SIZE = 500
 # Заготовки для форматирования вывода списка покупок.
 header_layout = "СПИСОК ПОКУПОК (составлен {})"
 products_layout = "{}. {} ({}) - {}"
 recipes_layout = "{} @{}"
+# Месяцы в родительном падеже для даты списка покупок (без setlocale).
+MONTHS = (
+    "января",
+    "февраля",
+    "марта",
+    "апреля",
+    "мая",
+    "июня",
+    "июля",
+    "августа",
+    "сентября",
+    "октября",
+    "ноября",
+    "декабря",
+)
+
+# Пакетная загрузка данных: размер пачки bulk_create, сторона картинок, px,
+# и каталог заготовок картинок в медиа (записи получают их копии).
+IMPORT_BATCH_SIZE = 1000
+IMPORT_IMAGE_MAX_SIDE = 1280
+IMPORT_IMAGES_DIR = "import"
+
+# Производные картинок: сторона превью по размерам, px, для рецептов и аватаров.
+RECIPE_IMAGE_SIZES = {"small": 160, "medium": 480, "large": 1024}
+AVATAR_IMAGE_SIZES = {"small": 64, "medium": 256}
+# Форматы производных в порядке предпочтения (недоступные в Pillow пропускаются).
+IMAGE_FORMATS = ("avif", "webp", "jpeg")
+# Форматы для единственной ссылки на превью, понятные всем браузерам.
+PREVIEW_IMAGE_FORMATS = ("webp", "jpeg")
+# Размер превью для кратких карточек рецептов и для админки.
+PREVIEW_IMAGE_SIZE = "medium"
+ADMIN_IMAGE_SIZE = "small"
+# Предел стороны оригинала, px, и качество сжатия.
+IMAGE_MAX_SIDE = 2048
+IMAGE_QUALITY = 80
+IMAGE_DERIVATIVES_DIR = "derivatives"
+# Пределы загружаемой картинки: байт после декодирования и пикселей по заголовку.
+IMAGE_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 50_000_000
+# Порция base64 при декодировании (кратна 4) и сколько держать в памяти, байт.
+BASE64_CHUNK_SIZE = 64 * 1024
+IMAGE_SPOOL_MAX_MEMORY = 1024 * 1024
+
+# Полнотекстовый поиск рецептов: конфигурация PostgreSQL, разметка подсветки,
+# длина фрагмента описания (слов) и предел кандидатов в FTS5 (SQLite).
+SEARCH_CONFIG = "russian"
+SEARCH_HIGHLIGHT = ("<mark>", "</mark>")
+SEARCH_SNIPPET_WORDS = 16
+SEARCH_MAX_RESULTS = 1000
+
+# Подбор рецептов по продуктам: выдача по умолчанию и максимум, предел
+# продуктов в запросе.
+MATCH_LIMIT_DEFAULT = 20
+MATCH_LIMIT_MAX = 100
+MATCH_MAX_INGREDIENTS = 100
+# Индекс подбора: сколько измененных рецептов держать поверх основного
+# индекса и сколько записей журнала догонять, прежде чем перестроить его.
+MATCH_OVERLAY_LIMIT = 2000
+MATCH_MAX_CHANGES = 5000
+# Без общего кэша журнал изменений и версии справочников у каждого
+# процесса свои: индексы подбора и продуктов перестраиваются целиком
+# не реже чем раз в столько секунд.
+MATCH_LOCAL_TIMEOUT = 60
+# Время жизни записей журнала изменений рецептов, сек.
+RECIPE_CHANGES_TIMEOUT = 60 * 60 * 24
+
+# Лента подписок: авторы с большим числом подписчиков не раскладывают
+# рецепты по лентам, а подмешиваются при чтении; сколько последних рецептов
+# автора добавлять в ленту при подписке, предел длины ленты и размер пачки
+# вставки записей.
+FEED_PULL_SUBSCRIBERS = 1000
+FEED_BACKFILL_SIZE = 50
+FEED_MAX_LENGTH = 1000
+FEED_BATCH_SIZE = 1000
+
+# Похожие рецепты: соседей на рецепт, минимум общих пользователей, предел
+# произведений в блоке расчета и строк в пачке вставки; сколько последних
+# рецептов из избранного учитывать в рекомендациях.
+SIMILARITY_TOP_K = 20
+SIMILARITY_MIN_COMMON = 2
+SIMILARITY_CHUNK_WORK = 10_000_000
+SIMILARITY_BATCH_SIZE = 5000
+SIMILARITY_USER_FAVORITES = 100
+RECOMMENDED_LIMIT_DEFAULT = 20
+RECOMMENDED_LIMIT_MAX = 100
+
+# Короткие ссылки: предел длины кода (62**10 < 2**63), время жизни записей
+# о рецепте в общем кэше (о несуществующем - меньше), размер и время жизни
+# LRU в памяти процесса, сек.
+SHORT_LINK_MAX_LENGTH = 10
+SHORT_LINK_CACHE_TIMEOUT = 60 * 60 * 24
+SHORT_LINK_NEGATIVE_TIMEOUT = 60
+SHORT_LINK_LOCAL_SIZE = 10000
+SHORT_LINK_LOCAL_TIMEOUT = 30
+
+# Замеры запросов (api.instrumentation): с какого повтора запрос считается
+# N+1, порог медленного запроса к БД, мс, глубина стека в логе и префикс
+# метрик Prometheus.
+DUPLICATE_QUERY_THRESHOLD = 5
+SLOW_QUERY_MS = 100
+STACK_SAMPLE_DEPTH = 8
+METRICS_PREFIX = "foodgram"
+
+# Время жизни кэша ответов справочников (продукты, теги), сек.
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+# Предел рецептов в одном пакетном запросе к избранному/корзине.
+MARKS_BULK_MAX = 100
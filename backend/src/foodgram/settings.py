@@ -33,6 +33,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.instrumentation.InstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -42,7 +43,7 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
-ROOT_URLCONF = "backend.urls"
+ROOT_URLCONF = "foodgram.urls"
 
 TEMPLATES = [
     {
@@ -60,13 +61,20 @@ TEMPLATES = [
     },
 ]
 
-WSGI_APPLICATION = "backend.wsgi.application"
+WSGI_APPLICATION = "foodgram.wsgi.application"
 
 AUTH_USER_MODEL = "recipes.User"
 
 # Настройки подключаемой базы определяются в .env (PostgreSQL или sqlite)
-# По дефолту база PostgreSQL.
-if os.getenv("DB_SQLITE", "True") == "True":
+# По дефолту база PostgreSQL, DB_SQLITE=True - sqlite.
+if os.getenv("DB_SQLITE") == "True":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+        }
+    }
+else:
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.postgresql",
@@ -75,15 +83,38 @@ if os.getenv("DB_SQLITE", "True") == "True":
             "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
             "HOST": os.getenv("DB_HOST", "db"),
             "PORT": os.getenv("DB_PORT", 5432),
+            # Соединение проверяется при выдаче из пула или в начале запроса.
+            "CONN_HEALTH_CHECKS": True,
         }
     }
-else:
-    DATABASES = {
-        "default": {
-            "ENGINE": "django.db.backends.sqlite3",
-            "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+    # Пул соединений psycopg в каждом воркере: соединение не открывается
+    # на каждый запрос, а их число ограничено DB_POOL_MAX_SIZE на воркер.
+    # Под ASGI потоки запросов недолговечны, и постоянные соединения
+    # (CONN_MAX_AGE) там не переиспользуются - нужен пул.
+    if os.getenv("DB_POOL", "True") == "True":
+        DATABASES["default"]["OPTIONS"] = {
+            "pool": {
+                "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+                "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+                # Сколько секунд ждать свободного соединения.
+                "timeout": float(os.getenv("DB_POOL_TIMEOUT", 10)),
+            }
         }
+    else:
+        DATABASES["default"]["CONN_MAX_AGE"] = int(os.getenv("DB_CONN_MAX_AGE", 60))
+
+# Общий для всех процессов кэш (версии справочников, ответы). В
+# docker-compose - Redis (сервис cache). Кэш в памяти процесса (по
+# умолчанию) годится только для разработки: ответы справочников с ним не
+# кэшируются.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
     }
+}
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -118,6 +149,9 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 AVATARS_URL = "user_avatars"
 
+# Исходные данные для загрузки (справочники, пользователи, рецепты, картинки).
+DATA_DIR = BASE_DIR.parent / "data"
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
@@ -131,6 +165,25 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 6,
 }
 
+# Сколько продуктов максимум отдает автодополнение по названию.
+INGREDIENT_SEARCH_LIMIT = int(os.getenv("INGREDIENT_SEARCH_LIMIT", 50))
+
+# Потоков для построения превью загруженных картинок.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+
+# Замеры запросов: доля запросов в выборке (0 - выключены), пороги
+# медленного запроса для лога (мс и число запросов к БД) и токен /metrics
+# (без него /metrics закрыт). Счетчики хранятся в кэше: он должен быть
+# общим для воркеров (см. CACHES).
+INSTRUMENTATION_SAMPLE_RATE = float(os.getenv("INSTRUMENTATION_SAMPLE_RATE", 0))
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", 500))
+SLOW_REQUEST_QUERIES = int(os.getenv("SLOW_REQUEST_QUERIES", 50))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Асинхронное чтение рецептов, справочников и коротких ссылок
+# (api.async_views). Включается при запуске под ASGI.
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS") == "True"
+
 DJOSER = {
     "LOGIN_FIELD": "email",
     "PERMISSIONS": {
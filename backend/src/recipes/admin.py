@@ -1,8 +1,14 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group
-
-from constants import ADMIN_PIC_DOTS
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Count, Prefetch
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from constants import ADMIN_ESTIMATED_COUNT_THRESHOLD, ADMIN_IMAGE_SIZE, ADMIN_PIC_DOTS
+from recipes.images import preview_url
 from recipes.models import (
     Favorite,
     Ingredient,
@@ -17,13 +23,42 @@ from recipes.models import (
 admin.site.unregister(Group)
 
 
+def image_tag(image, derivatives):
+    """Превью картинки для админки (маленькая производная, если есть)."""
+    return format_html(
+        '<img src="{}" width="{}" height="{}"/>',
+        preview_url({}, image, derivatives, ADMIN_IMAGE_SIZE),
+        ADMIN_PIC_DOTS,
+        ADMIN_PIC_DOTS,
+    )
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор без полного COUNT(*) для больших таблиц.
+
+    Для списка без фильтров на PostgreSQL берем оценку числа строк
+    из статистики планировщика, если таблица достаточно велика.
+    """
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if connection.vendor == "postgresql" and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                    [self.object_list.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
+
+
 class BaseFilter(admin.SimpleListFilter):
     """Базовый класс для фильтра рецептов и подписок."""
 
-    SELECTIONS = (
-        ("0", "Нет"),
-        ("1", "Есть"),
-    )
+    SELECTIONS = (("0", "Нет"), ("1", "Есть"))
 
     def lookups(self, request, model_admin):
         return self.SELECTIONS
@@ -41,46 +76,48 @@ class BaseFilter(admin.SimpleListFilter):
         return {f"{self.parameter_name}__exact": None}
 
 
-class RecipeFilter(BaseFilter):
+class CounterFilter(BaseFilter):
+    """Фильтр по денормализованному счетчику, без JOIN."""
 
-    title = "Наличие рецептов"
-    parameter_name = "recipes"
-    SELECTIONS = (
-        ("0", "Нет рецептов"),
-        ("1", "Есть рецепты"),
-    )
+    def filter_kwargs(self):
+        return {self.parameter_name: 0}
 
 
-class FollowsFilter(BaseFilter):
+class RecipeFilter(CounterFilter):
+    title = "Наличие рецептов"
+    parameter_name = "recipes_count"
+    SELECTIONS = (("0", "Нет рецептов"), ("1", "Есть рецепты"))
 
-    title = "Есть подписки"
-    parameter_name = "follows"
-    SELECTIONS = (
-        ("0", "Нет подписок"),
-        ("1", "Есть подписки"),
-    )
 
+class FollowsFilter(CounterFilter):
+    title = "Есть подписки"
+    parameter_name = "subscriptions_count"
+    SELECTIONS = (("0", "Нет подписок"), ("1", "Есть подписки"))
 
-class IsFollowedFilter(BaseFilter):
 
+class IsFollowedFilter(CounterFilter):
     title = "Есть подписчики"
-    parameter_name = "authors"
-    SELECTIONS = (
-        ("0", "Нет подписчиков"),
-        ("1", "Есть подписчики"),
-    )
+    parameter_name = "subscribers_count"
+    SELECTIONS = (("0", "Нет подписчиков"), ("1", "Есть подписчики"))
 
 
 class RecipesCountMixin:
     """Подсчет количества рецептов, связанных с объектом смежной модели."""
 
-    list_display = [
-        "recipes_count",
-    ]
+    list_display = ["recipes_count"]
+    # Связь для подсчета в запросе списка. У пользователя счетчик хранится
+    # в модели, поэтому связь не задается.
+    recipes_relation = None
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.recipes_relation:
+            queryset = queryset.annotate(recipes_count=Count(self.recipes_relation))
+        return queryset
 
-    @admin.display(description="Рецептов")
+    @admin.display(description="Рецептов", ordering="recipes_count")
     def recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
 
 @admin.register(User)
@@ -95,8 +132,8 @@ class FoodgramUserAdmin(UserAdmin, RecipesCountMixin):
         "email",
         "is_staff",
         *RecipesCountMixin.list_display,
-        "subscribed_count",
-        "authors_count",
+        "subscriptions_count",
+        "subscribers_count",
     ]
     list_display_links = ("username",)
     fieldsets = (
@@ -104,16 +141,13 @@ class FoodgramUserAdmin(UserAdmin, RecipesCountMixin):
             ("Пользователь"),
             {"fields": ("username", "avatar", "first_name", "last_name", "email")},
         ),
-        (
-            ("Статус"),
-            {
-                "fields": ("is_active", "is_staff", "is_superuser"),
-            },
-        ),
+        (("Статус"), {"fields": ("is_active", "is_staff", "is_superuser")}),
         (("Даты"), {"fields": ("last_login", "date_joined")}),
     )
     readonly_fields = ["avatar_preview"]
     search_fields = ("email", "username")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_filter = (
         *UserAdmin.list_filter,
         RecipeFilter,
@@ -125,20 +159,9 @@ class FoodgramUserAdmin(UserAdmin, RecipesCountMixin):
     def name(self, user):
         return f"{user.first_name} {user.last_name}"
 
-    @admin.display(description="Подписок")
-    def subscribed_count(self, user):
-        return user.follows.count()
-
-    @admin.display(description="Подписчиков")
-    def authors_count(self, user):
-        return user.authors.count()
-
     @admin.display(description="Аватар")
     def avatar_preview(self, user):
-        return (
-            f'<img src="{user.avatar}" width="{ADMIN_PIC_DOTS}" '
-            f'height="{ADMIN_PIC_DOTS}"/>'
-        )
+        return image_tag(user.avatar, user.avatar_sizes)
 
 
 @admin.register(Subscribe)
@@ -146,12 +169,14 @@ class SubscribeAdmin(admin.ModelAdmin):
     """Админка для подписок."""
 
     list_display = ("user", "subscribed")
+    list_select_related = ("user", "subscribed")
     search_fields = ("user__username", "subscribed__username")
 
 
 class RecipeIngredientsInline(admin.StackedInline):
     model = IngredientInRecipe
     extra = 0
+    ordering = ("ingredient__name",)
     verbose_name = "продукт"
     verbose_name_plural = "Продукты"
 
@@ -163,17 +188,15 @@ class TagAdmin(RecipesCountMixin, admin.ModelAdmin):
     list_display = ["name", "slug", *RecipesCountMixin.list_display]
     search_fields = ("name", "slug")
     counter_description = "Рецептов с тегом"
+    recipes_relation = "recipes"
 
 
 class UsedIngredientFilter(BaseFilter):
     title = "Используются в рецептах"
 
-    parameter_name = "recipes"
+    parameter_name = "ingredients_in_recipe"
 
-    SELECTIONS = (
-        ("0", "Неиспользуемые"),
-        ("1", "Используемые"),
-    )
+    SELECTIONS = (("0", "Неиспользуемые"), ("1", "Используемые"))
 
 
 @admin.register(Ingredient)
@@ -184,6 +207,7 @@ class IngredientAdmin(RecipesCountMixin, admin.ModelAdmin):
     list_display_links = ("name",)
     search_fields = ("name", "measurement_unit")
     list_filter = ("measurement_unit", UsedIngredientFilter)
+    recipes_relation = "ingredients_in_recipe"
 
 
 @admin.register(Recipe)
@@ -213,11 +237,30 @@ class RecipeAdmin(admin.ModelAdmin):
     readonly_fields = ("image_preview", "favorited_count", "pub_date")
     search_fields = ("author__username", "name", "tags__name")
     list_filter = ("tags", "author")
+    list_select_related = ("author",)
     inlines = (RecipeIngredientsInline,)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Теги и продукты страницы - двумя запросами на всю страницу.
+        return (
+            super()
+            .get_queryset(request)
+            .prefetch_related(
+                "tags",
+                Prefetch(
+                    "ingredients_in_recipe",
+                    queryset=IngredientInRecipe.objects.select_related(
+                        "ingredient"
+                    ).order_by("ingredient__name"),
+                ),
+            )
+        )
 
-    @admin.display(description="В избранном")
+    @admin.display(description="В избранном", ordering="favorites_count")
     def favorited_count(self, recipe):
-        return recipe.favorites.count()
+        return recipe.favorites_count
 
     @admin.display(description="Теги")
     def view_tags(self, recipe):
@@ -226,19 +269,13 @@ class RecipeAdmin(admin.ModelAdmin):
     @admin.display(description="Продукты")
     def view_ingredients(self, recipe):
         return "<br>".join(
-            (
-                f"{ingr.ingredient.name} {ingr.amount} "
-                f"{ingr.ingredient.measurement_unit}"
-            )
+            (f"{ingr.ingredient.name} {ingr.amount} {ingr.ingredient.measurement_unit}")
             for ingr in recipe.ingredients_in_recipe.all()
         )
 
     @admin.display(description="Превью")
     def image_preview(self, recipe):
-        return (
-            f'<img src="{recipe.image}" width="{ADMIN_PIC_DOTS}" '
-            f'height="{ADMIN_PIC_DOTS}"/>'
-        )
+        return image_tag(recipe.image, recipe.image_sizes)
 
 
 @admin.register(Favorite, ShoppingCart)
@@ -246,4 +283,7 @@ class FavoriteShoppingCartAdmin(admin.ModelAdmin):
     """Админка для избранного."""
 
     list_display = ("user", "recipe")
+    list_select_related = ("user", "recipe")
     search_fields = ("user__username", "recipe__name")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
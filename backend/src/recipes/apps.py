@@ -5,3 +5,8 @@ class RecipesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "recipes"
     verbose_name = "Рецепты"
+
+    def ready(self):
+        # Подключаем сигналы счетчиков и проверки настроек.
+        import recipes.checks  # noqa: F401
+        import recipes.signals  # noqa: F401
@@ -0,0 +1,95 @@
+"""Версии справочников и журнал изменений рецептов для кэшей и индексов."""
+
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from constants import RECIPE_CHANGES_TIMEOUT
+
+RECIPE_CHANGES_KEY = "recipe_changes"
+
+
+def normalize(text):
+    """Ключ поиска: регистр и «ё» не различаются, пробелы схлопнуты."""
+    return " ".join(text.casefold().replace("ё", "е").split())
+
+
+def cache_is_shared():
+    """Кэш общий для всех процессов, а не свой у каждого (LocMemCache).
+
+    Версии справочников и журнал изменений в кэше процесса другие воркеры
+    не видят, и их кэши не сбрасываются.
+    """
+    return not isinstance(caches["default"], LocMemCache)
+
+
+def catalog_version_key(model):
+    return f"catalog_version:{model._meta.model_name}"
+
+
+def get_catalog_version(model):
+    """Текущая версия справочника, общая для всех процессов через кэш."""
+    key = catalog_version_key(model)
+    version = cache.get(key)
+    if version is None:
+        # Версия вытеснена из кэша или еще не задана: заводим новую,
+        # чтобы ни один процесс не счел свои данные актуальными.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_catalog_version(model):
+    """Асинхронный вариант get_catalog_version."""
+    key = catalog_version_key(model)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_catalog_version(model):
+    """Помечаем справочник измененным."""
+    cache.set(catalog_version_key(model), time.time_ns(), None)
+
+
+def next_recipe_changes_sequence():
+    try:
+        return cache.incr(RECIPE_CHANGES_KEY)
+    except ValueError:
+        cache.add(RECIPE_CHANGES_KEY, 0, None)
+        return cache.incr(RECIPE_CHANGES_KEY)
+
+
+def record_recipe_change(recipe_id):
+    """Записываем в журнал рецепт, у которого изменился состав (или удален)."""
+    cache.set(
+        f"{RECIPE_CHANGES_KEY}:{next_recipe_changes_sequence()}",
+        recipe_id,
+        RECIPE_CHANGES_TIMEOUT,
+    )
+
+
+def invalidate_recipe_changes():
+    """Пропуск в журнале: индексы перестроятся целиком (после пакетной загрузки)."""
+    next_recipe_changes_sequence()
+
+
+def get_recipe_changes_sequence():
+    """Номер последней записи журнала (0, если журнал пуст или вытеснен)."""
+    return cache.get(RECIPE_CHANGES_KEY, 0)
+
+
+def get_recipe_changes(start, stop):
+    """id рецептов из записей журнала (start, stop] или None, если их нет.
+
+    None означает, что часть записей вытеснена из кэша и по журналу
+    догнать изменения нельзя.
+    """
+    keys = [f"{RECIPE_CHANGES_KEY}:{number}" for number in range(start + 1, stop + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) < len(keys):
+        return None
+    return set(changes.values())
@@ -0,0 +1,19 @@
+"""Проверки настроек для manage.py check --deploy."""
+
+from django.core import checks
+
+from recipes.catalog import cache_is_shared
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+    return [
+        checks.Warning(
+            "Кэш в памяти процесса: у каждого воркера свои версии "
+            "справочников, журнал изменений рецептов и метрики.",
+            hint="Задайте общий кэш: CACHE_BACKEND и CACHE_LOCATION.",
+            id="recipes.W001",
+        )
+    ]
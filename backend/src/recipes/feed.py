@@ -0,0 +1,151 @@
+"""Лента подписок: рецепты авторов, на которых подписан пользователь.
+
+Новый рецепт сразу раскладывается по лентам подписчиков автора (FeedEntry),
+удаленный уходит из них каскадом. Рецепты авторов с большим числом
+подписчиков (User.feed_pull) не раскладываются, а подмешиваются при чтении
+ленты запросом к Recipe. Подписка добавляет в ленту последние
+FEED_BACKFILL_SIZE рецептов автора, отписка убирает его записи. Длина ленты
+ограничивается FEED_MAX_LENGTH (см. trim_feed и команду rebuild_feeds).
+"""
+
+import heapq
+from itertools import groupby, islice
+
+from django.db.models import Count, Exists, OuterRef, Q
+
+from constants import (
+    FEED_BACKFILL_SIZE,
+    FEED_BATCH_SIZE,
+    FEED_MAX_LENGTH,
+    FEED_PULL_SUBSCRIBERS,
+)
+from recipes.models import FeedEntry, Recipe, Subscribe, User
+
+
+def older(pub_date, pk, id_field):
+    """Условие «после курсора» для порядка (-pub_date, -id)."""
+    return Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, **{f"{id_field}__lt": pk})
+
+
+def is_pulled(author_id):
+    return User.objects.filter(pk=author_id, feed_pull=True).exists()
+
+
+def update_feed_pull(author_id):
+    """Автор с большим числом подписчиков переходит на чтение по запросу.
+
+    Обратно флаг не сбрасывается (его пересчитывает rebuild_feeds), чтобы
+    автор у границы порога не переключался туда и обратно.
+    """
+    User.objects.filter(
+        pk=author_id, feed_pull=False, subscribers_count__gt=FEED_PULL_SUBSCRIBERS
+    ).update(feed_pull=True)
+
+
+def add_entries(user_ids, recipes):
+    """Вставляем записи (подписчик, рецепт) пачками, повторы пропускаем."""
+    entries = (
+        FeedEntry(
+            user_id=user_id, recipe_id=recipe_id, author_id=author_id, pub_date=pub_date
+        )
+        for user_id in user_ids
+        for recipe_id, author_id, pub_date in recipes
+    )
+    while batch := list(islice(entries, FEED_BATCH_SIZE)):
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(recipe):
+    """Раскладываем новый рецепт по лентам подписчиков автора."""
+    if is_pulled(recipe.author_id):
+        return
+    add_entries(
+        Subscribe.objects.filter(subscribed_id=recipe.author_id)
+        .values_list("user_id", flat=True)
+        .iterator(chunk_size=FEED_BATCH_SIZE),
+        [(recipe.pk, recipe.author_id, recipe.pub_date)],
+    )
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляем в ленту подписчика последние рецепты автора."""
+    if is_pulled(author_id):
+        return
+    add_entries(
+        [user_id],
+        Recipe.objects.filter(author_id=author_id)
+        .order_by("-pub_date", "-id")
+        .values_list("id", "author_id", "pub_date")[:FEED_BACKFILL_SIZE],
+    )
+    trim_feed(user_id)
+
+
+def remove_from_feed(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def remove_subscriptions_from_feeds(subscriptions):
+    """То же для пачки подписок (queryset Subscribe) одним DELETE."""
+    FeedEntry.objects.filter(
+        Exists(
+            subscriptions.filter(user=OuterRef("user"), subscribed=OuterRef("author"))
+        )
+    ).delete()
+
+
+def trim_feed(user_id):
+    """Оставляем в ленте FEED_MAX_LENGTH самых новых записей."""
+    cutoff = (
+        FeedEntry.objects.filter(user_id=user_id)
+        .order_by("-pub_date", "-recipe_id")
+        .values_list("pub_date", "recipe_id")[FEED_MAX_LENGTH : FEED_MAX_LENGTH + 1]
+    )
+    for pub_date, recipe_id in cutoff:
+        FeedEntry.objects.filter(user_id=user_id).filter(
+            older(pub_date, recipe_id, "recipe_id")
+            | Q(pub_date=pub_date, recipe_id=recipe_id)
+        ).delete()
+
+
+def trim_feeds():
+    """Обрезаем все ленты длиннее FEED_MAX_LENGTH, возвращаем их число."""
+    user_ids = list(
+        FeedEntry.objects.values("user_id")
+        .annotate(length=Count("id"))
+        .filter(length__gt=FEED_MAX_LENGTH)
+        .values_list("user_id", flat=True)
+    )
+    for user_id in user_ids:
+        trim_feed(user_id)
+    return len(user_ids)
+
+
+def timeline(user, limit, after=None):
+    """Ключи (pub_date, id) первых limit рецептов ленты после курсора after.
+
+    Записи ленты и рецепты авторов с feed_pull сливаются по убыванию даты.
+    Рецепт автора, перешедшего на feed_pull, может оказаться в обоих
+    источниках - повторы отбрасываем.
+    """
+    entries = FeedEntry.objects.filter(user=user)
+    if after is not None:
+        entries = entries.filter(older(*after, "recipe_id"))
+    sources = [
+        entries.order_by("-pub_date", "-recipe_id").values_list(
+            "pub_date", "recipe_id"
+        )[:limit]
+    ]
+    pulled = list(
+        Subscribe.objects.filter(user=user, subscribed__feed_pull=True).values_list(
+            "subscribed_id", flat=True
+        )
+    )
+    if pulled:
+        recipes = Recipe.objects.filter(author_id__in=pulled)
+        if after is not None:
+            recipes = recipes.filter(older(*after, "id"))
+        sources.append(
+            recipes.order_by("-pub_date", "-id").values_list("pub_date", "id")[:limit]
+        )
+    merged = heapq.merge(*sources, reverse=True)
+    return [key for key, _ in islice(groupby(merged), limit)]
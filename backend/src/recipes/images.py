@@ -0,0 +1,193 @@
+"""Производные картинок: превью фиксированных размеров в WebP/AVIF/JPEG.
+
+Картинки обрабатываются в пуле потоков после коммита транзакции, чтобы
+не задерживать ответ на запрос. Результат сохраняется в JSON-поле модели
+в виде {размер: {формат: имя файла}}.
+"""
+
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+from constants import (
+    IMAGE_DERIVATIVES_DIR,
+    IMAGE_FORMATS,
+    IMAGE_MAX_SIDE,
+    IMAGE_QUALITY,
+    PREVIEW_IMAGE_FORMATS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Формат Pillow и расширение файла для каждого формата производных.
+PIL_FORMATS = {
+    "avif": ("AVIF", "avif"),
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+}
+# Форматы, которые умеет кодировать установленный Pillow.
+FORMATS = tuple(
+    name for name in IMAGE_FORMATS if name == "jpeg" or features.check(name)
+)
+
+_executor = None
+
+
+def derivative_name(name, size, fmt):
+    """Имя файла производной: derivatives/<каталог>/<имя>_<размер>.<расширение>."""
+    path = PurePosixPath(name)
+    return (
+        f"{IMAGE_DERIVATIVES_DIR}/{path.parent}/{path.stem}_{size}."
+        f"{PIL_FORMATS[fmt][1]}"
+    )
+
+
+def is_current(name, derivatives, sizes):
+    """Производные построены для этого файла и текущего набора размеров."""
+    return derivatives.keys() == sizes.keys() and all(
+        path == derivative_name(name, size, fmt)
+        for size, formats in derivatives.items()
+        for fmt, path in formats.items()
+    )
+
+
+def is_outdated(name, derivatives, sizes, skip=()):
+    """Превью нужно построить заново или удалить."""
+    if not name or name in skip:
+        return bool(derivatives)
+    return not is_current(name, derivatives, sizes)
+
+
+def encode(image, fmt):
+    if fmt == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, PIL_FORMATS[fmt][0], quality=IMAGE_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def replace_file(storage, name, content):
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, content)
+
+
+def build_derivatives(name, sizes, storage=default_storage, shared=False):
+    """Строим производные картинки name.
+
+    Оригинал при этом перезаписывается без EXIF и с ограничением стороны
+    IMAGE_MAX_SIDE, если в нем были метаданные или он был больше. Файл,
+    общий с другими записями (shared), не трогаем: обработанная картинка
+    сохраняется под новым именем. Возвращаем имя картинки и
+    {размер: {формат: имя}}.
+    """
+    with storage.open(name) as file, Image.open(file) as source:
+        source_format = source.format
+        has_exif = bool(source.getexif())
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    if has_exif or max(image.size) > IMAGE_MAX_SIDE:
+        image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        buffer = io.BytesIO()
+        original = image if source_format != "JPEG" else image.convert("RGB")
+        original.save(buffer, source_format, quality=IMAGE_QUALITY)
+        if shared:
+            name = storage.save(name, ContentFile(buffer.getvalue()))
+        else:
+            replace_file(storage, name, ContentFile(buffer.getvalue()))
+    derivatives = {}
+    for size, side in sizes.items():
+        preview = image.copy()
+        preview.thumbnail((side, side))
+        derivatives[size] = {}
+        for fmt in FORMATS:
+            path = derivative_name(name, size, fmt)
+            replace_file(storage, path, encode(preview, fmt))
+            derivatives[size][fmt] = path
+    return name, derivatives
+
+
+def delete_derivatives(derivatives, keep=(), storage=default_storage):
+    for formats in derivatives.values():
+        for path in formats.values():
+            if path not in keep:
+                storage.delete(path)
+
+
+def update_derivatives(model, pk, field, sizes_field, sizes, skip=()):
+    """Приводим производные записи pk в соответствие с ее картинкой."""
+    row = model.objects.filter(pk=pk).values(field, sizes_field).first()
+    if row is None:
+        return
+    name, old = row[field], row[sizes_field]
+    new_name = name
+    if not name or name in skip:
+        new = {}
+    elif is_current(name, old, sizes):
+        return
+    else:
+        new_name, new = build_derivatives(
+            name, sizes, shared=is_shared(model, field, name, exclude_pk=pk)
+        )
+    # Картинку могли заменить, пока строились производные.
+    if not model.objects.filter(pk=pk, **{field: name}).update(
+        **{field: new_name, sizes_field: new}
+    ):
+        if new_name != name:
+            default_storage.delete(new_name)
+            delete_derivatives(new)
+        return
+    if not is_shared(model, sizes_field, old):
+        delete_derivatives(
+            old, keep={path for formats in new.values() for path in formats.values()}
+        )
+
+
+def is_shared(model, field, value, exclude_pk=None):
+    """Тот же файл или те же производные (value поля field) у другой записи."""
+    return (
+        bool(value)
+        and model.objects.filter(**{field: value}).exclude(pk=exclude_pk).exists()
+    )
+
+
+def run_update(*args, **kwargs):
+    try:
+        update_derivatives(*args, **kwargs)
+    except Exception:
+        logger.exception("Не удалось построить производные картинки: %s", args[:2])
+    finally:
+        close_old_connections()
+
+
+def schedule_derivatives(*args, **kwargs):
+    """После коммита отдаем построение производных в пул потоков."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS, thread_name_prefix="images"
+        )
+    transaction.on_commit(lambda: _executor.submit(run_update, *args, **kwargs))
+
+
+def absolute_url(context, name):
+    url = default_storage.url(name)
+    request = context.get("request")
+    return request.build_absolute_uri(url) if request else url
+
+
+def preview_url(context, image, derivatives, size):
+    """Ссылка на превью нужного размера в лучшем доступном формате."""
+    formats = derivatives.get(size, {})
+    for fmt in PREVIEW_IMAGE_FORMATS:
+        if fmt in formats:
+            return absolute_url(context, formats[fmt])
+    return absolute_url(context, image.name) if image else None
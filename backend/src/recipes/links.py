@@ -0,0 +1,141 @@
+"""Короткие ссылки на рецепты: коды base62 и проверка рецептов через кэши.
+
+Код - id рецепта в base62. Раньше ссылки содержали десятичный id, и они
+уже разошлись: такие коды (одни цифры без ведущего нуля) по-прежнему
+читаются как id, а коду base62 из одних цифр дописываем ведущий «0».
+
+Есть ли рецепт, решает сначала LRU в памяти процесса, затем общий кэш,
+и только потом БД. Отсутствие рецепта тоже кэшируется, но недолго.
+При создании и удалении рецепта запись сбрасывается в общем кэше и в
+LRU этого процесса; в LRU других процессов она живет не дольше
+SHORT_LINK_LOCAL_TIMEOUT. Кэш в памяти процесса (LocMemCache) другие
+процессы не сбросят, поэтому с ним общий уровень пропускается.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import base62
+from django.core.cache import cache
+
+from constants import (
+    SHORT_LINK_CACHE_TIMEOUT,
+    SHORT_LINK_LOCAL_SIZE,
+    SHORT_LINK_LOCAL_TIMEOUT,
+    SHORT_LINK_MAX_LENGTH,
+    SHORT_LINK_NEGATIVE_TIMEOUT,
+)
+from recipes.catalog import cache_is_shared
+from recipes.models import Recipe
+
+CODE_PATTERN = re.compile(rf"[0-9A-Za-z]{{1,{SHORT_LINK_MAX_LENGTH}}}")
+
+
+class LRUCache:
+    """Потокобезопасный LRU с временем жизни записей."""
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self.entries.pop(key, None)
+                return default
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.timeout)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+local_cache = LRUCache(SHORT_LINK_LOCAL_SIZE, SHORT_LINK_LOCAL_TIMEOUT)
+
+
+def short_code(recipe_id):
+    code = base62.encode(recipe_id)
+    return f"0{code}" if code.isdigit() else code
+
+
+def decode_code(code):
+    """id рецепта по коду или None, если код некорректен."""
+    if not CODE_PATTERN.fullmatch(code):
+        return None
+    if code.isdigit() and not code.startswith("0"):
+        # Старая ссылка с десятичным id.
+        return int(code)
+    return base62.decode(code)
+
+
+def cache_key(recipe_id):
+    return f"short_link:{recipe_id}"
+
+
+def shared_timeout(exists):
+    return SHORT_LINK_CACHE_TIMEOUT if exists else SHORT_LINK_NEGATIVE_TIMEOUT
+
+
+def recipe_exists(recipe_id):
+    """Есть ли рецепт: LRU процесса, общий кэш, затем БД."""
+    exists = local_cache.get(recipe_id)
+    if exists is not None:
+        return exists
+    shared = cache_is_shared()
+    exists = cache.get(cache_key(recipe_id)) if shared else None
+    if exists is None:
+        exists = Recipe.objects.filter(id=recipe_id).exists()
+        if shared:
+            cache.set(cache_key(recipe_id), exists, shared_timeout(exists))
+    local_cache.set(recipe_id, exists)
+    return exists
+
+
+async def arecipe_exists(recipe_id):
+    """Асинхронный вариант recipe_exists: LRU процесса без потоков и БД."""
+    exists = local_cache.get(recipe_id)
+    if exists is not None:
+        return exists
+    shared = cache_is_shared()
+    exists = await cache.aget(cache_key(recipe_id)) if shared else None
+    if exists is None:
+        exists = await Recipe.objects.filter(id=recipe_id).aexists()
+        if shared:
+            await cache.aset(cache_key(recipe_id), exists, shared_timeout(exists))
+    local_cache.set(recipe_id, exists)
+    return exists
+
+
+def resolve_code(code):
+    """id рецепта по коду короткой ссылки или None."""
+    recipe_id = decode_code(code)
+    if recipe_id is None or not recipe_exists(recipe_id):
+        return None
+    return recipe_id
+
+
+async def aresolve_code(code):
+    """Асинхронный вариант resolve_code."""
+    recipe_id = decode_code(code)
+    if recipe_id is None or not await arecipe_exists(recipe_id):
+        return None
+    return recipe_id
+
+
+def forget_recipe(recipe_id):
+    """Сбрасываем закэшированное наличие рецепта (создан или удален)."""
+    cache.delete(cache_key(recipe_id))
+    local_cache.delete(recipe_id)
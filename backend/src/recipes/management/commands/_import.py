@@ -0,0 +1,181 @@
+"""Общие инструменты пакетной загрузки пользователей и рецептов."""
+
+import csv
+import os
+import shutil
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice, repeat
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.crypto import get_random_string
+from PIL import Image, ImageOps
+
+from constants import IMPORT_BATCH_SIZE, IMPORT_IMAGE_MAX_SIDE, IMPORT_IMAGES_DIR
+from recipes.images import FORMATS, build_derivatives, derivative_name
+from recipes.signals import DERIVATIVES
+
+
+def read_csv(file_name, fieldnames=None):
+    """Построчно читаем CSV из каталога с данными, не загружая файл целиком."""
+    with open(settings.DATA_DIR / file_name, encoding="utf-8", newline="") as file:
+        yield from csv.DictReader(file, fieldnames=fieldnames)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def prepare_image(source, target, max_side):
+    """Копируем картинку, уменьшая до max_side и убирая EXIF.
+
+    Выполняется в пуле процессов, поэтому работает только с путями
+    и не обращается к настройкам Django.
+    """
+    target = Path(target)
+    if target.exists():
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((max_side, max_side))
+        image.save(target, "JPEG", quality=85, optimize=True)
+
+
+def link_file(source, target):
+    """Файл target с содержимым source: жесткая ссылка, если можно, иначе копия.
+
+    У каждой записи свой файл: django-cleanup, удаляя или заменяя его,
+    не трогает картинки других записей.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class Progress:
+    """Печать прогресса и скорости загрузки."""
+
+    def __init__(self, stdout, title, interval=2):
+        self.stdout = stdout
+        self.title = title
+        self.interval = interval
+        self.count = 0
+        self.started = self.reported = time.monotonic()
+
+    def advance(self, count):
+        self.count += count
+        now = time.monotonic()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        self.stdout.write(
+            f"{self.title}: {self.count} за {elapsed:.1f} с "
+            f"({self.count / elapsed:.0f} в секунду)."
+        )
+
+
+class ImportCommand(ABC, BaseCommand):
+    """Базовая команда пакетной загрузки с пулом процессов для картинок."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Процессов для обработки картинок.",
+        )
+        parser.add_argument("--image-max-side", type=int, default=IMPORT_IMAGE_MAX_SIDE)
+
+    def prepare_images(self, model, sources, upload_to=None):
+        """Заготовки картинок записей model: {исходный путь: имя в медиа}.
+
+        Картинки обрабатываются в пуле процессов, превью - в пуле потоков,
+        по разу на файл; уже подготовленные повторно не обрабатываются.
+        Заготовки лежат в IMPORT_IMAGES_DIR и записям не принадлежат:
+        записи получают свои копии (copy_image).
+        """
+        field, _, sizes, _ = DERIVATIVES[model]
+        upload_to = upload_to or model._meta.get_field(field).upload_to
+        names = {
+            source: f"{IMPORT_IMAGES_DIR}/{upload_to}/{Path(source).stem}.jpg"
+            for source in set(sources)
+        }
+        progress = Progress(self.stdout, "Картинок обработано")
+        with ProcessPoolExecutor(max_workers=self.options["workers"]) as pool:
+            for _ in pool.map(
+                prepare_image,
+                names,
+                [Path(settings.MEDIA_ROOT) / name for name in names.values()],
+                [self.options["image_max_side"]] * len(names),
+            ):
+                progress.advance(1)
+        progress.report()
+        self.derivatives = self.prepare_derivatives(names.values(), sizes)
+        self.upload_to = upload_to
+        return names
+
+    def prepare_derivatives(self, names, sizes):
+        """Превью заготовок names: {имя: {размер: {формат: имя превью}}}."""
+        media = Path(settings.MEDIA_ROOT)
+        derivatives = {
+            name: {
+                size: {fmt: derivative_name(name, size, fmt) for fmt in FORMATS}
+                for size in sizes
+            }
+            for name in names
+        }
+        missing = [
+            name
+            for name, built in derivatives.items()
+            if not all(
+                (media / path).exists()
+                for formats in built.values()
+                for path in formats.values()
+            )
+        ]
+        progress = Progress(self.stdout, "Превью построено")
+        with ThreadPoolExecutor(max_workers=self.options["workers"]) as pool:
+            for name, (_, built) in zip(
+                missing, pool.map(build_derivatives, missing, repeat(sizes))
+            ):
+                derivatives[name] = built
+                progress.advance(1)
+        progress.report()
+        return derivatives
+
+    def copy_image(self, name):
+        """Своя копия заготовки name и ее превью для одной записи.
+
+        Возвращает имя картинки и превью записи. Файлы - жесткие ссылки
+        на заготовку, поэтому копии не занимают места на диске.
+        """
+        media = Path(settings.MEDIA_ROOT)
+        copy = f"{self.upload_to}/{Path(name).stem}_{get_random_string(7)}.jpg"
+        link_file(media / name, media / copy)
+        derivatives = {}
+        for size, formats in self.derivatives[name].items():
+            derivatives[size] = {}
+            for fmt, path in formats.items():
+                derivatives[size][fmt] = derivative_name(copy, size, fmt)
+                link_file(media / path, media / derivatives[size][fmt])
+        return copy, derivatives
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.load()
+
+    @abstractmethod
+    def load(self):
+        """Загрузка; параметры команды - в self.options."""
@@ -1,41 +1,133 @@
+import csv
 import json
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 
+from constants import IMPORT_BATCH_SIZE
+from recipes.catalog import bump_catalog_version
+from recipes.management.commands._import import batched
+
+
+def iter_json_array(file, chunk_size=64 * 1024):
+    """Поэлементно читаем JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer, started = "", False
+    while True:
+        chunk = file.read(chunk_size)
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip()
+            if not buffer:
+                break
+            if not started:
+                if buffer[0] != "[":
+                    raise CommandError("Ожидался JSON-массив.")
+                buffer, started = buffer[1:], True
+            elif buffer[0] == ",":
+                buffer = buffer[1:]
+            elif buffer[0] == "]":
+                return
+            else:
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    # Элемент прочитан не полностью, нужен следующий кусок.
+                    break
+                yield item
+                buffer = buffer[end:]
+        if not chunk:
+            raise CommandError("Некорректный или оборванный JSON.")
+
 
 class CommonCommand(BaseCommand):
-    """Скрипт для загрузки данных."""
+    """Скрипт для загрузки данных.
+
+    Записи сверяются с БД по естественному ключу: новые добавляются,
+    измененные обновляются (bulk_create с update_conflicts), совпадающие
+    пропускаются. Повторный запуск на каждом деплое ничего не пишет.
+    """
+
+    model = None
+    # Естественный ключ и загружаемые поля (порядок колонок CSV).
+    natural_key = None
+    fields = ()
+    default_file = None
 
     @property
     def help(self):
         return (
-            "Импортирует данные из JSON в модель "
+            "Импортирует данные из JSON или CSV в модель "
             f"{self.model._meta.verbose_name_plural}."
         )
 
-    @transaction.atomic
-    def handle(self, *args, **options):
-        file_name = f"{self.model.__name__.lower()}s.json"
-        file_path = f"{settings.BASE_DIR}/{file_name}"
-        try:
-
-            with open(file_path, "r", encoding="utf-8") as jsonfile:
-                data = json.load(jsonfile)
-                created_objects = self.model.objects.bulk_create(
-                    (self.model(**item) for item in data), ignore_conflicts=True
-                )
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file",
+            default=self.default_file,
+            help="Файл JSON или CSV (относительный путь - от каталога данных).",
+        )
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Только посчитать изменения."
+        )
 
-                added_count = len(created_objects)
+    def read_items(self, path):
+        with open(path, encoding="utf-8", newline="") as file:
+            if path.suffix == ".json":
+                for item in iter_json_array(file):
+                    yield {field: item.get(field, "") for field in self.fields}
+            elif path.suffix == ".csv":
+                for row in csv.reader(file):
+                    yield dict(zip(self.fields, row, strict=True))
+            else:
+                raise CommandError(f"Неизвестный формат файла {path.name}.")
 
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f"Файл {file_name} загружен. Добавлено записей: {added_count}."
-                    )
-                )
+    def diff(self, batch):
+        """Делим пачку на новые, измененные и неизмененные записи."""
+        # Повтор ключа в пачке: действует последняя запись.
+        items = {item[self.natural_key]: item for item in batch}
+        existing = {
+            current[self.natural_key]: current
+            for current in self.model.objects.filter(
+                **{f"{self.natural_key}__in": items}
+            ).values(*self.fields)
+        }
+        inserted = [item for key, item in items.items() if key not in existing]
+        updated = [
+            item
+            for key, item in items.items()
+            if key in existing and existing[key] != item
+        ]
+        return inserted, updated, len(batch) - len(inserted) - len(updated)
 
-        except Exception as error:
-            self.stdout.write(
-                self.style.ERROR(f"Ошибка {error} при загрузке файла {file_name}.")
+    @transaction.atomic
+    def handle(self, *args, **options):
+        path = settings.DATA_DIR / Path(options["file"])
+        counts = {"inserted": 0, "updated": 0, "skipped": 0}
+        for batch in batched(self.read_items(path), options["batch_size"]):
+            inserted, updated, skipped = self.diff(batch)
+            counts["inserted"] += len(inserted)
+            counts["updated"] += len(updated)
+            counts["skipped"] += skipped
+            if (inserted or updated) and not options["dry_run"]:
+                self.model.objects.bulk_create(
+                    (self.model(**item) for item in [*inserted, *updated]),
+                    update_conflicts=True,
+                    unique_fields=[self.natural_key],
+                    update_fields=[
+                        field for field in self.fields if field != self.natural_key
+                    ],
+                )
+        if (counts["inserted"] or counts["updated"]) and not options["dry_run"]:
+            # bulk_create не шлет сигналы, сбрасываем кэши вручную.
+            bump_catalog_version(self.model)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Файл {path.name}{' (без записи)' if options['dry_run'] else ''}: "
+                f"добавлено {counts['inserted']}, обновлено {counts['updated']}, "
+                f"без изменений {counts['skipped']}."
             )
+        )
@@ -0,0 +1,41 @@
+"""Команда построения превью для уже загруженных картинок."""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import is_outdated, run_update
+from recipes.management.commands._import import Progress
+from recipes.signals import DERIVATIVES
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит превью картинок рецептов и аватаров, для которых их нет "
+        "или набор размеров устарел (например, после пакетной загрузки)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.IMAGE_WORKERS,
+            help="Потоков для обработки картинок.",
+        )
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            for model, (field, sizes_field, sizes, skip) in DERIVATIVES.items():
+                rows = model.objects.values_list("pk", field, sizes_field)
+                futures = [
+                    executor.submit(
+                        run_update, model, pk, field, sizes_field, sizes, skip=skip
+                    )
+                    for pk, name, derivatives in rows.iterator()
+                    if is_outdated(name, derivatives, sizes, skip)
+                ]
+                progress = Progress(self.stdout, model._meta.verbose_name_plural)
+                for _ in as_completed(futures):
+                    progress.advance(1)
+                progress.report()
@@ -0,0 +1,35 @@
+"""Команда расчета похожих рецептов по избранному."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import build_similarity, refresh_similarity
+
+
+class Command(BaseCommand):
+    help = (
+        "Считает похожие рецепты по совместному добавлению в избранное. "
+        "С --incremental пересчитывает только рецепты, избранное которых "
+        "менялось с прошлого запуска (для частого запуска по расписанию)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Пересчитать только рецепты с измененным избранным.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options["incremental"]:
+            count = refresh_similarity()
+        else:
+            count = build_similarity()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Похожие рецепты пересчитаны: {count} рецептов за "
+                f"{time.perf_counter() - started:.1f} с."
+            )
+        )
@@ -0,0 +1,208 @@
+"""Команда создания рецептов из recipes.csv."""
+
+import math
+from itertools import cycle
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from constants import (
+    LONG_MAX_LENGTH,
+    MAX_COOKING_MINUTES,
+    MIN_COOKING_MINUTES,
+    MIN_INGREDIENT_AMOUNT,
+)
+from recipes.catalog import bump_catalog_version, invalidate_recipe_changes, normalize
+from recipes.management.commands._import import (
+    ImportCommand,
+    Progress,
+    batched,
+    read_csv,
+)
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag, User
+from recipes.search import reindex_recipes
+
+# Единицы измерения из recipes.csv -> единицы справочника продуктов.
+UNITS = {
+    "гр": "г",
+    "стол.л.": "ст. л.",
+    "чайн.л.": "ч. л.",
+    "десерт.л.": "ст. л.",
+    "стак.": "стакан",
+    "зубч.": "зубчик",
+    "пак.": "пакет",
+}
+# Минут в единице времени приготовления.
+TIME_UNITS = {"мин": 1, "ч": 60, "д": 60 * 24}
+
+
+def parse_cooking_time(value):
+    """«1 ч 30 мин» -> 90 (в пределах допустимого времени)."""
+    tokens = value.split()
+    minutes = sum(
+        int(number) * TIME_UNITS[unit]
+        for number, unit in zip(tokens[::2], tokens[1::2], strict=True)
+    )
+    return min(max(minutes, MIN_COOKING_MINUTES), MAX_COOKING_MINUTES)
+
+
+def parse_ingredients(value):
+    """«Творог - 400 гр, Соль -  по вкусу» -> {ключ: (количество, имя, единица)}."""
+    ingredients = {}
+    for part in value.split(", "):
+        name, _, measure = part.rpartition(" - ")
+        number, _, unit = measure.strip().partition(" ")
+        try:
+            amount = max(math.ceil(float(number)), MIN_INGREDIENT_AMOUNT)
+        except ValueError:
+            # «по вкусу» и подобное без числа.
+            amount, unit = MIN_INGREDIENT_AMOUNT, measure.strip()
+        name = name.strip()
+        key = normalize(name)
+        # Повтор продукта в рецепте: складываем количество.
+        previous = ingredients[key][0] if key in ingredients else 0
+        ingredients[key] = (previous + amount, name, UNITS.get(unit, unit))
+    return ingredients
+
+
+class Command(ImportCommand):
+    help = "Создает рецепты из recipes.csv (пакетно, с картинками из dishes/)."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--copies",
+            type=int,
+            default=1,
+            help="Сколько раз загрузить файл (для наполнения стенда).",
+        )
+
+    def rows(self):
+        """Строки файла (--copies раз) с уникальными названиями рецептов."""
+        for copy in range(1, self.options["copies"] + 1):
+            for row in read_csv("recipes.csv"):
+                if copy > 1:
+                    row["title"] = f"{row['title']} #{copy}"
+                yield row
+
+    def resolve_ingredients(self, batch):
+        """Дополняем карту продуктов недостающими в справочнике."""
+        missing = {}
+        for row in batch:
+            for key, (_, name, unit) in row["ingredients"].items():
+                if key not in self.ingredients:
+                    missing.setdefault(
+                        key, Ingredient(name=name.lower(), measurement_unit=unit)
+                    )
+        if missing:
+            Ingredient.objects.bulk_create(missing.values(), ignore_conflicts=True)
+            for pk, name in Ingredient.objects.filter(
+                name__in=[ingredient.name for ingredient in missing.values()]
+            ).values_list("pk", "name"):
+                self.ingredients[normalize(name)] = pk
+            self.created_ingredients += len(missing)
+
+    def resolve_tags(self, batch):
+        """Дополняем карту тегов тегами из строк файла («Суп,sup»)."""
+        missing = {
+            slug: Tag(name=name, slug=slug)
+            for name, slug in (row["tag"].split(",") for row in batch)
+            if slug not in self.tags
+        }
+        if missing:
+            Tag.objects.bulk_create(missing.values(), ignore_conflicts=True)
+            self.tags.update(
+                Tag.objects.filter(slug__in=missing).values_list("slug", "pk")
+            )
+            bump_catalog_version(Tag)
+
+    def image_for(self, row):
+        """Своя копия картинки рецепта и ее превью."""
+        if row["image"] in self.images:
+            return self.copy_image(self.images[row["image"]])
+        self.missing_images.add(row["image"])
+        return self.copy_image(self.fallback_image)
+
+    def recipe(self, row, author):
+        image, image_sizes = self.image_for(row)
+        return Recipe(
+            author_id=author,
+            name=row["title"][:LONG_MAX_LENGTH],
+            text=row["description"],
+            cooking_time=parse_cooking_time(row["cook_time"]),
+            image=image,
+            image_sizes=image_sizes,
+        )
+
+    def load(self):
+        authors = list(
+            User.objects.filter(is_staff=False)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        if not authors:
+            raise CommandError("Нет авторов для рецептов, сначала import_users.")
+        authors = cycle(authors)
+        self.tags = dict(Tag.objects.values_list("slug", "pk"))
+        self.ingredients = {
+            normalize(name): pk
+            for pk, name in Ingredient.objects.values_list("pk", "name")
+        }
+        self.created_ingredients = 0
+        existing = set(Recipe.objects.values_list("name", flat=True))
+
+        dishes = settings.DATA_DIR / "dishes"
+        available = sorted(path.name for path in dishes.iterdir())
+        images = self.prepare_images(Recipe, [str(dishes / name) for name in available])
+        self.images = {name: images[str(dishes / name)] for name in available}
+        # Для рецептов без картинки в dishes/ берем первую доступную.
+        self.fallback_image = self.images[available[0]]
+        self.missing_images = set()
+
+        progress = Progress(self.stdout, "Рецептов создано")
+        rows = (row for row in self.rows() if row["title"] not in existing)
+        for batch in batched(rows, self.options["batch_size"]):
+            for row in batch:
+                row["ingredients"] = parse_ingredients(row["ingredients"])
+            with transaction.atomic():
+                self.resolve_ingredients(batch)
+                self.resolve_tags(batch)
+                recipes = Recipe.objects.bulk_create(
+                    self.recipe(row, next(authors)) for row in batch
+                )
+                IngredientInRecipe.objects.bulk_create(
+                    IngredientInRecipe(
+                        recipe_id=recipe.pk,
+                        ingredient_id=self.ingredients[key],
+                        amount=amount,
+                    )
+                    for recipe, row in zip(recipes, batch, strict=True)
+                    for key, (amount, _, _) in row["ingredients"].items()
+                )
+                Recipe.tags.through.objects.bulk_create(
+                    Recipe.tags.through(
+                        recipe_id=recipe.pk, tag_id=self.tags[row["tag"].split(",")[1]]
+                    )
+                    for recipe, row in zip(recipes, batch, strict=True)
+                )
+                # bulk_create не шлет сигналы: индексируем только новые рецепты.
+                reindex_recipes([recipe.pk for recipe in recipes])
+            progress.advance(len(batch))
+        progress.report()
+
+        if self.created_ingredients:
+            bump_catalog_version(Ingredient)
+        if self.missing_images:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Нет {len(self.missing_images)} картинок в dishes/, "
+                    "для их рецептов использована картинка по умолчанию."
+                )
+            )
+        # Повторный запуск без новых рецептов ничего не пересчитывает.
+        if progress.count:
+            call_command("rebuild_counters", stdout=self.stdout)
+            call_command("rebuild_feeds", stdout=self.stdout)
+        invalidate_recipe_changes()
@@ -0,0 +1,12 @@
+"""Команда загрузки справочников продуктов и тегов."""
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Загружает продукты (ingredients.json) и теги (tags.csv)."
+
+    def handle(self, *args, **options):
+        call_command("load_ingredients", stdout=self.stdout)
+        call_command("load_tags", stdout=self.stdout)
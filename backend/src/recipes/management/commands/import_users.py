@@ -0,0 +1,53 @@
+"""Команда загрузки пользователей из users.csv."""
+
+from functools import cache
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from recipes.management.commands._import import (
+    ImportCommand,
+    Progress,
+    batched,
+    read_csv,
+)
+from recipes.models import User
+
+FIELDS = ["username", "password", "first_name", "last_name", "email", "gender"]
+
+
+class Command(ImportCommand):
+    help = "Загружает пользователей из users.csv."
+
+    def load(self):
+        # Хеширование пароля намеренно медленное. Тестовые пользователи
+        # делят несколько паролей, поэтому хешируем каждый пароль один раз.
+        hash_password = cache(make_password)
+        # Уже загруженных пропускаем заранее: ignore_conflicts не сообщает,
+        # какие строки вставлены, и прогресс считал бы их загруженными.
+        existing = list(User.objects.values_list("username", "email"))
+        usernames = {username for username, _ in existing}
+        emails = {email for _, email in existing}
+        rows = (
+            row
+            for row in read_csv("users.csv", fieldnames=FIELDS)
+            if row["username"] not in usernames and row["email"] not in emails
+        )
+        progress = Progress(self.stdout, "Пользователей загружено")
+        for batch in batched(rows, self.options["batch_size"]):
+            with transaction.atomic():
+                User.objects.bulk_create(
+                    (
+                        User(
+                            username=row["username"],
+                            email=row["email"],
+                            first_name=row["first_name"],
+                            last_name=row["last_name"],
+                            password=hash_password(row["password"]),
+                        )
+                        for row in batch
+                    ),
+                    ignore_conflicts=True,
+                )
+            progress.advance(len(batch))
+        progress.report()
@@ -6,3 +6,6 @@ from recipes.models import Ingredient
 
 class Command(CommonCommand):
     model = Ingredient
+    natural_key = "name"
+    fields = ("name", "measurement_unit")
+    default_file = "ingredients.json"
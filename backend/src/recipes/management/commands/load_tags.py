@@ -6,3 +6,6 @@ from recipes.models import Tag
 
 class Command(CommonCommand):
     model = Tag
+    natural_key = "slug"
+    fields = ("name", "slug")
+    default_file = "tags.csv"
@@ -0,0 +1,76 @@
+"""Команда пересчета денормализованных счетчиков."""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, Subscribe, User
+
+# Модель -> {счетчик: (модель связи, поле связи)}.
+COUNTERS = {
+    Recipe: {"favorites_count": (Favorite, "recipe")},
+    User: {
+        "recipes_count": (Recipe, "author"),
+        "subscriptions_count": (Subscribe, "user"),
+        "subscribers_count": (Subscribe, "subscribed"),
+    },
+}
+
+
+def actual_count(model, field):
+    """Подзапрос с фактическим количеством связанных строк."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        Value(0),
+    )
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает (или проверяет) счетчики избранного, рецептов и подписок."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только проверить счетчики, завершиться с ошибкой при расхождении.",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        mismatched = 0
+        for model, counters in COUNTERS.items():
+            actual = {
+                f"actual_{counter}": actual_count(*source)
+                for counter, source in counters.items()
+            }
+            broken = model.objects.annotate(**actual).filter(
+                Q.create(
+                    [(~Q(**{counter: F(f"actual_{counter}")})) for counter in counters],
+                    connector=Q.OR,
+                )
+            )
+            count = broken.count()
+            mismatched += count
+            self.stdout.write(
+                f"{model._meta.verbose_name_plural}: расхождений {count}."
+            )
+            if count and not options["check"]:
+                model.objects.update(
+                    **{
+                        counter: actual_count(*source)
+                        for counter, source in counters.items()
+                    }
+                )
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS("Счетчики в порядке."))
+        elif options["check"]:
+            raise CommandError(f"Счетчики расходятся в {mismatched} записях.")
+        else:
+            self.stdout.write(self.style.SUCCESS("Счетчики пересчитаны."))
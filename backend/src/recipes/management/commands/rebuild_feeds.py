@@ -0,0 +1,58 @@
+"""Команда пересборки и обрезки лент подписок."""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from constants import FEED_PULL_SUBSCRIBERS
+from recipes.feed import backfill_feed, trim_feeds
+from recipes.models import FeedEntry, Subscribe, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Дополняет ленты подписок недостающими записями и убирает лишние "
+        "(после миграции или пакетной загрузки). С --trim только обрезает "
+        "длинные ленты, ее стоит запускать по расписанию."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--trim", action="store_true", help="Только обрезать длинные ленты."
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        if options["trim"]:
+            trimmed = trim_feeds()
+            self.stdout.write(self.style.SUCCESS(f"Обрезано лент: {trimmed}."))
+            return
+        User.objects.filter(
+            feed_pull=True, subscribers_count__lte=FEED_PULL_SUBSCRIBERS
+        ).update(feed_pull=False)
+        User.objects.filter(
+            feed_pull=False, subscribers_count__gt=FEED_PULL_SUBSCRIBERS
+        ).update(feed_pull=True)
+        # Ленты не пересоздаются: удаляем только записи авторов с чтением
+        # по запросу и записи без подписки, а недостающие добавляем
+        # (повторы пропускает ignore_conflicts в add_entries).
+        removed, _ = FeedEntry.objects.filter(
+            Q(author__feed_pull=True)
+            | ~Exists(
+                Subscribe.objects.filter(
+                    user=OuterRef("user"), subscribed=OuterRef("author")
+                )
+            )
+        ).delete()
+        before = FeedEntry.objects.count()
+        subscriptions = Subscribe.objects.filter(subscribed__feed_pull=False)
+        for user_id, author_id in subscriptions.values_list(
+            "user_id", "subscribed_id"
+        ).iterator():
+            backfill_feed(user_id, author_id)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Ленты обновлены, удалено записей: {removed}, "
+                f"добавлено: {FeedEntry.objects.count() - before}."
+            )
+        )
@@ -0,0 +1,18 @@
+"""Команда полного пересчета поискового индекса рецептов."""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.search import reindex_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает поисковый индекс всех рецептов (после пакетной "
+        "загрузки или переименования продуктов)."
+    )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        reindex_recipes()
+        self.stdout.write(self.style.SUCCESS("Поисковый индекс пересчитан."))
@@ -0,0 +1,32 @@
+"""Команда установки аватаров пользователям без аватара."""
+
+from itertools import cycle
+
+from django.conf import settings
+from django.db import transaction
+
+from constants import DEFAULT_USER_AVATAR
+from recipes.management.commands._import import ImportCommand, Progress, batched
+from recipes.models import User
+
+
+class Command(ImportCommand):
+    help = "Раздает пользователям с аватаром по умолчанию картинки из avatars/."
+
+    def load(self):
+        sources = sorted(
+            str(path) for path in (settings.DATA_DIR / "avatars").iterdir()
+        )
+        names = self.prepare_images(User, sources)
+        avatars = cycle(names[source] for source in sources)
+        users = (
+            User.objects.filter(avatar=DEFAULT_USER_AVATAR).only("pk").order_by("pk")
+        )
+        progress = Progress(self.stdout, "Аватаров установлено")
+        for batch in batched(users.iterator(), self.options["batch_size"]):
+            for user in batch:
+                user.avatar, user.avatar_sizes = self.copy_image(next(avatars))
+            with transaction.atomic():
+                User.objects.bulk_update(batch, ["avatar", "avatar_sizes"])
+            progress.advance(len(batch))
+        progress.report()
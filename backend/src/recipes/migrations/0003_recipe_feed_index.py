@@ -0,0 +1,14 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [("recipes", "0002_counters")]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(fields=["-pub_date", "-id"], name="recipe_feed_idx"),
+        )
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [("recipes", "0003_recipe_feed_index")]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="image_sizes",
+            field=models.JSONField(
+                blank=True, default=dict, editable=False, verbose_name="Превью картинки"
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="avatar_sizes",
+            field=models.JSONField(
+                blank=True, default=dict, editable=False, verbose_name="Превью аватара"
+            ),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:11
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# SQL на момент миграции, без импорта recipes.search: код приложения
+# меняется, а миграция должна выполняться так же.
+FTS_TABLE = "recipes_recipe_fts"
+POSTGRES_FILL = """
+    UPDATE {recipe} r SET search_vector =
+        setweight(to_tsvector('russian',
+            translate(coalesce(r.name, ''), 'ёЁ', 'еЕ')), 'A')
+        || setweight(to_tsvector('russian',
+            translate(coalesce(r.text, ''), 'ёЁ', 'еЕ')), 'B')
+        || setweight(to_tsvector('russian', translate(coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM {amount} ir
+            JOIN {ingredient} i ON i.id = ir.ingredient_id
+            WHERE ir.recipe_id = r.id
+        ), ''), 'ёЁ', 'еЕ')), 'C')
+"""
+SQLITE_FILL = f"""
+    INSERT INTO {FTS_TABLE}(rowid, name, text, ingredients)
+    SELECT
+        r.id,
+        replace(replace(r.name, 'ё', 'е'), 'Ё', 'Е'),
+        replace(replace(r.text, 'ё', 'е'), 'Ё', 'Е'),
+        (
+            SELECT replace(replace(group_concat(i.name, ' '), 'ё', 'е'), 'Ё', 'Е')
+            FROM {{amount}} ir
+            JOIN {{ingredient}} i ON i.id = ir.ingredient_id
+            WHERE ir.recipe_id = r.id
+        )
+    FROM {{recipe}} r
+"""
+
+
+def tables(apps):
+    return {
+        name: apps.get_model("recipes", model)._meta.db_table
+        for name, model in (
+            ("recipe", "Recipe"),
+            ("amount", "IngredientInRecipe"),
+            ("ingredient", "Ingredient"),
+        )
+    }
+
+
+def create_search_index(apps, schema_editor):
+    # GIN-индекс на PostgreSQL или таблица FTS5 на SQLite.
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX recipe_search_idx ON recipes_recipe USING gin (search_vector)"
+        )
+        schema_editor.execute(POSTGRES_FILL.format(**tables(apps)))
+    else:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            "name, text, ingredients, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(SQLITE_FILL.format(**tables(apps)))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS recipe_search_idx")
+    else:
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [("recipes", "0004_image_sizes")]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
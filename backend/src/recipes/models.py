@@ -1,5 +1,5 @@
-from backend.settings import AVATARS_URL
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
 
@@ -14,6 +14,7 @@ from constants import (
     TAG_MAX_LENGTH,
     USERNAME_PATTERN,
 )
+from foodgram.settings import AVATARS_URL
 
 
 class User(AbstractUser):
@@ -36,11 +37,26 @@ class User(AbstractUser):
         blank=True,
         default=DEFAULT_USER_AVATAR,
     )
-    REQUIRED_FIELDS = [
-        "username",
-        "first_name",
-        "last_name",
-    ]
+    # Превью аватара {размер: {формат: файл}}, строит recipes.images.
+    avatar_sizes = models.JSONField(
+        verbose_name="Превью аватара", default=dict, blank=True, editable=False
+    )
+    # Денормализованные счетчики, поддерживаются сигналами recipes.signals.
+    recipes_count = models.PositiveIntegerField(
+        verbose_name="Рецептов", default=0, editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        verbose_name="Подписчиков", default=0, editable=False
+    )
+    subscriptions_count = models.PositiveIntegerField(
+        verbose_name="Подписок", default=0, editable=False
+    )
+    # Рецепты автора не раскладываются по лентам подписчиков, а
+    # подмешиваются при чтении (recipes.feed).
+    feed_pull = models.BooleanField(
+        verbose_name="Лента по запросу", default=False, editable=False
+    )
+    REQUIRED_FIELDS = ["username", "first_name", "last_name"]
     USERNAME_FIELD = "email"
 
     class Meta:
@@ -55,11 +71,13 @@ class User(AbstractUser):
 class Subscribe(models.Model):
     """Модель подписки пользователей друг на друга."""
 
+    # Отдельный индекс не нужен: его заменяет unique_subscription.
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name="followers",
         verbose_name="Пользователь",
+        db_index=False,
     )
     subscribed = models.ForeignKey(
         User,
@@ -92,11 +110,7 @@ class Tag(models.Model):
     name = models.CharField(
         verbose_name="Название", max_length=TAG_MAX_LENGTH, unique=True
     )
-    slug = models.SlugField(
-        verbose_name="Слаг",
-        max_length=TAG_MAX_LENGTH,
-        unique=True,
-    )
+    slug = models.SlugField(verbose_name="Слаг", max_length=TAG_MAX_LENGTH, unique=True)
 
     class Meta:
         default_related_name = "tags"
@@ -133,26 +147,89 @@ class Ingredient(models.Model):
         return f"{self.name} ({self.measurement_unit})"
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Запросы рецептов для полного отображения без N+1."""
+
+    def with_related(self, user=None):
+        """Подтягиваем автора, теги и продукты фиксированным числом запросов."""
+        authors = User.objects.all()
+        if user is not None and user.is_authenticated:
+            authors = authors.annotate(
+                is_subscribed=models.Exists(
+                    Subscribe.objects.filter(
+                        user=user, subscribed=models.OuterRef("pk")
+                    )
+                )
+            )
+        return self.prefetch_related(
+            models.Prefetch("author", queryset=authors),
+            "tags",
+            models.Prefetch(
+                "ingredients_in_recipe",
+                queryset=IngredientInRecipe.objects.select_related(
+                    "ingredient"
+                ).order_by("ingredient__name"),
+            ),
+        )
+
+
 class Recipe(models.Model):
     """Модель рецепта."""
 
-    author = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Автор")
+    # Индекс по автору - recipe_author_feed_idx.
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, verbose_name="Автор", db_index=False
+    )
     name = models.CharField(max_length=LONG_MAX_LENGTH, verbose_name="Название")
     image = models.ImageField(
         upload_to="recipe_images", verbose_name="Ссылка на картинку на сайте"
     )
+    # Превью картинки {размер: {формат: файл}}, строит recipes.images.
+    image_sizes = models.JSONField(
+        verbose_name="Превью картинки", default=dict, blank=True, editable=False
+    )
     text = models.TextField(verbose_name="Описание")
     tags = models.ManyToManyField(Tag, verbose_name="Список тегов")
     cooking_time = models.SmallIntegerField(
         verbose_name="Время (мин)", validators=[MinValueValidator(MIN_COOKING_MINUTES)]
     )
     pub_date = models.DateTimeField(auto_now_add=True, verbose_name="Дата публикации")
+    # Денормализованный счетчик, поддерживается сигналами recipes.signals.
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном", default=0, editable=False
+    )
+    # Избранное рецепта менялось после расчета похожих (recipes.similarity).
+    similarity_outdated = models.BooleanField(
+        verbose_name="Похожие устарели", default=False, editable=False
+    )
+    # Поисковый вектор для PostgreSQL, поддерживается recipes.search.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         default_related_name = "recipes"
         verbose_name = "рецепт"
         verbose_name_plural = "Рецепты"
         ordering = ("-pub_date",)
+        indexes = [
+            # Лента и курсорная пагинация по (pub_date, id).
+            models.Index(fields=["-pub_date", "-id"], name="recipe_feed_idx"),
+            # Рецепты автора в том же порядке: фильтр ?author= и подписки.
+            models.Index(
+                fields=["author", "-pub_date", "-id"], name="recipe_author_feed_idx"
+            ),
+            # Сортировка по популярности.
+            models.Index(
+                fields=["-favorites_count", "-pub_date"], name="recipe_popularity_idx"
+            ),
+            # Очередь пересчета похожих рецептов (частичный индекс).
+            models.Index(
+                fields=["id"],
+                condition=models.Q(similarity_outdated=True),
+                name="recipe_similarity_outdated_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -161,15 +238,12 @@ class Recipe(models.Model):
 class IngredientInRecipe(models.Model):
     """Продукты в рецепте."""
 
+    # Отдельный индекс не нужен: его заменяет unique_in_recipe.
     recipe = models.ForeignKey(
-        Recipe,
-        on_delete=models.CASCADE,
-        verbose_name="Рецепт",
+        Recipe, on_delete=models.CASCADE, verbose_name="Рецепт", db_index=False
     )
     ingredient = models.ForeignKey(
-        Ingredient,
-        on_delete=models.CASCADE,
-        verbose_name="Продукт",
+        Ingredient, on_delete=models.CASCADE, verbose_name="Продукт"
     )
 
     amount = models.IntegerField(
@@ -180,7 +254,6 @@ class IngredientInRecipe(models.Model):
         verbose_name = "продукты в рецепте"
         verbose_name_plural = "Продукты в рецепте"
         default_related_name = "ingredients_in_recipe"
-        ordering = ("ingredient__name",)
         constraints = [
             # Продукт входит в рецепт один раз.
             models.UniqueConstraint(
@@ -190,22 +263,18 @@ class IngredientInRecipe(models.Model):
 
     def __str__(self):
         return (
-            f"{self.ingredient.name} - {self.amount} "
-            f"{self.ingredient.measurement_unit}"
+            f"{self.ingredient.name} - {self.amount} {self.ingredient.measurement_unit}"
         )
 
 
 class Mark(models.Model):
     """Базовый класс для отметок (избранного и корзины)."""
 
+    # Индексы по пользователю - unique_in_* и *_user_recent_idx.
     user = models.ForeignKey(
-        User, on_delete=models.CASCADE, verbose_name="Пользователь"
-    )
-    recipe = models.ForeignKey(
-        Recipe,
-        on_delete=models.CASCADE,
-        verbose_name="Рецепт",
+        User, on_delete=models.CASCADE, verbose_name="Пользователь", db_index=False
     )
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, verbose_name="Рецепт")
 
     class Meta:
         abstract = True
@@ -216,6 +285,10 @@ class Mark(models.Model):
                 fields=["user", "recipe"], name="unique_in_%(class)s"
             )
         ]
+        indexes = [
+            # Последние отметки пользователя (рекомендации) без сортировки.
+            models.Index(fields=["user", "-id"], name="%(class)s_user_recent_idx")
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.recipe.name}"
@@ -235,3 +308,63 @@ class ShoppingCart(Mark):
     class Meta(Mark.Meta):
         verbose_name = "корзина"
         verbose_name_plural = "Корзины"
+
+
+class RecipeSimilarity(models.Model):
+    """Похожий рецепт: сосед по совместному добавлению в избранное."""
+
+    # Отдельный индекс не нужен: его заменяет unique_similarity.
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similarities",
+        verbose_name="Рецепт",
+        db_index=False,
+    )
+    similar = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name="+", verbose_name="Похожий"
+    )
+    score = models.FloatField(verbose_name="Сходство")
+
+    class Meta:
+        verbose_name = "похожий рецепт"
+        verbose_name_plural = "Похожие рецепты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipe", "similar"], name="unique_similarity"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} ~ {self.similar} ({self.score:.2f})"
+
+
+class FeedEntry(models.Model):
+    """Запись ленты подписок: рецепт автора в ленте подписчика."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Подписчик")
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, verbose_name="Рецепт")
+    # Автор и дата копируются из рецепта: для отписки и порядка ленты.
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="+", verbose_name="Автор"
+    )
+    pub_date = models.DateTimeField(verbose_name="Дата публикации")
+
+    class Meta:
+        default_related_name = "feed_entries"
+        verbose_name = "запись ленты"
+        verbose_name_plural = "Ленты подписок"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "recipe"], name="unique_in_feed")
+        ]
+        indexes = [
+            # Чтение ленты с курсором по (pub_date, recipe_id).
+            models.Index(
+                fields=["user", "-pub_date", "-recipe"], name="feed_entry_idx"
+            ),
+            # Удаление записей автора при отписке.
+            models.Index(fields=["user", "author"], name="feed_entry_author_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.recipe}"
@@ -0,0 +1,216 @@
+"""Полнотекстовый поиск рецептов по названию, описанию и продуктам.
+
+На PostgreSQL поисковый вектор хранится в Recipe.search_vector
+(русская морфология, GIN-индекс), на SQLite - в виртуальной таблице FTS5
+(без морфологии, слова ищутся по префиксу). Индекс обновляется сигналами
+после коммита, целиком - командой rebuild_search_index.
+"""
+
+import json
+import re
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, FloatField
+from django.db.models.expressions import RawSQL
+
+from constants import (
+    SEARCH_CONFIG,
+    SEARCH_HIGHLIGHT,
+    SEARCH_MAX_RESULTS,
+    SEARCH_SNIPPET_WORDS,
+)
+
+FTS_TABLE = "recipes_recipe_fts"
+# Веса колонок name, text, ingredients для bm25 (как A/B/C в PostgreSQL).
+FTS_WEIGHTS = "10.0, 4.0, 2.0"
+# Порция id в одном запросе SQLite (предел параметров 999).
+SQLITE_BATCH = 500
+
+# Ни морфология PostgreSQL, ни токенизатор FTS5 не приравнивают ё к е.
+POSTGRES_VECTOR = f"""
+    setweight(to_tsvector('{SEARCH_CONFIG}',
+        translate(coalesce(r.name, ''), 'ёЁ', 'еЕ')), 'A')
+    || setweight(to_tsvector('{SEARCH_CONFIG}',
+        translate(coalesce(r.text, ''), 'ёЁ', 'еЕ')), 'B')
+    || setweight(to_tsvector('{SEARCH_CONFIG}', translate(coalesce((
+        SELECT string_agg(i.name, ' ')
+        FROM recipes_ingredientinrecipe ir
+        JOIN recipes_ingredient i ON i.id = ir.ingredient_id
+        WHERE ir.recipe_id = r.id
+    ), ''), 'ёЁ', 'еЕ')), 'C')
+"""
+SQLITE_ROWS = """
+    SELECT
+        r.id,
+        replace(replace(r.name, 'ё', 'е'), 'Ё', 'Е'),
+        replace(replace(r.text, 'ё', 'е'), 'Ё', 'Е'),
+        (
+            SELECT replace(replace(group_concat(i.name, ' '), 'ё', 'е'), 'Ё', 'Е')
+            FROM recipes_ingredientinrecipe ir
+            JOIN recipes_ingredient i ON i.id = ir.ingredient_id
+            WHERE ir.recipe_id = r.id
+        )
+    FROM recipes_recipe r
+"""
+
+
+def is_postgres(db=connection):
+    return db.vendor == "postgresql"
+
+
+def batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), SQLITE_BATCH):
+        yield ids[start : start + SQLITE_BATCH]
+
+
+def reindex_recipes(ids=None, db=connection):
+    """Пересчитываем поисковый индекс рецептов ids (None - всех)."""
+    with db.cursor() as cursor:
+        if is_postgres(db):
+            sql = f"UPDATE recipes_recipe r SET search_vector = {POSTGRES_VECTOR}"
+            if ids is None:
+                cursor.execute(sql)
+            else:
+                cursor.execute(f"{sql} WHERE r.id = ANY(%s)", [list(ids)])
+            return
+        if ids is None:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, name, text, ingredients) {SQLITE_ROWS}"
+            )
+            return
+        for batch in batches(ids):
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", batch
+            )
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, name, text, ingredients) "
+                f"{SQLITE_ROWS} WHERE r.id IN ({placeholders})",
+                batch,
+            )
+
+
+def unindex_recipes(ids):
+    """Убираем удаленные рецепты из FTS5 (в PostgreSQL вектор - в строке)."""
+    if is_postgres():
+        return
+    with connection.cursor() as cursor:
+        for batch in batches(ids):
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", batch
+            )
+
+
+def fts_query(text):
+    """Запрос FTS5: все слова обязательны, каждое - как префикс."""
+    return " ".join(
+        '"{}"*'.format(word.replace('"', '""')) for word in re.findall(r"\w+", text)
+    )
+
+
+def normalize_yo(text):
+    return text.replace("ё", "е").replace("Ё", "Е")
+
+
+def highlight_text(text, query, snippet_words=None):
+    """Подсветка совпадений (для SQLite: FTS5 умеет это только внутри MATCH).
+
+    С snippet_words возвращается фрагмент из стольких слов вокруг первого
+    совпадения.
+    """
+    words = tuple(word.casefold() for word in re.findall(r"\w+", normalize_yo(query)))
+    # ё -> е не меняет длину строки, поэтому позиции совпадают с оригиналом.
+    matches = list(re.finditer(r"\w+", normalize_yo(text)))
+    found = [match.group().casefold().startswith(words) for match in matches]
+    left, right = 0, len(text)
+    if snippet_words and len(matches) > snippet_words:
+        first = found.index(True) if True in found else 0
+        begin = max(0, min(first - snippet_words // 2, len(matches) - snippet_words))
+        matches = matches[begin : begin + snippet_words]
+        found = found[begin : begin + snippet_words]
+        left, right = matches[0].start(), matches[-1].end()
+    start, stop = SEARCH_HIGHLIGHT
+    parts, position = ["…" if left else ""], left
+    for match, is_found in zip(matches, found, strict=True):
+        if is_found:
+            parts += [text[position : match.start()], start]
+            parts += [text[match.start() : match.end()], stop]
+            position = match.end()
+    parts += [text[position:right], "…" if right < len(text) else ""]
+    return "".join(parts)
+
+
+def highlights(recipe, query):
+    """Подсвеченные название и фрагмент описания найденного рецепта."""
+    if hasattr(recipe, "name_highlight"):
+        return {"name": recipe.name_highlight, "text": recipe.text_highlight}
+    return {
+        "name": highlight_text(recipe.name, query),
+        "text": highlight_text(recipe.text, query, SEARCH_SNIPPET_WORDS),
+    }
+
+
+def search_recipes(recipes, text):
+    """Отбираем рецепты по запросу и добавляем релевантность и подсветку.
+
+    Аннотации: search_rank (больше - лучше), на PostgreSQL еще
+    name_highlight и text_highlight (см. highlights).
+    """
+    text = normalize_yo(text)
+    if is_postgres():
+        start, stop = SEARCH_HIGHLIGHT
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+        return (
+            recipes.filter(search_vector=query)
+            .annotate(
+                search_rank=SearchRank(F("search_vector"), query),
+                name_highlight=SearchHeadline(
+                    "name",
+                    query,
+                    config=SEARCH_CONFIG,
+                    start_sel=start,
+                    stop_sel=stop,
+                    highlight_all=True,
+                ),
+                text_highlight=SearchHeadline(
+                    "text",
+                    query,
+                    config=SEARCH_CONFIG,
+                    start_sel=start,
+                    stop_sel=stop,
+                    max_words=SEARCH_SNIPPET_WORDS,
+                    min_words=SEARCH_SNIPPET_WORDS // 2,
+                ),
+            )
+            .order_by("-search_rank", "-id")
+        )
+    query = fts_query(text)
+    if not query:
+        return recipes.none()
+    # Кандидатов с релевантностью берем одним запросом к FTS5: подзапрос
+    # с MATCH на каждую строку (ранжирование, подсветка) в разы медленнее.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, -bm25({FTS_TABLE}, {FTS_WEIGHTS}) AS search_rank "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            "ORDER BY search_rank DESC LIMIT %s",
+            [query, SEARCH_MAX_RESULTS],
+        )
+        ranks = json.dumps(dict(cursor.fetchall()))
+    return (
+        recipes.filter(
+            id__in=RawSQL("SELECT CAST(key AS INTEGER) FROM json_each(%s)", [ranks])
+        )
+        .annotate(
+            search_rank=RawSQL(
+                """json_extract(%s, '$."' || recipes_recipe.id || '"')""",
+                [ranks],
+                output_field=FloatField(),
+            )
+        )
+        .order_by("-search_rank", "-id")
+    )
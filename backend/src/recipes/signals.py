@@ -0,0 +1,268 @@
+"""Поддержка счетчиков, версий справочников, превью, поиска и лент подписок."""
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from constants import AVATAR_IMAGE_SIZES, DEFAULT_USER_AVATAR, RECIPE_IMAGE_SIZES
+from recipes.catalog import (
+    bump_catalog_version,
+    invalidate_recipe_changes,
+    record_recipe_change,
+)
+from recipes.feed import (
+    backfill_feed,
+    fan_out,
+    remove_from_feed,
+    remove_subscriptions_from_feeds,
+    update_feed_pull,
+)
+from recipes.images import (
+    delete_derivatives,
+    is_outdated,
+    is_shared,
+    schedule_derivatives,
+)
+from recipes.links import forget_recipe
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientInRecipe,
+    Recipe,
+    Subscribe,
+    Tag,
+    User,
+)
+from recipes.search import reindex_recipes, unindex_recipes
+
+
+def change_counter(model, pk, field, delta, **fields):
+    """Атомарно меняем счетчик на delta одним UPDATE (не уходя ниже нуля)."""
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)}, **fields
+    )
+
+
+def discount(model, field, rows, key, **fields):
+    """Уменьшаем счетчик field на число строк rows, ссылающихся по key.
+
+    Один UPDATE на все затронутые объекты: число строк у каждого
+    считается подзапросом, а не запросом на строку.
+    """
+    count = (
+        rows.filter(**{key: OuterRef("pk")})
+        .order_by()
+        .values(key)
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    model.objects.filter(pk__in=rows.values(key)).update(
+        **{field: Greatest(F(field) - Subquery(count), 0)}, **fields
+    )
+
+
+def deleted_in_bulk(instance, origin):
+    """Строку удаляет не ее delete(), а каскад или queryset.delete().
+
+    Такие удаления обрабатываются пачкой в pre_delete источника (origin),
+    построчные приемники их пропускают.
+    """
+    return origin is not None and origin is not instance
+
+
+def first_signal(origin, name):
+    """Первый сигнал удаления от origin: пачку обрабатываем один раз."""
+    if origin.__dict__.get(name):
+        return False
+    origin.__dict__[name] = True
+    return True
+
+
+def queryset_origin(origin, model):
+    """origin - queryset model, и это первый его сигнал удаления."""
+    return (
+        isinstance(origin, QuerySet)
+        and origin.model is model
+        and first_signal(origin, f"_{model._meta.model_name}_deleting")
+    )
+
+
+# Избранное меняет и счетчик, и очередь пересчета похожих рецептов
+# (build_similarity --incremental) - одним UPDATE.
+@receiver(post_save, sender=Favorite)
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe, instance.recipe_id, "favorites_count", 1, similarity_outdated=True
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, origin=None, **kwargs):
+    if not deleted_in_bulk(instance, origin):
+        change_counter(
+            Recipe, instance.recipe_id, "favorites_count", -1, similarity_outdated=True
+        )
+
+
+@receiver(pre_delete, sender=Favorite)
+def favorites_deleting(sender, instance, origin=None, **kwargs):
+    # Каскад от рецепта удаляет избранное вместе с рецептом, от
+    # пользователя - обрабатывает user_deleting.
+    if queryset_origin(origin, Favorite):
+        discount(Recipe, "favorites_count", origin, "recipe", similarity_outdated=True)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, "recipes_count", 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, origin=None, **kwargs):
+    if not deleted_in_bulk(instance, origin):
+        change_counter(User, instance.author_id, "recipes_count", -1)
+        unindex_recipes([instance.pk])
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipes_deleting(sender, instance, origin=None, **kwargs):
+    # Рецепты удаляет каскадом только удаление автора (user_deleting).
+    if queryset_origin(origin, Recipe):
+        discount(User, "recipes_count", origin, "author")
+        unindex_recipes(origin.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Subscribe)
+def subscribe_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.user_id, "subscriptions_count", 1)
+        change_counter(User, instance.subscribed_id, "subscribers_count", 1)
+
+
+@receiver(post_delete, sender=Subscribe)
+def subscribe_deleted(sender, instance, origin=None, **kwargs):
+    if not deleted_in_bulk(instance, origin):
+        change_counter(User, instance.user_id, "subscriptions_count", -1)
+        change_counter(User, instance.subscribed_id, "subscribers_count", -1)
+        remove_from_feed(instance.user_id, instance.subscribed_id)
+
+
+@receiver(pre_delete, sender=Subscribe)
+def subscriptions_deleting(sender, instance, origin=None, **kwargs):
+    if queryset_origin(origin, Subscribe):
+        discount(User, "subscriptions_count", origin, "user")
+        discount(User, "subscribers_count", origin, "subscribed")
+        remove_subscriptions_from_feeds(origin)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Рецепты, избранное и подписки пользователя удаляются каскадом: их
+    # счетчики - по UPDATE на каждый, а не на каждую строку. Рецепты
+    # пользователя удаляются тоже, их счетчики не трогаем. Записи лент
+    # уходят каскадом.
+    discount(
+        Recipe,
+        "favorites_count",
+        Favorite.objects.filter(user=instance).exclude(recipe__author=instance),
+        "recipe",
+        similarity_outdated=True,
+    )
+    discount(User, "subscribers_count", instance.followers.all(), "subscribed")
+    discount(User, "subscriptions_count", instance.authors.all(), "user")
+    unindex_recipes(instance.recipes.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        fan_out(instance)
+
+
+@receiver(post_save, sender=Subscribe)
+def subscription_feed_created(sender, instance, created, **kwargs):
+    # После subscribe_created: счетчик подписчиков уже обновлен.
+    if created:
+        update_feed_pull(instance.subscribed_id)
+        backfill_feed(instance.user_id, instance.subscribed_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version(sender)
+
+
+# Картинки с превью: модель -> (поле картинки, поле превью, размеры, пропуск).
+DERIVATIVES = {
+    Recipe: ("image", "image_sizes", RECIPE_IMAGE_SIZES, ()),
+    User: ("avatar", "avatar_sizes", AVATAR_IMAGE_SIZES, (DEFAULT_USER_AVATAR,)),
+}
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def image_saved(sender, instance, **kwargs):
+    field, sizes_field, sizes, skip = DERIVATIVES[sender]
+    if is_outdated(
+        getattr(instance, field).name, getattr(instance, sizes_field), sizes, skip
+    ):
+        schedule_derivatives(sender, instance.pk, field, sizes_field, sizes, skip=skip)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def image_deleted(sender, instance, **kwargs):
+    sizes_field = DERIVATIVES[sender][1]
+    derivatives = getattr(instance, sizes_field)
+    if derivatives and not is_shared(sender, sizes_field, derivatives):
+        transaction.on_commit(lambda: delete_derivatives(derivatives))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    # После коммита: продукты рецепта к этому моменту уже записаны.
+    transaction.on_commit(lambda: reindex_recipes([instance.pk]))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    # Состав рецепта для индекса подбора по продуктам (api.recipe_matcher).
+    # pk берем сразу: после удаления Django обнуляет его у объекта.
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: record_recipe_change(recipe_id))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_link_changed(sender, instance, created=True, **kwargs):
+    # Короткая ссылка: сбрасываем закэшированное отсутствие нового рецепта
+    # и наличие удаленного.
+    if created:
+        recipe_id = instance.pk
+        transaction.on_commit(lambda: forget_recipe(recipe_id))
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    # Каскадное удаление строк состава сигналов рецептов не шлет.
+    transaction.on_commit(invalidate_recipe_changes)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(
+            lambda: reindex_recipes(
+                IngredientInRecipe.objects.filter(ingredient=instance).values_list(
+                    "recipe_id", flat=True
+                )
+            )
+        )
@@ -0,0 +1,206 @@
+"""Похожие рецепты и рекомендации по совместному добавлению в избранное.
+
+Сходство двух рецептов - косинус между их столбцами в разреженной матрице
+«пользователь x рецепт» избранного: число пользователей, добавивших оба,
+деленное на корень из произведения числа добавлений каждого. Для каждого
+рецепта храним SIMILARITY_TOP_K ближайших соседей (RecipeSimilarity),
+их считает команда build_similarity; запросы API читают только эту таблицу.
+"""
+
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from scipy import sparse
+
+from constants import (
+    SIMILARITY_BATCH_SIZE,
+    SIMILARITY_CHUNK_WORK,
+    SIMILARITY_MIN_COMMON,
+    SIMILARITY_TOP_K,
+    SIMILARITY_USER_FAVORITES,
+)
+from recipes.models import Favorite, Recipe, RecipeSimilarity
+
+
+class FavoritesMatrix:
+    """Матрица избранного и ее транспонированная копия для срезов по рецептам."""
+
+    def __init__(self, pairs):
+        """pairs - массив n x 2 пар (пользователь, рецепт) без повторов."""
+        users, user_index = np.unique(pairs[:, 0], return_inverse=True)
+        self.recipe_ids, recipe_index = np.unique(pairs[:, 1], return_inverse=True)
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.float32), (user_index, recipe_index)),
+            shape=(len(users), len(self.recipe_ids)),
+        )
+        self.by_recipe = self.matrix.T.tocsr()
+        self.norms = np.sqrt(np.diff(self.by_recipe.indptr))
+        # Число произведений при расчете строки рецепта: сумма числа
+        # отметок его пользователей. По нему делим рецепты на блоки.
+        self.work = self.by_recipe @ np.diff(self.matrix.indptr).astype(np.float64)
+
+    @classmethod
+    def load(cls):
+        pairs = Favorite.objects.values_list("user_id", "recipe_id")
+        return cls(
+            np.fromiter(
+                chain.from_iterable(pairs.iterator(chunk_size=10000)), dtype=np.int64
+            ).reshape(-1, 2)
+        )
+
+    def positions(self, recipe_ids):
+        """Позиции рецептов в матрице (рецепты без избранного пропускаются)."""
+        recipe_ids = np.asarray(list(recipe_ids), dtype=np.int64)
+        found = np.searchsorted(self.recipe_ids, recipe_ids)
+        found = found[found < len(self.recipe_ids)]
+        return found[np.isin(self.recipe_ids[found], recipe_ids)]
+
+    def neighbors(self, positions):
+        """Ближайшие соседи рецептов positions: (рецепт, сосед, сходство).
+
+        Считаем блок X[:, positions]^T X целиком в разреженном виде, затем
+        отбираем SIMILARITY_TOP_K лучших в каждой строке одной сортировкой.
+        """
+        common = (self.by_recipe[positions] @ self.matrix).tocoo()
+        rows, columns, counts = common.row, common.col, common.data
+        keep = (counts >= SIMILARITY_MIN_COMMON) & (columns != positions[rows])
+        rows, columns, counts = rows[keep], columns[keep], counts[keep]
+        scores = counts / (self.norms[positions[rows]] * self.norms[columns])
+        # По строке, затем по убыванию сходства, при равенстве - по id.
+        order = np.lexsort((columns, -scores, rows))
+        rows, columns, scores = rows[order], columns[order], scores[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        keep = rank < SIMILARITY_TOP_K
+        return (
+            self.recipe_ids[positions[rows[keep]]],
+            self.recipe_ids[columns[keep]],
+            scores[keep],
+        )
+
+    def all_neighbors(self, positions=None):
+        """Соседи рецептов блоками примерно по SIMILARITY_CHUNK_WORK произведений.
+
+        Блок ограничиваем работой, а не числом строк: строки популярных
+        рецептов почти плотные, и фиксированный блок из них не влез бы
+        в память.
+        """
+        if positions is None:
+            positions = np.arange(len(self.recipe_ids))
+        cumulative = np.cumsum(self.work[positions])
+        start = 0
+        while start < len(positions):
+            done = cumulative[start - 1] if start else 0
+            stop = max(
+                start + 1,
+                np.searchsorted(cumulative, done + SIMILARITY_CHUNK_WORK, side="right"),
+            )
+            yield self.neighbors(positions[start:stop])
+            start = stop
+
+
+def save_neighbors(chunks):
+    for recipe_ids, similar_ids, scores in chunks:
+        RecipeSimilarity.objects.bulk_create(
+            [
+                RecipeSimilarity(
+                    recipe_id=recipe_id, similar_id=similar_id, score=score
+                )
+                for recipe_id, similar_id, score in zip(
+                    recipe_ids.tolist(),
+                    similar_ids.tolist(),
+                    scores.tolist(),
+                    strict=True,
+                )
+            ],
+            batch_size=SIMILARITY_BATCH_SIZE,
+        )
+
+
+def build_similarity():
+    """Пересчитываем соседей всех рецептов, возвращаем число рецептов."""
+    Recipe.objects.filter(similarity_outdated=True).update(similarity_outdated=False)
+    favorites = FavoritesMatrix.load()
+    chunks = list(favorites.all_neighbors())
+    with transaction.atomic():
+        RecipeSimilarity.objects.all().delete()
+        save_neighbors(chunks)
+    return len(favorites.recipe_ids)
+
+
+def refresh_similarity():
+    """Пересчитываем только рецепты, избранное которых менялось.
+
+    Вместе с ними пересчитываются рецепты, у которых они были или стали
+    соседями. Рецепт, в соседи которого измененный мог попасть впервые,
+    не пересчитывается - это догоняет полная сборка.
+    Возвращаем число пересчитанных рецептов.
+    """
+    outdated = Recipe.objects.filter(similarity_outdated=True)
+    changed = set(outdated.values_list("id", flat=True))
+    if not changed:
+        return 0
+    # Флаг снимаем до чтения избранного: изменения во время сборки
+    # снова его поставят и попадут в следующий запуск.
+    outdated.filter(id__in=changed).update(similarity_outdated=False)
+    try:
+        favorites = FavoritesMatrix.load()
+        chunks = list(favorites.all_neighbors(favorites.positions(changed)))
+        affected = (
+            set(
+                RecipeSimilarity.objects.filter(similar_id__in=changed).values_list(
+                    "recipe_id", flat=True
+                )
+            )
+            | {pk for _, similar_ids, _ in chunks for pk in similar_ids.tolist()}
+        ) - changed
+        chunks += favorites.all_neighbors(favorites.positions(affected))
+        with transaction.atomic():
+            RecipeSimilarity.objects.filter(recipe_id__in=changed | affected).delete()
+            save_neighbors(chunks)
+    except Exception:
+        Recipe.objects.filter(id__in=changed).update(similarity_outdated=True)
+        raise
+    return len(changed | affected)
+
+
+def similar_recipes(recipe_id, limit):
+    """[(id, сходство)] ближайших к рецепту по убыванию сходства."""
+    return list(
+        RecipeSimilarity.objects.filter(recipe_id=recipe_id)
+        .order_by("-score", "similar_id")
+        .values_list("similar_id", "score")[:limit]
+    )
+
+
+def recommended_recipes(user, limit):
+    """[(id, оценка)] рекомендаций пользователю.
+
+    Оценка - сумма сходств с последними SIMILARITY_USER_FAVORITES
+    рецептами из его избранного. Если рекомендаций меньше limit (новый
+    пользователь, мало отметок), добираем популярными с оценкой None.
+    """
+    favorites = list(
+        Favorite.objects.filter(user=user)
+        .order_by("-id")
+        .values_list("recipe_id", flat=True)[:SIMILARITY_USER_FAVORITES]
+    )
+    recommended = list(
+        RecipeSimilarity.objects.filter(recipe_id__in=favorites)
+        .exclude(similar_id__in=favorites)
+        .values("similar_id")
+        .annotate(total=Sum("score"))
+        .order_by("-total", "similar_id")
+        .values_list("similar_id", "total")[:limit]
+    )
+    if len(recommended) < limit:
+        seen = {recipe_id for recipe_id, _ in recommended}
+        recommended += [
+            (recipe_id, None)
+            for recipe_id in Recipe.objects.exclude(id__in=favorites)
+            .order_by("-favorites_count", "-pub_date")
+            .values_list("id", flat=True)[: limit + len(seen)]
+            if recipe_id not in seen
+        ][: limit - len(recommended)]
+    return recommended
@@ -0,0 +1,381 @@
+import io
+import json
+import tempfile
+from pathlib import Path
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from api.tests import create_recipes, create_user
+from constants import IMAGE_MAX_SIDE, RECIPE_IMAGE_SIZES
+from recipes.feed import add_entries, timeline
+from recipes.images import update_derivatives
+from recipes.links import decode_code, local_cache, short_code
+from recipes.management.commands._load_data import iter_json_array
+from recipes.models import Favorite, FeedEntry, Ingredient, Recipe, Subscribe, Tag, User
+
+
+class DeleteQueriesTest(TestCase):
+    """Каскадное удаление обновляет счетчики пачкой, а не по строке."""
+
+    def create_marked_recipe(self, readers):
+        author = create_user(f"author_{readers}")
+        recipe = create_recipes([author], count=1)[0]
+        for number in range(readers):
+            reader = create_user(f"reader_{readers}_{number}")
+            Favorite.objects.create(user=reader, recipe=recipe)
+            Subscribe.objects.create(user=reader, subscribed=author)
+        return author, recipe
+
+    def create_reader(self, marks):
+        reader = create_user(f"reader_{marks}")
+        for number in range(marks):
+            author = create_user(f"author_{marks}_{number}")
+            recipe = create_recipes([author], count=1)[0]
+            Favorite.objects.create(user=reader, recipe=recipe)
+            Subscribe.objects.create(user=reader, subscribed=author)
+            Subscribe.objects.create(user=author, subscribed=reader)
+        return reader
+
+    def count_queries(self, delete):
+        with CaptureQueriesContext(connection) as context:
+            delete()
+        return len(context.captured_queries)
+
+    def test_recipe_delete(self):
+        counts = [
+            self.count_queries(self.create_marked_recipe(readers)[1].delete)
+            for readers in (2, 10)
+        ]
+        self.assertEqual(counts[0], counts[1])
+
+    def test_author_delete(self):
+        counts = [
+            self.count_queries(self.create_marked_recipe(readers)[0].delete)
+            for readers in (2, 10)
+        ]
+        self.assertEqual(counts[0], counts[1])
+        self.assertFalse(User.objects.filter(subscriptions_count__gt=0).exists())
+
+    def test_reader_delete(self):
+        readers = [self.create_reader(marks) for marks in (2, 10)]
+        counts = [self.count_queries(reader.delete) for reader in readers]
+        self.assertEqual(counts[0], counts[1])
+        self.assertFalse(Recipe.objects.filter(favorites_count__gt=0).exists())
+        self.assertFalse(Recipe.objects.filter(similarity_outdated=False).exists())
+        self.assertFalse(User.objects.filter(subscribers_count__gt=0).exists())
+        self.assertFalse(User.objects.filter(subscriptions_count__gt=0).exists())
+
+    def test_favorites_queryset_delete(self):
+        _, recipe = self.create_marked_recipe(3)
+        Favorite.objects.filter(recipe=recipe).delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+
+
+def temporary_media(test):
+    """Временные каталоги медиа и данных на время теста."""
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    media = Path(directory.name)
+    settings = override_settings(DATA_DIR=media / "data", MEDIA_ROOT=media)
+    settings.enable()
+    test.addCleanup(settings.disable)
+    return media
+
+
+class ImportImagesTest(TestCase):
+    """Записи после пакетной загрузки не делят файлы картинок."""
+
+    def setUp(self):
+        self.media = temporary_media(self)
+        self.data = self.media / "data"
+        (self.data / "avatars").mkdir(parents=True)
+        Image.new("RGB", (300, 200), "red").save(self.data / "avatars" / "a.jpg")
+
+    def test_delete_keeps_other_copy(self):
+        users = [create_user("first"), create_user("second")]
+        call_command("set_avatars", "--workers=1", stdout=io.StringIO())
+        for user in users:
+            user.refresh_from_db()
+        self.assertNotEqual(users[0].avatar.name, users[1].avatar.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            users[0].delete()
+        self.assertFalse((self.media / users[0].avatar.name).exists())
+        self.assertTrue((self.media / users[1].avatar.name).exists())
+        for formats in users[1].avatar_sizes.values():
+            for path in formats.values():
+                self.assertTrue((self.media / path).exists())
+
+
+class SharedImageTest(TestCase):
+    """Превью записи не перезаписывают оригинал, общий с другими записями."""
+
+    def setUp(self):
+        self.media = temporary_media(self)
+        (self.media / "recipe_images").mkdir()
+        self.original = self.media / "recipe_images" / "shared.jpg"
+        Image.new("RGB", (IMAGE_MAX_SIDE * 2, 100), "red").save(self.original)
+        self.recipes = create_recipes([create_user("author")], count=2)
+        Recipe.objects.update(image="recipe_images/shared.jpg")
+
+    def test_oversized_original(self):
+        content = self.original.read_bytes()
+        update_derivatives(
+            Recipe, self.recipes[0].pk, "image", "image_sizes", RECIPE_IMAGE_SIZES
+        )
+        self.assertEqual(self.original.read_bytes(), content)
+        recipe = Recipe.objects.get(pk=self.recipes[0].pk)
+        self.assertNotEqual(recipe.image.name, "recipe_images/shared.jpg")
+        with Image.open(recipe.image.path) as image:
+            self.assertEqual(max(image.size), IMAGE_MAX_SIDE)
+        self.assertEqual(recipe.image_sizes.keys(), RECIPE_IMAGE_SIZES.keys())
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipes[1].pk).image.name,
+            "recipe_images/shared.jpg",
+        )
+
+
+class FeedTest(TestCase):
+    """Лента подписок: раскладка, подписка и отписка, порядок страниц."""
+
+    def setUp(self):
+        self.reader = create_user("reader")
+        self.pushed = create_user("pushed")
+        # Автор с чтением по запросу: его рецепты не раскладываются.
+        self.pulled = create_user("pulled")
+        User.objects.filter(pk=self.pulled.pk).update(feed_pull=True)
+
+    def publish(self, author, count=1):
+        return [recipe.pk for recipe in create_recipes([author], count)]
+
+    def feed_ids(self):
+        return set(
+            FeedEntry.objects.filter(user=self.reader).values_list(
+                "recipe_id", flat=True
+            )
+        )
+
+    def test_fan_out(self):
+        Subscribe.objects.create(user=self.reader, subscribed=self.pushed)
+        ids = self.publish(self.pushed, 2)
+        self.publish(create_user("other"))
+        self.assertEqual(self.feed_ids(), set(ids))
+
+    def test_subscribe_and_unsubscribe(self):
+        ids = self.publish(self.pushed, 2)
+        subscription = Subscribe.objects.create(
+            user=self.reader, subscribed=self.pushed
+        )
+        self.assertEqual(self.feed_ids(), set(ids))
+        subscription.delete()
+        self.assertEqual(self.feed_ids(), set())
+        Subscribe.objects.create(user=self.reader, subscribed=self.pushed)
+        Subscribe.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.feed_ids(), set())
+
+    def test_timeline_pages(self):
+        for author in (self.pushed, self.pulled):
+            Subscribe.objects.create(user=self.reader, subscribed=author)
+        ids = []
+        for author, count in ((self.pushed, 2), (self.pulled, 2), (self.pushed, 1)):
+            ids += self.publish(author, count)
+        ids += self.publish(self.pulled)
+        # Запись, разложенная до перехода автора на чтение по запросу.
+        recipe = Recipe.objects.get(pk=ids[-1])
+        add_entries([self.reader.pk], [(recipe.pk, recipe.author_id, recipe.pub_date)])
+        pages, after = [], None
+        while page := timeline(self.reader, 2, after):
+            pages.append([pk for _, pk in page])
+            after = page[-1]
+        newest = ids[::-1]
+        self.assertEqual(pages, [newest[:2], newest[2:4], newest[4:]])
+
+    def test_rebuild_feeds(self):
+        for author in (self.pushed, self.pulled):
+            Subscribe.objects.create(user=self.reader, subscribed=author)
+        ids = self.publish(self.pushed, 2) + self.publish(self.pulled)
+        FeedEntry.objects.filter(recipe_id=ids[0]).delete()
+        call_command("rebuild_feeds", stdout=io.StringIO())
+        # У автора меньше FEED_PULL_SUBSCRIBERS подписчиков: его рецепты
+        # снова раскладываются.
+        self.pulled.refresh_from_db()
+        self.assertFalse(self.pulled.feed_pull)
+        self.assertEqual(self.feed_ids(), set(ids))
+
+
+class ShortCodeTest(SimpleTestCase):
+    """Коды коротких ссылок: base62, ведущий «0», старые десятичные."""
+
+    def test_round_trip(self):
+        for recipe_id in (1, 9, 10, 61, 62, 3843, 3844, 10**6, 10**15):
+            with self.subTest(recipe_id=recipe_id):
+                self.assertEqual(decode_code(short_code(recipe_id)), recipe_id)
+
+    def test_digit_codes(self):
+        # base62 из одних цифр отличается от старой ссылки ведущим нулем.
+        self.assertEqual(short_code(1), "01")
+        self.assertEqual(short_code(62), "010")
+        self.assertEqual(short_code(61), "z")
+        self.assertEqual(decode_code("010"), 62)
+
+    def test_legacy_decimal(self):
+        self.assertEqual(decode_code("10"), 10)
+        self.assertEqual(decode_code("123456"), 123456)
+
+    def test_invalid(self):
+        for code in ("", "a-b", "й", "1" * 11):
+            with self.subTest(code=code):
+                self.assertIsNone(decode_code(code))
+
+
+class ShortLinkTest(TestCase):
+    """Редирект по короткой ссылке и 404 для неверных кодов."""
+
+    def setUp(self):
+        # Удаление рецепта уносит и его картинку.
+        temporary_media(self)
+        local_cache.entries.clear()
+        self.recipe = create_recipes([create_user("author")], count=1)[0]
+
+    def assert_redirect(self, code):
+        response = self.client.get(reverse("recipes:short_link", args=[code]))
+        self.assertRedirects(
+            response, f"/recipes/{self.recipe.pk}/", fetch_redirect_response=False
+        )
+
+    def assert_not_found(self, code):
+        response = self.client.get(reverse("recipes:short_link", args=[code]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_link(self):
+        response = self.client.get(reverse("recipes-get-link", args=[self.recipe.pk]))
+        code = response.data["short-link"].rstrip("/").rsplit("/", 1)[1]
+        self.assertEqual(code, short_code(self.recipe.pk))
+        self.assert_redirect(code)
+
+    def test_legacy_link(self):
+        self.assert_redirect(str(self.recipe.pk))
+
+    def test_invalid_codes(self):
+        for code in ("a-b", "1" * 11, short_code(self.recipe.pk + 1)):
+            with self.subTest(code=code):
+                self.assert_not_found(code)
+
+    def test_deleted_recipe(self):
+        code = short_code(self.recipe.pk)
+        self.assert_redirect(code)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assert_not_found(code)
+
+
+class LoadDataTest(TestCase):
+    """Загрузка справочников: счетчики, --dry-run и границы пачек."""
+
+    TAGS = [("Завтрак", "zavtrak"), ("Обед", "obed"), ("Ужин", "uzhin")]
+
+    def setUp(self):
+        self.data = temporary_media(self) / "data"
+        self.data.mkdir()
+
+    def write_tags(self, rows):
+        with open(self.data / "tags.csv", "w", encoding="utf-8") as file:
+            file.writelines(f"{name},{slug}\n" for name, slug in rows)
+
+    def load(self, command, *args):
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command(command, *args, stdout=out)
+        self.writes = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+        ]
+        return out.getvalue()
+
+    def assert_counts(self, output, inserted, updated, skipped):
+        self.assertIn(
+            f"добавлено {inserted}, обновлено {updated}, без изменений {skipped}.",
+            output,
+        )
+
+    def test_counts(self):
+        self.write_tags(self.TAGS)
+        self.assert_counts(self.load("load_tags"), 3, 0, 0)
+        self.assertEqual(
+            sorted(Tag.objects.values_list("name", "slug")), sorted(self.TAGS)
+        )
+        # Повторный запуск ничего не пишет.
+        self.assert_counts(self.load("load_tags"), 0, 0, 3)
+        self.assertEqual(self.writes, [])
+        self.write_tags(
+            [("Завтрак", "zavtrak"), ("Поздний обед", "obed"), ("Перекус", "perekus")]
+        )
+        self.assert_counts(self.load("load_tags"), 1, 1, 1)
+        self.assertEqual(Tag.objects.get(slug="obed").name, "Поздний обед")
+        # Записи, которых нет в файле, не удаляются.
+        self.assertEqual(Tag.objects.count(), 4)
+
+    def test_json(self):
+        Ingredient.objects.create(name="соль", measurement_unit="кг")
+        Ingredient.objects.create(name="сахар", measurement_unit="г")
+        items = [
+            {"name": "соль", "measurement_unit": "г"},
+            {"name": "сахар", "measurement_unit": "г"},
+            {"name": "мука", "measurement_unit": "г"},
+        ]
+        (self.data / "ingredients.json").write_text(
+            json.dumps(items, ensure_ascii=False), encoding="utf-8"
+        )
+        self.assert_counts(self.load("load_ingredients"), 1, 1, 1)
+        self.assertEqual(
+            dict(Ingredient.objects.values_list("name", "measurement_unit")),
+            {"соль": "г", "сахар": "г", "мука": "г"},
+        )
+
+    def test_dry_run(self):
+        Tag.objects.create(name="Старый завтрак", slug="zavtrak")
+        self.write_tags(self.TAGS)
+        output = self.load("load_tags", "--dry-run")
+        self.assertIn("(без записи)", output)
+        self.assert_counts(output, 2, 1, 0)
+        self.assertEqual(self.writes, [])
+        self.assertEqual(
+            list(Tag.objects.values_list("name", "slug")),
+            [("Старый завтрак", "zavtrak")],
+        )
+
+    def test_batch_size(self):
+        self.write_tags(self.TAGS)
+        # Пачка на каждую запись, меньше файла и ровно в размер файла.
+        for batch_size, batches in ((1, 3), (2, 2), (3, 1), (4, 1)):
+            with self.subTest(batch_size=batch_size):
+                Tag.objects.all().delete()
+                output = self.load("load_tags", f"--batch-size={batch_size}")
+                self.assert_counts(output, 3, 0, 0)
+                self.assertEqual(len(self.writes), batches)
+                self.assertEqual(Tag.objects.count(), 3)
+
+    def test_duplicate_keys(self):
+        # В одной пачке действует последняя запись, в соседних - обновление.
+        rows = [("Обед", "obed"), ("Поздний обед", "obed"), ("Ужин", "uzhin")]
+        self.write_tags(rows)
+        self.assert_counts(self.load("load_tags", "--batch-size=3"), 2, 0, 1)
+        self.assertEqual(Tag.objects.get(slug="obed").name, "Поздний обед")
+        Tag.objects.all().delete()
+        self.assert_counts(self.load("load_tags", "--batch-size=1"), 2, 1, 0)
+        self.assertEqual(Tag.objects.get(slug="obed").name, "Поздний обед")
+
+    def test_json_chunks(self):
+        items = [{"name": "мука, в/с", "measurement_unit": "г"}] * 3
+        text = json.dumps(items, ensure_ascii=False, indent=2)
+        # Куски меньше одного элемента склеиваются.
+        self.assertEqual(list(iter_json_array(io.StringIO(text), chunk_size=5)), items)
+        for broken in ("{}", text[:-3]):
+            with self.subTest(text=broken), self.assertRaises(CommandError):
+                list(iter_json_array(io.StringIO(broken), chunk_size=5))
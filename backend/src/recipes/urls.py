@@ -1,9 +1,14 @@
+from django.conf import settings
 from django.urls import path
 
-from recipes.views import short_link_redirect
+from recipes.views import ashort_link_redirect, short_link_redirect
 
 app_name = "recipes"
 
 urlpatterns = [
-    path("s/<int:recipe_id>", short_link_redirect, name="short_link"),
+    path(
+        "s/<str:code>",
+        ashort_link_redirect if settings.ASYNC_VIEWS else short_link_redirect,
+        name="short_link",
+    ),
 ]
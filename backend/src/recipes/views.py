@@ -1,9 +1,20 @@
-from django.shortcuts import get_object_or_404, redirect
+from django.http import Http404
+from django.shortcuts import redirect
 
-from recipes.models import Recipe
+from recipes.links import aresolve_code, resolve_code
 
 
-def short_link_redirect(request, recipe_id):
-    """Редирект коротких ссылок на рецепт."""
-    get_object_or_404(Recipe, id=recipe_id)
+def short_link_redirect(request, code):
+    """Редирект коротких ссылок на рецепт (без запросов к БД при повторах)."""
+    recipe_id = resolve_code(code)
+    if recipe_id is None:
+        raise Http404("Рецепт не найден.")
+    return redirect(f"/recipes/{recipe_id}/")
+
+
+async def ashort_link_redirect(request, code):
+    """Асинхронный вариант short_link_redirect (при ASYNC_VIEWS)."""
+    recipe_id = await aresolve_code(code)
+    if recipe_id is None:
+        raise Http404("Рецепт не найден.")
     return redirect(f"/recipes/{recipe_id}/")